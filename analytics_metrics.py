@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+LSRC offline metrics
+Computed over the local snapshot written by analytics_snapshot.py, never
+the live tables. Ids are mapped to dense ints with Arrow compute
+(dictionary_encode / index_in); everything after that is NumPy array
+work, with no per-user or per-capsule Python loops.
+
+    activity      DAU and rolling 7-day WAU. Active = created a capsule
+                  or uploaded audio that day (UTC)
+    final_scores  share of saved capsules with a final score. Not a
+                  session completion rate: since ingest_session a capsule
+                  row is written only when a session is saved, so
+                  abandoned sessions are not counted at all
+    cycles        Listen → Sound fragments per capsule
+    lineage       depth of each score in its continuation chain
+                  (parent_score_id), root = 0, as in lineage.py
+
+Run with: python3 analytics_metrics.py [--dir snapshot] [--days 28]
+"""
+
+import argparse
+import json
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from analytics_snapshot import DEFAULT_DIR, load_table
+
+WAU_WINDOW = 7
+MAX_LINEAGE_STEPS = 64  # pointer jumping: covers chains of 2**64
+
+
+def day_numbers(column: pa.ChunkedArray) -> np.ndarray:
+    """UTC day number (days since 1970-01-01) of each timestamp."""
+    values = column.to_numpy()
+    return values.astype('datetime64[D]').astype(np.int64)
+
+
+def codes_in(values: pa.ChunkedArray, value_set: pa.ChunkedArray) -> np.ndarray:
+    """Position of each value in value_set; -1 for null or not found."""
+    positions = pc.index_in(values, value_set=value_set.combine_chunks())
+    return pc.fill_null(positions, -1).to_numpy().astype(np.int64)
+
+
+def day_label(day: int) -> str:
+    return (date(1970, 1, 1) + timedelta(days=int(day))).isoformat()
+
+
+def activity(capsules: pa.Table, audio_files: pa.Table, days: Optional[int] = None) -> dict:
+    users = pa.chunked_array(
+        capsules['user_id'].chunks + audio_files['user_id'].chunks, type=pa.string()
+    )
+    active_days = np.concatenate([day_numbers(capsules['created_at']), day_numbers(audio_files['created_at'])])
+    encoded = users.combine_chunks().dictionary_encode()
+    user = pc.fill_null(encoded.indices, -1).to_numpy().astype(np.int64)
+    known = user >= 0
+    user, active_days = user[known], active_days[known]
+    if not user.size:
+        return {'days': [], 'dau': [], 'wau': [], 'users': 0, 'dau_over_wau': 0.0}
+
+    first, last = int(active_days.min()), int(active_days.max())
+    span = last - first + 1
+    # Distinct (user, day) pairs, sorted by user then day
+    pairs = np.unique(user * span + (active_days - first))
+    pair_user, pair_day = pairs // span, pairs % span
+
+    dau = np.bincount(pair_day, minlength=span)
+
+    # WAU: each active day covers [day, day + 6]. Merge a user's overlapping
+    # windows (a window starts after the previous one of the same user
+    # ends), then sum the windows with a difference array
+    start = pair_day.copy()
+    same_user = pair_user[1:] == pair_user[:-1]
+    start[1:][same_user] = np.maximum(pair_day[1:][same_user], pair_day[:-1][same_user] + WAU_WINDOW)
+    end = pair_day + WAU_WINDOW
+    diff = np.bincount(start, minlength=span + WAU_WINDOW + 1) - np.bincount(end, minlength=span + WAU_WINDOW + 1)
+    wau = np.cumsum(diff)[:span]
+
+    if days is not None:
+        dau, wau = dau[-days:], wau[-days:]
+        first = last - len(dau) + 1
+    return {
+        'days': [day_label(first + i) for i in range(len(dau))],
+        'dau': dau.tolist(),
+        'wau': wau.tolist(),
+        'users': int(len(encoded.dictionary)),
+        'dau_over_wau': round(float(dau[-1] / wau[-1]), 3) if wau[-1] else 0.0,
+    }
+
+
+def final_scores(capsules: pa.Table) -> dict:
+    total = capsules.num_rows
+    with_final = total - capsules['final_score_id'].null_count
+    public = pc.sum(pc.cast(capsules['is_public'], pa.int64())).as_py() or 0
+    return {
+        'saved_capsules': total,
+        'with_final_score': with_final,
+        'final_score_rate': round(with_final / total, 3) if total else 0.0,
+        'public_rate': round(public / total, 3) if total else 0.0,
+    }
+
+
+def cycles(capsules: pa.Table, fragments: pa.Table) -> dict:
+    capsule = codes_in(fragments['capsule_id'], capsules['id'])
+    per_capsule = np.bincount(capsule[capsule >= 0], minlength=capsules.num_rows)
+    if not per_capsule.size:
+        return {'capsules': 0, 'mean': 0.0, 'median': 0.0, 'p90': 0.0, 'histogram': {}}
+    histogram = np.bincount(per_capsule)
+    return {
+        'capsules': int(per_capsule.size),
+        'mean': round(float(per_capsule.mean()), 3),
+        'median': float(np.median(per_capsule)),
+        'p90': float(np.percentile(per_capsule, 90)),
+        'histogram': {str(n): int(c) for n, c in enumerate(histogram) if c},
+        # Fragments whose capsule is not in the snapshot (yet)
+        'orphan_fragments': int((capsule < 0).sum()),
+    }
+
+
+def lineage_depths(scores: pa.Table) -> np.ndarray:
+    """Depth per score row. Parents outside the snapshot end the chain; -1
+    marks scores on a parent cycle."""
+    parent = codes_in(scores['parent_score_id'], scores['id'])
+    depth = (parent >= 0).astype(np.int64)
+    jump = parent.copy()
+    # Pointer jumping: jump is the ancestor depth hops up, so each pass
+    # doubles the hops covered; O(log depth) array passes
+    for _ in range(MAX_LINEAGE_STEPS):
+        linked = np.flatnonzero(jump >= 0)
+        if not linked.size:
+            break
+        ancestors = jump[linked]
+        depth[linked] += depth[ancestors]
+        jump[linked] = jump[ancestors]
+    else:
+        depth[jump >= 0] = -1
+    return depth
+
+
+def lineage(scores: pa.Table) -> dict:
+    depth = lineage_depths(scores)
+    valid = depth[depth >= 0]
+    continued = valid[valid > 0]
+    return {
+        'scores': int(depth.size),
+        'continuations': int(continued.size),
+        'max_depth': int(valid.max()) if valid.size else 0,
+        'mean_depth_of_continuations': round(float(continued.mean()), 3) if continued.size else 0.0,
+        'histogram': {str(d): int(c) for d, c in enumerate(np.bincount(valid)) if c} if valid.size else {},
+        'cyclic': int((depth < 0).sum()),
+    }
+
+
+def compute(root: str, days: Optional[int] = None) -> dict:
+    scores = load_table(root, 'scores')
+    capsules = load_table(root, 'capsules')
+    fragments = load_table(root, 'fragments')
+    audio_files = load_table(root, 'audio_files')
+    return {
+        'activity': activity(capsules, audio_files, days),
+        'final_scores': final_scores(capsules),
+        'cycles': cycles(capsules, fragments),
+        'lineage': lineage(scores),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='LSRC metrics over the analytics snapshot')
+    parser.add_argument('--dir', default=os.getenv('ANALYTICS_SNAPSHOT_DIR', DEFAULT_DIR))
+    parser.add_argument('--days', type=int, default=28, help='DAU/WAU series length')
+    args = parser.parse_args()
+    print(json.dumps(compute(args.dir, args.days), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
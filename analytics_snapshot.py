@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+LSRC analytics snapshot
+Copies scores, capsules, fragments and audio_files into a local columnar
+snapshot, so metrics (analytics_metrics.py) never query the live tables.
+Files are Arrow IPC (memory-mapped when read) or Parquet.
+
+Incremental: each table is read in (created_at, id) order after its
+watermark, and each run adds part files only for rows past it. Rows
+younger than SETTLE_SECONDS wait for the next run, so a transaction that
+commits late with an earlier created_at is not skipped. A part and its
+watermark are saved together; after a crash the next run rewrites the same
+part. Rows are exported once: later updates (usage_count, is_public) are
+not picked up. The exception is REFRESH_NULL_COLUMNS: capsules saved before
+ingest_session got final_score_id from a later UPDATE, so capsules of the
+last REFRESH_SECONDS still without one are re-read each run, and the ones
+that have it now go to an update part, which replaces them on load.
+
+    snapshot/
+        _state.json                 watermark and part count per table
+        scores/part-00000.arrow
+        capsules/part-00000.arrow
+        capsules/update-00000.arrow
+        ...
+
+Private capsules are hidden from the anon key by RLS, so this uses
+SUPABASE_SERVICE_ROLE_KEY when it is set.
+Run with: python3 analytics_snapshot.py [--dir snapshot] [--format parquet]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = 'snapshot'
+SETTLE_SECONDS = 300
+PAGE_SIZE = 1000
+ROWS_PER_PART = 200_000
+STATE_FILE = '_state.json'
+FORMATS = {'arrow': '.arrow', 'parquet': '.parquet'}
+REFRESH_SECONDS = 86400
+REFRESH_BATCH = 200
+REFRESH_NULL_COLUMNS = {'capsules': 'final_score_id'}
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+# No free text (score text, reflections): metrics don't need it
+SCHEMAS = {
+    'scores': pa.schema([
+        ('id', pa.string()),
+        ('created_at', TIMESTAMP),
+        ('author_user_id', pa.string()),
+        ('is_public', pa.bool_()),
+        ('source', pa.string()),
+        ('language', pa.string()),
+        ('parent_score_id', pa.string()),
+        ('usage_count', pa.int32()),
+    ]),
+    'capsules': pa.schema([
+        ('id', pa.string()),
+        ('created_at', TIMESTAMP),
+        ('user_id', pa.string()),
+        ('initial_score_id', pa.string()),
+        ('final_score_id', pa.string()),
+        ('is_public', pa.bool_()),
+        ('transport', pa.string()),
+    ]),
+    'fragments': pa.schema([
+        ('id', pa.string()),
+        ('created_at', TIMESTAMP),
+        ('capsule_id', pa.string()),
+        ('cycle_number', pa.int32()),
+        ('listen_source', pa.string()),
+        ('listen_audio_id', pa.string()),
+        ('sound_audio_id', pa.string()),
+    ]),
+    'audio_files': pa.schema([
+        ('id', pa.string()),
+        ('created_at', TIMESTAMP),
+        ('user_id', pa.string()),
+        ('file_size', pa.int64()),
+        ('duration_seconds', pa.float64()),
+        ('mime_type', pa.string()),
+    ]),
+}
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def to_batch(table: str, rows: list[dict]) -> pa.RecordBatch:
+    schema = SCHEMAS[table]
+    columns = []
+    for f in schema:
+        values = [row.get(f.name) for row in rows]
+        if f.type == TIMESTAMP:
+            values = [parse_timestamp(v) for v in values]
+        columns.append(pa.array(values, type=f.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def part_paths(root: Path, table: str, prefix: str = 'part') -> list[Path]:
+    return sorted(p for ext in FORMATS.values() for p in (root / table).glob(f'{prefix}-*{ext}'))
+
+
+def read_parts(paths: list[Path]) -> list[pa.Table]:
+    parts = []
+    for path in paths:
+        if path.suffix == '.parquet':
+            parts.append(pq.read_table(path, memory_map=True))
+        else:
+            parts.append(pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all())
+    return parts
+
+
+def load_table(root: str | Path, table: str) -> pa.Table:
+    """All parts of a table; Arrow parts are memory-mapped, not copied.
+    Rows in update parts replace the exported rows with the same id."""
+    parts = read_parts(part_paths(Path(root), table))
+    if not parts:
+        return SCHEMAS[table].empty_table()
+    rows = pa.concat_tables(parts)
+    updates = read_parts(part_paths(Path(root), table, 'update'))
+    if not updates:
+        return rows
+    # A row is re-read only while its column is null in the snapshot, so
+    # each id is in at most one update part
+    updated = pa.concat_tables(updates)
+    kept = rows.filter(pc.invert(pc.is_in(rows['id'], value_set=updated['id'].combine_chunks())))
+    return pa.concat_tables([kept, updated])
+
+
+class Snapshot:
+    def __init__(self, root: str | Path, fmt: str = 'arrow'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        self.root = Path(root)
+        self.format = fmt
+        self.state: dict[str, dict] = {}
+        state_path = self.root / STATE_FILE
+        if state_path.exists():
+            self.state = json.loads(state_path.read_text())
+
+    def watermark(self, table: str) -> Optional[tuple[str, str]]:
+        entry = self.state.get(table)
+        return (entry['created_at'], entry['id']) if entry else None
+
+    def _write_part(self, table: str, part: int, batches: list[pa.RecordBatch], prefix: str = 'part') -> Path:
+        directory = self.root / table
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{prefix}-{part:05d}{FORMATS[self.format]}'
+        tmp = path.with_name(path.name + '.tmp')
+        if self.format == 'parquet':
+            pq.write_table(pa.Table.from_batches(batches, schema=SCHEMAS[table]), tmp)
+        else:
+            with pa.OSFile(str(tmp), 'wb') as sink, pa.ipc.new_file(sink, SCHEMAS[table]) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+        os.replace(tmp, path)
+        return path
+
+    def _save_state(self) -> None:
+        path = self.root / STATE_FILE
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(self.state, indent=2))
+        os.replace(tmp, path)
+
+    def commit(self, table: str, batches: list[pa.RecordBatch], last: dict) -> None:
+        entry = self.state.get(table, {'parts': 0, 'rows': 0})
+        path = self._write_part(table, entry['parts'], batches)
+        self.state[table] = {
+            'created_at': last['created_at'],
+            'id': last['id'],
+            'parts': entry['parts'] + 1,
+            'rows': entry['rows'] + sum(b.num_rows for b in batches),
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+        }
+        # Part first, then state: a crash in between rewrites this part next run
+        self._save_state()
+        logger.info(f"{table}: wrote {path.name}, {self.state[table]['rows']} rows total")
+
+    def commit_update(self, table: str, batches: list[pa.RecordBatch]) -> None:
+        entry = self.state[table]
+        updates = entry.get('updates', 0)
+        path = self._write_part(table, updates, batches, prefix='update')
+        entry['updates'] = updates + 1
+        entry['updated_at'] = datetime.now(timezone.utc).isoformat()
+        self._save_state()
+        logger.info(f"{table}: wrote {path.name}, {sum(b.num_rows for b in batches)} rows updated")
+
+
+# repo is a repository.SupabaseRepository; it is imported in main() only,
+# so analytics_metrics.py can read snapshots without the Supabase client
+
+async def export_table(
+    repo,
+    snapshot: Snapshot,
+    table: str,
+    before: str,
+    page_size: int = PAGE_SIZE,
+    rows_per_part: int = ROWS_PER_PART,
+) -> int:
+    columns = ', '.join(SCHEMAS[table].names)
+    after = snapshot.watermark(table)
+    batches: list[pa.RecordBatch] = []
+    pending = exported = 0
+    last: Optional[dict] = None
+    while True:
+        rows = await repo.export_page(table, columns, before, after, page_size)
+        if rows:
+            batches.append(to_batch(table, rows))
+            pending += len(rows)
+            last = rows[-1]
+            after = (last['created_at'], last['id'])
+        if batches and (pending >= rows_per_part or len(rows) < page_size):
+            snapshot.commit(table, batches, last)
+            exported += pending
+            batches, pending = [], 0
+        if len(rows) < page_size:
+            return exported
+
+
+async def refresh_table(repo, snapshot: Snapshot, table: str, since: datetime) -> int:
+    """Re-read recent rows whose REFRESH_NULL_COLUMNS column is still null."""
+    column = REFRESH_NULL_COLUMNS.get(table)
+    if column is None or table not in snapshot.state:
+        return 0
+    current = load_table(snapshot.root, table)
+    stale = current.filter(pc.and_(
+        pc.is_null(current[column]),
+        pc.greater_equal(current['created_at'], pa.scalar(since, type=TIMESTAMP)),
+    ))
+    ids = stale['id'].to_pylist()
+    columns = ', '.join(SCHEMAS[table].names)
+    rows = []
+    for i in range(0, len(ids), REFRESH_BATCH):
+        rows += await repo.export_rows_set(table, columns, ids[i:i + REFRESH_BATCH], column)
+    if rows:
+        snapshot.commit_update(table, [to_batch(table, rows)])
+    return len(rows)
+
+
+async def run(snapshot: Snapshot, repo, tables: list[str], settle: float) -> dict[str, int]:
+    now = datetime.now(timezone.utc)
+    before = (now - timedelta(seconds=settle)).isoformat()
+    exported = {}
+    try:
+        for table in tables:
+            exported[table] = await export_table(repo, snapshot, table, before)
+            await refresh_table(repo, snapshot, table, now - timedelta(seconds=REFRESH_SECONDS))
+    finally:
+        await repo.aclose()
+    return exported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Incremental columnar snapshot of the LSRC tables')
+    parser.add_argument('--dir', default=os.getenv('ANALYTICS_SNAPSHOT_DIR', DEFAULT_DIR))
+    parser.add_argument('--format', choices=list(FORMATS), default='arrow')
+    parser.add_argument('--table', action='append', choices=list(SCHEMAS), help='default: all tables')
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help='skip rows younger than this many seconds')
+    args = parser.parse_args()
+
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_ANON_KEY')
+    if not url or not key:
+        logger.error("Supabase credentials not set!")
+        return
+    if not os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
+        logger.warning("SUPABASE_SERVICE_ROLE_KEY not set: private rows are hidden by RLS")
+
+    from repository import create_repository
+
+    snapshot = Snapshot(args.dir, args.format)
+    exported = asyncio.run(run(snapshot, create_repository(url, key), args.table or list(SCHEMAS), args.settle))
+    logger.info(f"Snapshot {args.dir}: " + ', '.join(f"{t} +{n}" for t, n in exported.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+LSRC guide answer cache
+Sits in front of the OpenAI Assistant: repeated questions ("who is Pauline
+Oliveros", "what is deep listening?") are answered from the cache instead
+of a full run. Keys are normalized question text; near-duplicates can
+match through trigram similarity. Entries expire after a TTL and the
+cache is size-bounded (LRU).
+
+Backends: in-process dict, or SQLite (shareable between bot processes on
+one host). api/guide.js uses the same key normalization.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Protocol
+
+DEFAULT_TTL = 7 * 86400
+DEFAULT_MAX_ENTRIES = 2000
+MIN_FUZZY_KEY_LENGTH = 12
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_question(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = _NON_WORD.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[tuple[str, float]]: ...
+    def set(self, key: str, answer: str, stored_at: float) -> list[str]: ...
+    def delete(self, key: str) -> None: ...
+    def keys(self) -> list[str]: ...
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: str, answer: str, stored_at: float) -> list[str]:
+        self._data[key] = (answer, stored_at)
+        self._data.move_to_end(key)
+        evicted = []
+        while len(self._data) > self.max_entries:
+            old_key, _ = self._data.popitem(last=False)
+            evicted.append(old_key)
+        return evicted
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def keys(self) -> list[str]:
+        return list(self._data)
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS answers ('
+            'key TEXT PRIMARY KEY, answer TEXT NOT NULL, '
+            'stored_at REAL NOT NULL, used_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_answers_used ON answers(used_at)')
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT answer, stored_at FROM answers WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                self._db.execute('UPDATE answers SET used_at = ? WHERE key = ?', (time.time(), key))
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, answer: str, stored_at: float) -> list[str]:
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO answers (key, answer, stored_at, used_at) VALUES (?, ?, ?, ?)',
+                (key, answer, stored_at, stored_at),
+            )
+            excess = self._db.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - self.max_entries
+            if excess <= 0:
+                return []
+            evicted = [r[0] for r in self._db.execute(
+                'SELECT key FROM answers ORDER BY used_at LIMIT ?', (excess,)
+            )]
+            self._db.executemany('DELETE FROM answers WHERE key = ?', [(k,) for k in evicted])
+        return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM answers WHERE key = ?', (key,))
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute('SELECT key FROM answers')]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    fuzzy_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.fuzzy_hits + self.misses
+        return (self.hits + self.fuzzy_hits) / total if total else 0.0
+
+    def counts(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: float = DEFAULT_TTL,
+        similarity_threshold: Optional[float] = None,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.stats = CacheStats()
+
+        # Trigram postings over cached keys, for fuzzy lookups
+        self._grams: dict[str, set[str]] = {}
+        self._postings: dict[str, set[str]] = {}
+        if similarity_threshold:
+            for key in backend.keys():
+                self._index(key)
+
+    def _index(self, key: str) -> None:
+        grams = trigrams(key)
+        self._grams[key] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def _unindex(self, key: str) -> None:
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        answer, stored_at = entry
+        if time.time() - stored_at > self.ttl:
+            self.backend.delete(key)
+            self._unindex(key)
+            self.stats.expired += 1
+            return None
+        return answer
+
+    def _nearest(self, key: str) -> Optional[str]:
+        grams = trigrams(key)
+        candidates: dict[str, int] = {}
+        for gram in grams:
+            for other in self._postings.get(gram, ()):
+                candidates[other] = candidates.get(other, 0) + 1
+
+        best, best_score = None, 0.0
+        for other, shared in candidates.items():
+            score = shared / (len(grams) + len(self._grams[other]) - shared)
+            if score > best_score:
+                best, best_score = other, score
+        if best is not None and best_score >= self.similarity_threshold:
+            return best
+        return None
+
+    def get(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        if not key:
+            return None
+
+        answer = self._lookup(key)
+        if answer is not None:
+            self.stats.hits += 1
+            return answer
+
+        if self.similarity_threshold and len(key) >= MIN_FUZZY_KEY_LENGTH:
+            near = self._nearest(key)
+            if near is not None:
+                answer = self._lookup(near)
+                if answer is not None:
+                    self.stats.fuzzy_hits += 1
+                    return answer
+
+        self.stats.misses += 1
+        return None
+
+    def put(self, question: str, answer: str) -> None:
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        evicted = self.backend.set(key, answer, time.time())
+        self.stats.evictions += len(evicted)
+        if self.similarity_threshold:
+            for old_key in evicted:
+                self._unindex(old_key)
+            self._index(key)
+
+
+def create_answer_cache(
+    backend: str = 'memory',
+    path: str = 'answer_cache.sqlite3',
+    ttl: float = DEFAULT_TTL,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    similarity_threshold: Optional[float] = None,
+) -> AnswerCache:
+    if backend == 'sqlite':
+        store: CacheBackend = SQLiteBackend(path, max_entries)
+    else:
+        store = MemoryBackend(max_entries)
+    return AnswerCache(store, ttl=ttl, similarity_threshold=similarity_threshold)
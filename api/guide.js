@@ -2,6 +2,50 @@ const OpenAI = require('openai');
 
 let openai = null;
 
+// Answer cache shared in spirit with answer_cache.py: same key normalization,
+// LRU + TTL, kept per warm serverless instance
+const CACHE_TTL_MS = Number(process.env.ANSWER_CACHE_TTL || 7 * 86400) * 1000;
+const CACHE_MAX_ENTRIES = Number(process.env.ANSWER_CACHE_SIZE || 2000);
+const answerCache = new Map();
+const cacheStats = { hits: 0, misses: 0, expired: 0, evictions: 0 };
+
+// Per warm instance, since its start: "hits=3, misses=10, expired=0, evictions=0"
+function cacheStatsHeader() {
+    return Object.entries(cacheStats).map(([name, n]) => `${name}=${n}`).join(', ');
+}
+
+function normalizeQuestion(text) {
+    return String(text)
+        .normalize('NFKC')
+        .toLowerCase()
+        .replace(/[^\p{L}\p{N}_\s]+/gu, ' ')
+        .replace(/\s+/g, ' ')
+        .trim();
+}
+
+function cacheGet(key) {
+    const entry = answerCache.get(key);
+    if (!entry) return null;
+    if (Date.now() - entry.storedAt > CACHE_TTL_MS) {
+        answerCache.delete(key);
+        cacheStats.expired++;
+        return null;
+    }
+    // Re-insert to mark as most recently used
+    answerCache.delete(key);
+    answerCache.set(key, entry);
+    return entry.reply;
+}
+
+function cacheSet(key, reply) {
+    answerCache.delete(key);
+    answerCache.set(key, { reply, storedAt: Date.now() });
+    while (answerCache.size > CACHE_MAX_ENTRIES) {
+        answerCache.delete(answerCache.keys().next().value);
+        cacheStats.evictions++;
+    }
+}
+
 function getClient() {
     if (!openai && process.env.OPENAI_API_KEY) {
         openai = new OpenAI.default
@@ -13,10 +57,15 @@ function getClient() {
 
 module.exports = async function handler(req, res) {
     res.setHeader('Access-Control-Allow-Origin', '*');
-    res.setHeader('Access-Control-Allow-Methods', 'POST, OPTIONS');
+    res.setHeader('Access-Control-Allow-Methods', 'GET, POST, OPTIONS');
     res.setHeader('Access-Control-Allow-Headers', 'Content-Type');
+    res.setHeader('Access-Control-Expose-Headers', 'X-Cache, X-Cache-Stats');
 
     if (req.method === 'OPTIONS') return res.status(200).end();
+    // GET /api/guide: this instance's answer cache counters
+    if (req.method === 'GET') {
+        return res.status(200).json({ cache: { ...cacheStats, entries: answerCache.size } });
+    }
     if (req.method !== 'POST') return res.status(405).json({ error: 'Method not allowed' });
 
     const ASSISTANT_ID = process.env.OPENAI_ASSISTANT_ID;
@@ -35,6 +84,33 @@ module.exports = async function handler(req, res) {
     const { message, thread_id } = req.body || {};
     if (!message) return res.status(400).json({ error: 'Message required' });
 
+    // Cached answers are context-free: a question asked inside an existing
+    // thread always goes to the assistant and is not cached
+    const cacheKey = thread_id ? '' : normalizeQuestion(message);
+    const cached = cacheKey ? cacheGet(cacheKey) : null;
+    if (cached) {
+        cacheStats.hits++;
+        res.setHeader('X-Cache', 'HIT');
+        res.setHeader('X-Cache-Stats', cacheStatsHeader());
+        try {
+            // Start the thread with the cached exchange, so a follow-up
+            // question has it as context
+            const thread = await client.beta.threads.create({
+                messages: [
+                    { role: 'user', content: message },
+                    { role: 'assistant', content: cached },
+                ],
+            });
+            return res.status(200).json({ reply: cached, thread_id: thread.id, cached: true });
+        } catch (error) {
+            console.error('Guide API error:', error);
+            return res.status(500).json({ error: 'Failed to get response', message: error.message });
+        }
+    }
+    if (cacheKey) cacheStats.misses++;
+    res.setHeader('X-Cache', cacheKey ? 'MISS' : 'BYPASS');
+    res.setHeader('X-Cache-Stats', cacheStatsHeader());
+
     try {
         let threadId = thread_id;
         if (!threadId) {
@@ -58,6 +134,7 @@ module.exports = async function handler(req, res) {
         const messages = await client.beta.threads.messages.list(threadId, { order: 'desc', limit: 1 });
         const assistantMsg = messages.data.find(m => m.role === 'assistant');
         const reply = assistantMsg?.content?.[0]?.text?.value || 'No response received.';
+        if (cacheKey && assistantMsg) cacheSet(cacheKey, reply);
 
         return res.status(200).json({ reply, thread_id: threadId });
     } catch (error) {
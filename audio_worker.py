@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+LSRC audio post-processing worker
+Fills duration, loudness (RMS / peak dBFS) and compact waveform peaks for
+new audio_files rows, so clients can draw a waveform without fetching audio.
+
+Runs as its own process (see Procfile), off the bot's handler path:
+rows with processed_at IS NULL are the job queue. Decoding is done by
+ffmpeg, analysis by NumPy in a process pool, and results are written back
+in batches with one RPC call each.
+Run with: python3 audio_worker.py
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from repository import AudioFile, SupabaseRepository, create_repository
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000
+WAVEFORM_BINS = 128
+DECODE_TIMEOUT = 120
+SILENCE_DBFS = -96.0
+
+
+# ============================================================
+# ANALYSIS (runs in worker processes)
+# ============================================================
+
+def decode_pcm(url: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    # Mono, low sample rate: enough for loudness and a waveform sketch
+    proc = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', url, '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-'],
+        capture_output=True, timeout=DECODE_TIMEOUT, check=True,
+    )
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+def to_dbfs(value: float) -> float:
+    if value <= 0:
+        return SILENCE_DBFS
+    return max(SILENCE_DBFS, float(20 * np.log10(value)))
+
+
+def analyze_samples(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, bins: int = WAVEFORM_BINS) -> dict:
+    x = samples.astype(np.float32) / 32768.0
+    n = x.size
+    if n == 0:
+        return {'duration_seconds': 0.0, 'rms_dbfs': SILENCE_DBFS, 'peak_dbfs': SILENCE_DBFS,
+                'waveform_peaks': [0] * bins}
+
+    rms = float(np.sqrt(np.mean(np.square(x, dtype=np.float64))))
+    peak = float(np.max(np.abs(x)))
+
+    # Pad to a whole number of samples per bin, then take |max| per bin
+    per_bin = -(-n // bins)
+    padded = np.zeros(per_bin * bins, dtype=np.float32)
+    padded[:n] = np.abs(x)
+    peaks = padded.reshape(bins, per_bin).max(axis=1)
+    waveform = np.clip(np.rint(peaks * 255), 0, 255).astype(np.int16)
+
+    return {
+        'duration_seconds': round(n / sample_rate, 3),
+        'rms_dbfs': round(to_dbfs(rms), 2),
+        'peak_dbfs': round(to_dbfs(peak), 2),
+        'waveform_peaks': waveform.tolist(),
+    }
+
+
+def analyze_audio(file_path: str, file_url: str) -> dict:
+    try:
+        result = analyze_samples(decode_pcm(file_url))
+        return {'file_path': file_path, 'error': None, **result}
+    except subprocess.CalledProcessError as e:
+        error = (e.stderr or b'').decode(errors='replace').strip()[:500] or f"ffmpeg exit {e.returncode}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:500]
+    return {
+        'file_path': file_path, 'error': error, 'duration_seconds': None,
+        'rms_dbfs': None, 'peak_dbfs': None, 'waveform_peaks': None,
+    }
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+class AudioWorker:
+    def __init__(
+        self,
+        repo: SupabaseRepository,
+        processes: int = 2,
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+        poll_interval: float = 15.0,
+    ):
+        self.repo = repo
+        self.processes = processes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+
+        # spawn: the parent has threads (repository pool), fork is unsafe
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn')
+        )
+        self._queue: asyncio.Queue[AudioFile] = asyncio.Queue(maxsize=processes * 4)
+        self._in_flight: set[str] = set()
+        self._results: list[dict] = []
+        self._flushed_at = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+
+    def submit(self, audio: AudioFile) -> bool:
+        # One job per stored object: deduplicated rows share a file_path
+        if audio.file_path in self._in_flight:
+            return False
+        try:
+            self._queue.put_nowait(audio)
+        except asyncio.QueueFull:
+            return False
+        self._in_flight.add(audio.file_path)
+        return True
+
+    async def poll(self) -> None:
+        while True:
+            try:
+                pending = await self.repo.unprocessed_audio(limit=self.batch_size * 2)
+                queued = sum(self.submit(a) for a in pending)
+                if queued:
+                    logger.info(f"Queued {queued} audio files for analysis")
+            except Exception as e:
+                logger.error(f"Failed to poll unprocessed audio: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def process(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            audio = await self._queue.get()
+            try:
+                result = await loop.run_in_executor(
+                    self._pool, analyze_audio, audio.file_path, audio.file_url
+                )
+                if result['error']:
+                    logger.warning(f"Analysis failed for {audio.file_path}: {result['error']}")
+                self._results.append(result)
+                if len(self._results) >= self.batch_size:
+                    await self.flush()
+            except Exception as e:
+                # Left unprocessed; the next poll picks it up again
+                logger.error(f"Worker error for {audio.file_path}: {e}")
+                self._in_flight.discard(audio.file_path)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            batch, self._results = self._results, []
+            self._flushed_at = time.monotonic()
+            if not batch:
+                return
+            try:
+                updated = await self.repo.apply_audio_analysis(batch)
+                logger.info(f"Wrote analysis for {len(batch)} files ({updated} rows)")
+            except Exception as e:
+                logger.error(f"Failed to write analysis batch: {e}")
+                self._results.extend(batch)
+                return
+            for result in batch:
+                self._in_flight.discard(result['file_path'])
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                await self.flush()
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self.poll()), asyncio.create_task(self.flush_periodically())]
+        tasks += [asyncio.create_task(self.process()) for _ in range(self.processes)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.flush()
+            self._pool.shutdown(cancel_futures=True)
+
+
+def main() -> None:
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_ANON_KEY')
+    if not url or not key:
+        logger.error("Supabase credentials not set!")
+        return
+
+    repo = create_repository(url, key)
+    worker = AudioWorker(
+        repo,
+        processes=int(os.getenv('AUDIO_WORKER_PROCESSES', '2')),
+        batch_size=int(os.getenv('AUDIO_WORKER_BATCH_SIZE', '50')),
+    )
+    logger.info("LSRC audio worker starting...")
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        logger.info("Audio worker stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,657 @@
+"""
+In-process fakes of the services the bot talks to: Telegram Bot API,
+Supabase (PostgREST tables, RPCs, storage) and the OpenAI Assistants API.
+
+All three are aiohttp apps served from one background thread with its own
+event loop, so their work does not show up as lag on the bot's loop. Each
+service has a FaultConfig: added latency, jitter, 5xx error rate and 429
+rate. Only what telegram-bot.py and repository.py actually call is
+implemented; responses are shaped like the real ones.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+LANGUAGES = ('en', 'en', 'en', 'ru', 'es', 'de', 'pt')
+SHARDS = 96
+
+
+@dataclass
+class FaultConfig:
+    latency: float = 0.0       # seconds added to every request
+    jitter: float = 0.0        # uniform 0..jitter on top
+    error_rate: float = 0.0    # share of requests answered with a 5xx
+    rate_limit_rate: float = 0.0  # share answered with 429
+    retry_after: int = 1
+
+    @classmethod
+    def parse(cls, spec: str, base: Optional['FaultConfig'] = None) -> 'FaultConfig':
+        # "latency=0.05,error_rate=0.01"
+        values = dict(vars(base or cls()))
+        for item in filter(None, spec.split(',')):
+            key, _, value = item.partition('=')
+            if key not in values:
+                raise ValueError(f"Unknown fault setting: {key}")
+            values[key] = int(float(value)) if key == 'retry_after' else float(value)
+        return cls(**values)
+
+
+def fault_middleware(config: FaultConfig, rng: random.Random, counters: Counter, limited: Callable):
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        counters['requests'] += 1
+        delay = config.latency + (rng.uniform(0, config.jitter) if config.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            counters['429'] += 1
+            return limited(config.retry_after)
+        if roll < config.rate_limit_rate + config.error_rate:
+            counters['5xx'] += 1
+            return web.json_response({'message': 'injected failure'}, status=503)
+        return await handler(request)
+    return middleware
+
+
+# ============================================================
+# DATASET
+# ============================================================
+
+def shard_of(user_id: str) -> int:
+    # Stand-in for ((hashtext(user_id) % 96) + 96) % 96: same spread
+    return zlib.crc32(user_id.encode()) % SHARDS
+
+
+@dataclass
+class Dataset:
+    scores: list[dict]
+    subscribers: list[dict]            # sorted by user_id
+    received: dict[str, list[str]]     # push history per user
+    digest: list[dict]                 # weekly_digest rows, sorted by author
+
+    @classmethod
+    def generate(cls, users: int, scores: int, seed: int = 0, history: int = 3) -> 'Dataset':
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        user_ids = sorted(str(100000 + i) for i in range(users))
+        subscribers = [
+            {'user_id': u, 'language_code': rng.choice(LANGUAGES), 'shard': shard_of(u)}
+            for u in user_ids
+        ]
+
+        rows = []
+        for i in range(scores):
+            created = now - timedelta(days=365 * (1 - i / max(1, scores)), seconds=rng.random())
+            rows.append({
+                'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                'text': f"Listen for {rng.choice(['wind', 'traffic', 'breath', 'rain', 'voices'])} "
+                        f"and the silence after it ({i})",
+                'created_at': created.isoformat(timespec='microseconds'),
+                'usage_count': rng.randint(0, 50),
+                'language': rng.choice(LANGUAGES),
+                'author_user_id': rng.choice(user_ids) if user_ids else None,
+                'parent_score_id': rows[rng.randrange(i)]['id'] if i and rng.random() < 0.4 else None,
+                'is_public': rng.random() < 0.95,
+            })
+
+        received = {}
+        if rows:
+            for u in user_ids:
+                received[u] = [rng.choice(rows)['id'] for _ in range(rng.randint(0, history))]
+
+        # A week of listens on some public scores, aggregated per author
+        by_author: dict[str, list[tuple[int, dict]]] = defaultdict(list)
+        for row in rows:
+            if row['is_public'] and row['author_user_id'] and rng.random() < 0.3:
+                by_author[row['author_user_id']].append((rng.randint(1, 40), row))
+        digest = []
+        for author in sorted(by_author):
+            listens = sorted(by_author[author], key=lambda x: (-x[0], x[1]['id']))
+            top_listens, top = listens[0]
+            digest.append({
+                'author_user_id': author,
+                'total_listens': sum(n for n, _ in listens),
+                'top_score_id': top['id'],
+                'top_score_text': top['text'],
+                'top_score_listens': top_listens,
+                'shard': shard_of(author),
+            })
+
+        return cls(rows, subscribers, received, digest)
+
+
+# ============================================================
+# POSTGREST FILTERS
+# ============================================================
+
+def _split_top_level(expr: str) -> list[str]:
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ',':
+            parts.append(expr[start:i])
+            start = i + 1
+    parts.append(expr[start:])
+    return [p for p in parts if p]
+
+
+def _literal(value: Any, text: str) -> Any:
+    text = text.strip('"')
+    if text == 'null':
+        return None
+    if isinstance(value, bool):
+        return text == 'true'
+    if isinstance(value, (int, float)):
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    return text
+
+
+def _compare(op: str, value: Any, text: str) -> bool:
+    if op == 'is':
+        return value is _literal(value, text) if text in ('null', 'true', 'false') else False
+    if op == 'in':
+        return str(value) in {v.strip('"') for v in text.strip('()').split(',')}
+    other = _literal(value, text)
+    if op == 'eq':
+        return value == other
+    if op == 'neq':
+        return value != other
+    if value is None or other is None:
+        return False
+    return {
+        'gt': value > other, 'gte': value >= other,
+        'lt': value < other, 'lte': value <= other,
+    }[op]
+
+
+def condition(expr: str) -> Callable[[dict], bool]:
+    """One or/and(...) group or a column.op.value term."""
+    for name, combine in (('and(', all), ('or(', any)):
+        if expr.startswith(name):
+            terms = [condition(t) for t in _split_top_level(expr[len(name):-1])]
+            return lambda row, terms=terms, combine=combine: combine(t(row) for t in terms)
+    column, op, text = expr.split('.', 2)
+    return lambda row: _compare(op, row.get(column), text)
+
+
+def query_rows(rows: list[dict], query) -> list[dict]:
+    predicates = []
+    for key, value in query.items():
+        if key in ('select', 'order', 'limit', 'offset'):
+            continue
+        if key in ('or', 'and'):
+            predicates.append(condition(f"{key}{value}"))
+        else:
+            predicates.append(condition(f"{key}.{value}"))
+    result = [r for r in rows if all(p(r) for p in predicates)]
+
+    orders = [o for value in query.getall('order', []) for o in value.split(',')]
+    for spec in reversed(orders):
+        column, _, direction = spec.partition('.')
+        desc = direction.startswith('desc')
+        result.sort(
+            key=lambda r: (r.get(column) is None, r.get(column) if r.get(column) is not None else ''),
+            reverse=desc,
+        )
+
+    offset = int(query.get('offset', 0))
+    if 'limit' in query:
+        return result[offset:offset + int(query['limit'])]
+    return result[offset:]
+
+
+# ============================================================
+# SERVICES
+# ============================================================
+
+class FakeService:
+    name = 'service'
+
+    def __init__(self, faults: FaultConfig, seed: int = 0):
+        self.faults = faults
+        self.rng = random.Random(seed)
+        self.counters: Counter = Counter()
+        self.calls: Counter = Counter()
+
+    def limited(self, retry_after: int) -> web.Response:
+        return web.json_response(
+            {'error': {'message': 'Rate limit reached', 'type': 'rate_limit'}},
+            status=429, headers={'Retry-After': str(retry_after)},
+        )
+
+    def routes(self, app: web.Application) -> None:
+        raise NotImplementedError
+
+    def app(self) -> web.Application:
+        app = web.Application(
+            middlewares=[fault_middleware(self.faults, self.rng, self.counters, self.limited)],
+            client_max_size=64 * 1024 * 1024,
+        )
+        self.routes(app)
+        return app
+
+
+class FakeTelegram(FakeService):
+    name = 'telegram'
+
+    def __init__(self, faults: FaultConfig, seed: int = 0, audio_bytes: int = 256 * 1024):
+        super().__init__(faults, seed)
+        self.audio_bytes = audio_bytes
+        self.sent_to: Counter = Counter()   # sendMessage per chat
+        self._message_id = 0
+
+    def limited(self, retry_after: int) -> web.Response:
+        return web.json_response({
+            'ok': False, 'error_code': 429,
+            'description': f"Too Many Requests: retry after {retry_after}",
+            'parameters': {'retry_after': retry_after},
+        }, status=429)
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_post('/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.*}', self.handle_file)
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        form = await request.post()
+        return {k: v for k, v in form.items() if isinstance(v, str)}
+
+    def _message(self, chat_id: Any, text: str = '') -> dict:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'text': text,
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await self._params(request)
+
+        if method == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'LSRC bench', 'username': 'lsrc_bench_bot'}
+        elif method == 'sendMessage':
+            self.sent_to[str(params.get('chat_id'))] += 1
+            result = self._message(params.get('chat_id', 0), params.get('text', ''))
+        elif method == 'editMessageText':
+            result = self._message(params.get('chat_id', 0), params.get('text', ''))
+        elif method in ('deleteMessage', 'answerCallbackQuery', 'setWebhook'):
+            result = True
+        elif method == 'getFile':
+            file_id = params.get('file_id', '')
+            result = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': self.audio_bytes,
+                'file_path': f"voice/{file_id}.oga",
+            }
+        else:
+            return web.json_response(
+                {'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404
+            )
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request: web.Request) -> web.StreamResponse:
+        self.calls['download'] += 1
+        response = web.StreamResponse(headers={
+            'Content-Type': 'audio/ogg', 'Content-Length': str(self.audio_bytes),
+        })
+        await response.prepare(request)
+        # Seeded by path, so the same file always has the same bytes
+        content = random.Random(request.match_info['path']).randbytes(min(self.audio_bytes, 64 * 1024))
+        remaining = self.audio_bytes
+        while remaining > 0:
+            chunk = content[:remaining]
+            await response.write(chunk)
+            remaining -= len(chunk)
+        await response.write_eof()
+        return response
+
+
+class FakeSupabase(FakeService):
+    name = 'supabase'
+
+    def __init__(self, dataset: Dataset, faults: FaultConfig, seed: int = 0):
+        super().__init__(faults, seed)
+        self.data = dataset
+        self.tables: dict[str, list[dict]] = {
+            'scores': dataset.scores,
+            'subscribers': dataset.subscribers,
+            'audio_files': [],
+        }
+        self.objects: dict[str, int] = {}
+        self.checkpoints: dict[tuple, dict] = {}
+        self.deliveries: list[dict] = []
+        self.events = 0
+        self._subscriber_ids = [s['user_id'] for s in dataset.subscribers]
+        self._digest_authors = [r['author_user_id'] for r in dataset.digest]
+        self.rpcs: dict[str, Callable[[dict], Any]] = {
+            'push_audience_page': self.push_audience_page,
+            'weekly_digest': self.weekly_digest,
+            'record_push_deliveries': self.record_push_deliveries,
+            'claim_broadcast_slot': self.claim_broadcast_slot,
+            'save_broadcast_checkpoint': self.save_broadcast_checkpoint,
+            'upsert_subscriber': lambda params: None,
+            'ingest_score_events': self.ingest_score_events,
+            'apply_audio_analysis': lambda params: len(params.get('results') or []),
+        }
+
+    def limited(self, retry_after: int) -> web.Response:
+        return web.json_response(
+            {'message': 'Too many requests'}, status=429, headers={'Retry-After': str(retry_after)}
+        )
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_post('/rest/v1/rpc/{name}', self.handle_rpc)
+        app.router.add_get('/rest/v1/{table}', self.handle_select)
+        app.router.add_post('/rest/v1/{table}', self.handle_insert)
+        app.router.add_post('/storage/v1/object/{bucket}/{path:.*}', self.handle_upload)
+        app.router.add_delete('/storage/v1/object/{bucket}/{path:.*}', self.handle_delete)
+
+    # ---------- PostgREST ----------
+
+    async def handle_select(self, request: web.Request) -> web.Response:
+        table = request.match_info['table']
+        self.calls[f"select {table}"] += 1
+        if table not in self.tables:
+            return web.json_response({'message': f"relation {table} does not exist"}, status=404)
+        return web.json_response(query_rows(self.tables[table], request.query))
+
+    async def handle_insert(self, request: web.Request) -> web.Response:
+        table = request.match_info['table']
+        self.calls[f"insert {table}"] += 1
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        stored = []
+        for row in rows:
+            row = {'id': str(uuid.uuid4()), 'created_at': datetime.now(timezone.utc).isoformat(), **row}
+            self.tables.setdefault(table, []).append(row)
+            stored.append(row)
+        return web.json_response(stored, status=201)
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        name = request.match_info['name']
+        self.calls[f"rpc {name}"] += 1
+        if name not in self.rpcs:
+            return web.json_response({'message': f"Could not find the function public.{name}"}, status=404)
+        params = await request.json() if request.can_read_body else {}
+        result = self.rpcs[name](params)
+        if result is None:
+            return web.Response(status=204)
+        return web.json_response(result)
+
+    def _page(self, keys: list[str], rows: list[dict], after: Optional[str], params: dict, shard_of_row) -> list[dict]:
+        lo, hi = params.get('shard_lo', 0), params.get('shard_hi', SHARDS)
+        limit = params.get('page_size') or 1000
+        page = []
+        for row in rows[bisect_right(keys, after) if after else 0:]:
+            if lo <= shard_of_row(row) < hi:
+                page.append(row)
+                if len(page) >= limit:
+                    break
+        return page
+
+    def push_audience_page(self, params: dict) -> list[dict]:
+        page = self._page(
+            self._subscriber_ids, self.data.subscribers, params.get('after_user'), params,
+            lambda s: s['shard'],
+        )
+        return [
+            {'user_id': s['user_id'], 'language_code': s['language_code'],
+             'received': self.data.received.get(s['user_id'], [])}
+            for s in page
+        ]
+
+    def weekly_digest(self, params: dict) -> list[dict]:
+        page = self._page(
+            self._digest_authors, self.data.digest, params.get('after_author'), params,
+            lambda r: r['shard'],
+        )
+        return [{k: v for k, v in r.items() if k != 'shard'} for r in page]
+
+    def record_push_deliveries(self, params: dict) -> int:
+        batch = params.get('deliveries') or []
+        self.deliveries.extend(batch)
+        return len(batch)
+
+    def claim_broadcast_slot(self, params: dict) -> list[dict]:
+        key = (params['p_job'], params['p_run_key'], params['p_slot'])
+        row = self.checkpoints.setdefault(key, {
+            'last_user_id': None, 'sent': 0, 'completed_at': None, 'lease_owner': None, 'lease_until': None,
+        })
+        now = datetime.now(timezone.utc)
+        free = row['lease_until'] is None or datetime.fromisoformat(row['lease_until']) < now
+        claimed = not row['completed_at'] and (free or row['lease_owner'] == params['p_owner'])
+        if claimed:
+            row['lease_owner'] = params['p_owner']
+            row['lease_until'] = (now + timedelta(seconds=params.get('p_lease_seconds', 300))).isoformat()
+        return [{**row, 'claimed': claimed}]
+
+    def save_broadcast_checkpoint(self, params: dict) -> bool:
+        row = self.checkpoints.get((params['p_job'], params['p_run_key'], params['p_slot']))
+        if row is None or row['completed_at'] or row['lease_owner'] != params['p_owner']:
+            return False
+        row['last_user_id'] = params.get('p_last_user_id') or row['last_user_id']
+        row['sent'] = params.get('p_sent', 0)
+        if params.get('p_completed'):
+            row['completed_at'] = datetime.now(timezone.utc).isoformat()
+            row['lease_until'] = None
+        else:
+            lease = timedelta(seconds=params.get('p_lease_seconds', 300))
+            row['lease_until'] = (datetime.now(timezone.utc) + lease).isoformat()
+        return True
+
+    def ingest_score_events(self, params: dict) -> int:
+        events = params.get('events') or []
+        self.events += len(events)
+        return len(events)
+
+    # ---------- storage ----------
+
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        path = f"{request.match_info['bucket']}/{request.match_info['path']}"
+        self.calls['storage upload'] += 1
+        size = 0
+        async for chunk in request.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+        if path in self.objects:
+            return web.json_response(
+                {'statusCode': '409', 'error': 'Duplicate', 'message': 'The resource already exists'},
+                status=400,
+            )
+        self.objects[path] = size
+        return web.json_response({'Key': path})
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        path = f"{request.match_info['bucket']}/{request.match_info['path']}"
+        self.calls['storage delete'] += 1
+        if self.objects.pop(path, None) is None:
+            return web.json_response({'message': 'Object not found'}, status=404)
+        return web.json_response({'message': 'Successfully deleted'})
+
+
+class FakeOpenAI(FakeService):
+    name = 'openai'
+
+    ANSWER = (
+        "Deep Listening asks you to notice both the focused sound and the whole field around it. "
+        "Try listening to the room you are in for one minute, then write down what surprised you. "
+        "Pauline Oliveros called this the balance between focal and global attention."
+    )
+
+    def __init__(self, faults: FaultConfig, seed: int = 0, deltas: int = 40, delta_interval: float = 0.02):
+        super().__init__(faults, seed)
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+
+    def routes(self, app: web.Application) -> None:
+        app.router.add_post('/v1/threads', self.create_thread)
+        app.router.add_post('/v1/threads/{thread_id}/messages', self.create_message)
+        app.router.add_post('/v1/threads/{thread_id}/runs', self.create_run)
+
+    @staticmethod
+    def _id(prefix: str) -> str:
+        return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+    async def create_thread(self, request: web.Request) -> web.Response:
+        self.calls['threads.create'] += 1
+        return web.json_response({
+            'id': self._id('thread'), 'object': 'thread', 'created_at': int(time.time()),
+            'metadata': {}, 'tool_resources': None,
+        })
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        self.calls['messages.create'] += 1
+        body = await request.json()
+        return web.json_response(self._message(request.match_info['thread_id'], 'user', body.get('content', '')))
+
+    def _message(self, thread_id: str, role: str, text: str, message_id: Optional[str] = None,
+                 run_id: Optional[str] = None, status: str = 'completed') -> dict:
+        return {
+            'id': message_id or self._id('msg'), 'object': 'thread.message',
+            'created_at': int(time.time()), 'thread_id': thread_id, 'role': role,
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}] if text else [],
+            'assistant_id': None, 'run_id': run_id, 'attachments': [], 'metadata': {},
+            'status': status, 'completed_at': None, 'incomplete_at': None, 'incomplete_details': None,
+        }
+
+    def _run(self, run_id: str, thread_id: str, assistant_id: str, status: str) -> dict:
+        return {
+            'id': run_id, 'object': 'thread.run', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'assistant_id': assistant_id, 'status': status,
+            'model': 'bench', 'instructions': '', 'tools': [], 'metadata': {},
+            'parallel_tool_calls': True,
+        }
+
+    async def create_run(self, request: web.Request) -> web.StreamResponse:
+        self.calls['runs.stream'] += 1
+        body = await request.json()
+        thread_id = request.match_info['thread_id']
+        run_id, message_id = self._id('run'), self._id('msg')
+        assistant_id = body.get('assistant_id', '')
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+
+        async def emit(event: str, data: Any) -> None:
+            await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+
+        await emit('thread.run.created', self._run(run_id, thread_id, assistant_id, 'queued'))
+        await emit('thread.run.in_progress', self._run(run_id, thread_id, assistant_id, 'in_progress'))
+        await emit('thread.message.created', self._message(thread_id, 'assistant', '', message_id, run_id, 'in_progress'))
+        words = self.ANSWER.split(' ')
+        step = max(1, len(words) // max(1, self.deltas))
+        for i in range(0, len(words), step):
+            if self.delta_interval:
+                await asyncio.sleep(self.delta_interval)
+            text = ' '.join(words[i:i + step]) + (' ' if i + step < len(words) else '')
+            await emit('thread.message.delta', {
+                'id': message_id, 'object': 'thread.message.delta',
+                'delta': {'content': [{'index': 0, 'type': 'text', 'text': {'value': text}}]},
+            })
+        await emit('thread.message.completed', self._message(thread_id, 'assistant', self.ANSWER, message_id, run_id))
+        await emit('thread.run.completed', self._run(run_id, thread_id, assistant_id, 'completed'))
+        await response.write(b"event: done\ndata: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+
+@dataclass
+class FakeServices:
+    """Serves the fakes on ephemeral localhost ports from a background thread."""
+    telegram: FakeTelegram
+    supabase: FakeSupabase
+    openai: FakeOpenAI
+    urls: dict[str, str] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runners: list[web.AppRunner] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def services(self) -> list[FakeService]:
+        return [self.telegram, self.supabase, self.openai]
+
+    def start(self) -> None:
+        ready = threading.Event()
+        errors: list[BaseException] = []
+
+        def serve() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._start_apps())
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._stop_apps())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='bench-fakes', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+
+    async def _start_apps(self) -> None:
+        for service in self.services:
+            runner = web.AppRunner(service.app(), access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            host, port = runner.addresses[0][:2]
+            self.urls[service.name] = f"http://{host}:{port}"
+            self._runners.append(runner)
+
+    async def _stop_apps(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def stop(self) -> None:
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+    def bot_env(self) -> dict[str, str]:
+        return {
+            'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+            'TELEGRAM_API_BASE_URL': self.urls['telegram'],
+            'SUPABASE_URL': self.urls['supabase'],
+            # create_client() checks the key looks like a JWT
+            'SUPABASE_SERVICE_ROLE_KEY': 'bench.bench.bench',
+            'OPENAI_API_KEY': 'sk-bench',
+            'OPENAI_BASE_URL': f"{self.urls['openai']}/v1",
+            'OPENAI_ASSISTANT_ID': 'asst_bench',
+        }
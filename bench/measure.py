@@ -0,0 +1,169 @@
+"""
+Bench measurements: latency percentiles, event-loop lag, peak RSS, and the
+comparison of a run against a stored baseline.
+"""
+
+import asyncio
+import logging
+import resource
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+LAG_INTERVAL = 0.05
+
+# metric -> (higher is better, smallest change worth reporting)
+METRICS = {
+    'throughput': (True, 0.0),
+    'p50_ms': (False, 2.0),
+    'p95_ms': (False, 5.0),
+    'p99_ms': (False, 5.0),
+    'loop_lag_p99_ms': (False, 5.0),
+    'loop_lag_max_ms': (False, 20.0),
+    'peak_rss_mb': (False, 10.0),
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    # Nearest rank, as in BroadcastStats.percentile
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class LoopLagMonitor:
+    """Samples how late a short sleep wakes up on the running loop."""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR records; the bot's handlers log failures instead of raising."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    operations: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    throughput: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    loop_lag_p99_ms: float = 0.0
+    loop_lag_max_ms: float = 0.0
+    peak_rss_mb: float = 0.0
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls,
+        scenario: str,
+        latencies: list[float],
+        elapsed: float,
+        lag: list[float],
+        errors: int = 0,
+        operations: Optional[int] = None,
+        **extra,
+    ) -> 'ScenarioResult':
+        operations = len(latencies) if operations is None else operations
+        return cls(
+            scenario=scenario,
+            operations=operations,
+            errors=errors,
+            elapsed=round(elapsed, 3),
+            throughput=round(operations / elapsed, 2) if elapsed > 0 else 0.0,
+            p50_ms=round(percentile(latencies, 50) * 1000, 2),
+            p95_ms=round(percentile(latencies, 95) * 1000, 2),
+            p99_ms=round(percentile(latencies, 99) * 1000, 2),
+            loop_lag_p99_ms=round(percentile(lag, 99) * 1000, 2),
+            loop_lag_max_ms=round(max(lag, default=0.0) * 1000, 2),
+            peak_rss_mb=round(peak_rss_mb(), 1),
+            extra=extra,
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def summary(self) -> str:
+        return (
+            f"{self.scenario}: {self.operations} ops in {self.elapsed:.1f}s "
+            f"({self.throughput:.1f}/s), errors={self.errors}, "
+            f"latency p50={self.p50_ms:.0f}ms p95={self.p95_ms:.0f}ms p99={self.p99_ms:.0f}ms, "
+            f"loop lag p99={self.loop_lag_p99_ms:.1f}ms max={self.loop_lag_max_ms:.1f}ms, "
+            f"peak RSS {self.peak_rss_mb:.0f}MB"
+        )
+
+
+@dataclass
+class Change:
+    scenario: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return (self.current - self.baseline) / self.baseline if self.baseline else 0.0
+
+    def worse(self, threshold: float) -> bool:
+        higher_is_better, min_delta = METRICS[self.metric]
+        delta = self.current - self.baseline
+        if abs(delta) <= min_delta:
+            return False
+        if not self.baseline:
+            return not higher_is_better and delta > 0
+        change = -self.ratio if higher_is_better else self.ratio
+        return change > threshold
+
+    def describe(self) -> str:
+        return f"{self.scenario}.{self.metric}: {self.baseline:g} -> {self.current:g} ({self.ratio:+.0%})"
+
+
+def compare(current: dict[str, dict], baseline: dict[str, dict]) -> list[Change]:
+    changes = []
+    for scenario, result in current.items():
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        for metric in METRICS:
+            if metric in result and metric in previous:
+                changes.append(Change(scenario, metric, float(previous[metric]), float(result[metric])))
+    return changes
@@ -0,0 +1,145 @@
+"""
+LSRC bench runner
+
+    python -m bench.run                          # all scenarios, compare with bench/baseline.json
+    python -m bench.run --scenario push --users 50000
+    python -m bench.run --latency 0.05 --fault telegram:rate_limit_rate=0.01
+    python -m bench.run --save-baseline          # store this run as the new baseline
+
+Each scenario runs in its own subprocess so peak RSS and event-loop lag
+belong to that scenario alone. Exits with 1 if any metric regressed past
+--threshold against the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+
+from bench.fakes import FaultConfig
+from bench.measure import compare
+from bench.scenarios import ROOT, SCENARIOS, BenchConfig, run_scenario
+
+DEFAULT_BASELINE = ROOT / 'bench' / 'baseline.json'
+SERVICES = ('telegram', 'supabase', 'openai')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    defaults = BenchConfig()
+    parser = argparse.ArgumentParser(description='Load-test telegram-bot.py against local fakes')
+    parser.add_argument('--scenario', choices=['all', *SCENARIOS], default='all')
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--scores', type=int, default=defaults.scores)
+    parser.add_argument('--voice-uploads', type=int, default=defaults.voice_uploads)
+    parser.add_argument('--voice-duplicate-rate', type=float, default=defaults.voice_duplicate_rate)
+    parser.add_argument('--audio-bytes', type=int, default=defaults.audio_bytes)
+    parser.add_argument('--chat-users', type=int, default=defaults.chat_users)
+    parser.add_argument('--chat-questions', type=int, default=defaults.chat_questions)
+    parser.add_argument('--push-slots', type=int, default=defaults.push_slots)
+    parser.add_argument('--digest-slots', type=int, default=defaults.digest_slots)
+    parser.add_argument('--broadcast-rate', type=float, default=defaults.broadcast_rate,
+                        help='BROADCAST_RATE for the run; high by default so the bot, not the limiter, is measured')
+    parser.add_argument('--broadcast-concurrency', type=int, default=defaults.broadcast_concurrency)
+    parser.add_argument('--update-workers', type=int, default=defaults.update_workers)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake request')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--fault', action='append', default=[], metavar='SERVICE:key=value,...',
+                        help=f"per-service override, SERVICE one of {', '.join(SERVICES)}")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--output', type=Path, help='write results as JSON')
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's INFO logs")
+    return parser.parse_args(argv)
+
+
+def build_config(args: argparse.Namespace) -> BenchConfig:
+    base = FaultConfig(
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+    )
+    faults = {service: base for service in SERVICES}
+    for spec in args.fault:
+        service, _, settings = spec.partition(':')
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service in --fault: {service}")
+        faults[service] = FaultConfig.parse(settings, faults[service])
+    return BenchConfig(
+        users=args.users, scores=args.scores,
+        voice_uploads=args.voice_uploads, voice_duplicate_rate=args.voice_duplicate_rate,
+        audio_bytes=args.audio_bytes,
+        chat_users=args.chat_users, chat_questions=args.chat_questions,
+        push_slots=args.push_slots, digest_slots=args.digest_slots,
+        broadcast_rate=args.broadcast_rate, broadcast_concurrency=args.broadcast_concurrency,
+        update_workers=args.update_workers, seed=args.seed, faults=faults,
+    )
+
+
+def run_isolated(name: str, argv: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / 'result.json'
+        args = [a for a in argv if a != '--save-baseline']
+        subprocess.run(
+            [sys.executable, '-m', 'bench.run', *args, '--scenario', name, '--output', str(output),
+             '--baseline', str(Path(tmp) / 'none.json')],
+            cwd=ROOT, check=True,
+        )
+        return json.loads(output.read_text())['results'][name]
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    config = build_config(args)
+
+    if args.scenario == 'all':
+        # Drop our own --scenario/--output; each child writes its own file
+        child_argv, skip = [], False
+        for arg in argv:
+            if skip:
+                skip = False
+            elif arg in ('--scenario', '--output', '--baseline'):
+                skip = True
+            elif not arg.startswith(('--scenario=', '--output=', '--baseline=')):
+                child_argv.append(arg)
+        results = {name: run_isolated(name, child_argv) for name in SCENARIOS}
+    else:
+        result = asyncio.run(run_scenario(args.scenario, config, quiet=not args.verbose))
+        print(result.summary())
+        results = {args.scenario: result.to_dict()}
+
+    report = {'config': asdict(config), 'results': results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    regressions = []
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get('config') != json.loads(json.dumps(report['config'])):
+            print("Note: baseline was recorded with a different configuration")
+        changes = compare(results, baseline.get('results', {}))
+        for change in changes:
+            if change.worse(args.threshold):
+                regressions.append(change)
+        if changes:
+            print(f"\nAgainst {args.baseline} (threshold {args.threshold:.0%}):")
+            for change in changes:
+                flag = 'REGRESSION' if change in regressions else ''
+                print(f"  {change.describe()} {flag}".rstrip())
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Baseline saved to {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
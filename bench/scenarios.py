@@ -0,0 +1,308 @@
+"""
+Bench scenarios: telegram-bot.py is loaded as a module against the fakes
+and its real handlers and jobs are driven directly, the way the
+Application's update workers and JobQueue would call them.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Awaitable, Callable
+
+from bench.fakes import Dataset, FakeOpenAI, FakeServices, FakeSupabase, FakeTelegram, FaultConfig
+from bench.measure import ErrorCounter, LoopLagMonitor, ScenarioResult
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_PATH = ROOT / 'telegram-bot.py'
+
+QUESTIONS = [
+    "What is Deep Listening?",
+    "Who was Pauline Oliveros?",
+    "How do I write a score?",
+    "What should I listen for in a noisy city?",
+    "How long should a listening session be?",
+    "Can I respond with silence?",
+    "What is the difference between hearing and listening?",
+    "How do I continue someone else's score?",
+]
+
+
+@dataclass
+class BenchConfig:
+    users: int = 10000
+    scores: int = 2000
+    voice_uploads: int = 200
+    voice_duplicate_rate: float = 0.2
+    audio_bytes: int = 256 * 1024
+    chat_users: int = 50
+    chat_questions: int = 3
+    chat_deltas: int = 40
+    chat_delta_interval: float = 0.02
+    push_slots: int = 24
+    digest_slots: int = 8
+    broadcast_rate: float = 1000.0
+    broadcast_concurrency: int = 20
+    update_workers: int = 16
+    seed: int = 0
+    faults: dict[str, FaultConfig] = field(default_factory=dict)
+
+    def fault(self, service: str) -> FaultConfig:
+        return self.faults.get(service) or FaultConfig()
+
+
+def load_bot(env: dict[str, str]) -> ModuleType:
+    # telegram-bot.py reads its settings at import time
+    os.environ.update(env)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    spec = importlib.util.spec_from_file_location('lsrc_bot', BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def job_context(bot, data) -> SimpleNamespace:
+    return SimpleNamespace(bot=bot, job=SimpleNamespace(data=data))
+
+
+def message_update(update_id: int, user_id: int, **message) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'language_code': 'en'},
+            **message,
+        },
+    }
+
+
+class BroadcastRecorder:
+    """Wraps the bot's make_broadcaster to keep every run's BroadcastStats."""
+
+    def __init__(self, bot: ModuleType):
+        self.stats = []
+        self._make = bot.make_broadcaster
+        bot.make_broadcaster = self.make
+
+    def make(self, telegram_bot):
+        broadcaster = self._make(telegram_bot)
+        run = broadcaster.run
+
+        async def recorded(*args, **kwargs):
+            stats = await run(*args, **kwargs)
+            self.stats.append(stats)
+            return stats
+
+        broadcaster.run = recorded
+        return broadcaster
+
+    def totals(self) -> dict:
+        return {
+            'sent': sum(s.sent for s in self.stats),
+            'failed': sum(s.failed for s in self.stats),
+            'retries': sum(s.retries for s in self.stats),
+            'flood_waits': sum(s.flood_waits for s in self.stats),
+        }
+
+
+@dataclass
+class Bench:
+    config: BenchConfig
+    services: FakeServices
+    bot: ModuleType
+    app: object
+
+    @property
+    def telegram(self) -> FakeTelegram:
+        return self.services.telegram
+
+    @property
+    def supabase(self) -> FakeSupabase:
+        return self.services.supabase
+
+
+async def _broadcast(bench: Bench, job: str, callback, count: int, start, hours: float) -> tuple[list, float, dict]:
+    bot = bench.bot
+    recorder = BroadcastRecorder(bot)
+    slots = bot.plan_slots(job, count, start, hours)
+    started = time.perf_counter()
+    for slot in slots:
+        # Slots are hours apart in production; here they run back to back
+        await callback(job_context(bench.app.bot, slot))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for stats in recorder.stats for latency in stats.latencies]
+    sent_to = bench.telegram.sent_to
+    completed = sum(
+        1 for (name, _, _), row in bench.supabase.checkpoints.items()
+        if name == job and row['completed_at']
+    )
+    extra = {
+        **recorder.totals(),
+        'slots': len(slots),
+        'slots_completed': completed,
+        'duplicates': sum(n - 1 for n in sent_to.values() if n > 1),
+    }
+    return latencies, elapsed, extra
+
+
+async def daily_push(bench: Bench) -> dict:
+    bot = bench.bot
+    latencies, elapsed, extra = await _broadcast(
+        bench, 'daily_push', bot.send_daily_push,
+        bench.config.push_slots, bot.PUSH_WINDOW_START, bot.PUSH_WINDOW_HOURS,
+    )
+    extra['deliveries_recorded'] = len(bench.supabase.deliveries)
+    return dict(latencies=latencies, elapsed=elapsed, operations=extra['sent'], **extra)
+
+
+async def weekly_digest(bench: Bench) -> dict:
+    bot = bench.bot
+    latencies, elapsed, extra = await _broadcast(
+        bench, 'weekly_digest', bot.send_weekly_digest,
+        bench.config.digest_slots, bot.DIGEST_WINDOW_START, bot.DIGEST_WINDOW_HOURS,
+    )
+    extra['authors'] = len(bench.supabase.data.digest)
+    return dict(latencies=latencies, elapsed=elapsed, operations=extra['sent'], **extra)
+
+
+async def _concurrently(bench: Bench, calls: list[Callable[[], Awaitable]]) -> tuple[list[float], float]:
+    # At most UPDATE_WORKERS at once, like Application.concurrent_updates
+    workers = asyncio.Semaphore(bench.config.update_workers)
+    latencies: list[float] = []
+
+    async def timed(call) -> None:
+        async with workers:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    return latencies, time.perf_counter() - started
+
+
+async def voice_uploads(bench: Bench) -> dict:
+    from telegram import Update
+
+    config, bot = bench.config, bench.bot
+    rng = random.Random(config.seed)
+    context = SimpleNamespace(bot=bench.app.bot)
+    distinct = max(1, round(config.voice_uploads * (1 - config.voice_duplicate_rate)))
+    calls = []
+    for i in range(config.voice_uploads):
+        # Some uploads repeat an earlier file (forwarded audio)
+        n = i if i < distinct else rng.randrange(distinct)
+        voice = {
+            'file_id': f"voice-{n}", 'file_unique_id': f"voice-{n}", 'duration': 20,
+            'mime_type': 'audio/ogg', 'file_size': config.audio_bytes,
+        }
+        update = Update.de_json(message_update(i + 1, 200000 + i, voice=voice), bench.app.bot)
+        calls.append(lambda update=update: bot.handle_voice_message(update, context))
+
+    latencies, elapsed = await _concurrently(bench, calls)
+    return dict(
+        latencies=latencies, elapsed=elapsed,
+        distinct_files=distinct,
+        objects_stored=len(bench.supabase.objects),
+        rows_inserted=len(bench.supabase.tables['audio_files']),
+        bytes_downloaded=bench.telegram.calls['download'] * config.audio_bytes,
+    )
+
+
+async def chat_bursts(bench: Bench) -> dict:
+    from telegram import Update
+
+    config, bot = bench.config, bench.bot
+    rng = random.Random(config.seed)
+    context = SimpleNamespace(bot=bench.app.bot)
+    calls = []
+    update_id = 0
+    for u in range(config.chat_users):
+        user_id = 300000 + u
+        bot.set_chat_mode(user_id, True)
+        for _ in range(config.chat_questions):
+            update_id += 1
+            update = Update.de_json(
+                message_update(update_id, user_id, text=rng.choice(QUESTIONS)), bench.app.bot
+            )
+            calls.append(lambda update=update: bot.handle_text_message(update, context))
+    rng.shuffle(calls)
+
+    latencies, elapsed = await _concurrently(bench, calls)
+    stats = bot.answer_cache.stats
+    return dict(
+        latencies=latencies, elapsed=elapsed,
+        assistant_runs=bench.services.openai.calls['runs.stream'],
+        cache_hits=stats.hits + stats.fuzzy_hits,
+        edits=bench.telegram.calls['editMessageText'],
+    )
+
+
+SCENARIOS: dict[str, Callable[[Bench], Awaitable[dict]]] = {
+    'push': daily_push,
+    'digest': weekly_digest,
+    'voice': voice_uploads,
+    'chat': chat_bursts,
+}
+
+
+async def run_scenario(name: str, config: BenchConfig, quiet: bool = True) -> ScenarioResult:
+    dataset = Dataset.generate(config.users, config.scores, seed=config.seed)
+    services = FakeServices(
+        telegram=FakeTelegram(config.fault('telegram'), config.seed, audio_bytes=config.audio_bytes),
+        supabase=FakeSupabase(dataset, config.fault('supabase'), config.seed),
+        openai=FakeOpenAI(
+            config.fault('openai'), config.seed,
+            deltas=config.chat_deltas, delta_interval=config.chat_delta_interval,
+        ),
+    )
+    services.start()
+    errors = ErrorCounter()
+    try:
+        bot = load_bot({
+            **services.bot_env(),
+            'SESSION_BACKEND': 'memory',
+            'ANSWER_CACHE_BACKEND': 'memory',
+            'BROADCAST_RATE': str(config.broadcast_rate),
+            'BROADCAST_CONCURRENCY': str(config.broadcast_concurrency),
+            'UPDATE_WORKERS': str(config.update_workers),
+        })
+        if quiet:
+            logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger().addHandler(errors)
+
+        app = bot.build_application()
+        await app.initialize()
+        bench = Bench(config, services, bot, app)
+        monitor = LoopLagMonitor()
+        monitor.start()
+        try:
+            measured = await SCENARIOS[name](bench)
+        finally:
+            await monitor.stop()
+            await app.shutdown()
+            if bot.AudioHandler._http is not None:
+                await bot.AudioHandler._http.aclose()
+            await bot.repo.aclose()
+
+        latencies = measured.pop('latencies')
+        elapsed = measured.pop('elapsed')
+        operations = measured.pop('operations', None)
+        measured['fake_requests'] = {s.name: dict(s.counters) for s in services.services}
+        return ScenarioResult.build(
+            name, latencies, elapsed, monitor.samples,
+            errors=errors.count, operations=operations, **measured,
+        )
+    finally:
+        logging.getLogger().removeHandler(errors)
+        services.stop()
@@ -0,0 +1,236 @@
+"""
+LSRC broadcast engine
+Bounded worker pool for bulk Telegram sends (daily push, weekly digest)
+with global + per-chat token buckets and RetryAfter handling.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, AsyncIterable, Callable, Iterable, Optional, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# Telegram: ~30 messages/second in bulk, ~1 message/second to the same chat
+GLOBAL_RATE = 30.0
+PER_CHAT_RATE = 1.0
+DEFAULT_CONCURRENCY = 20
+MAX_RETRIES = 3
+
+
+@dataclass
+class BroadcastMessage:
+    chat_id: int
+    text: str
+    reply_markup: Any = None
+    parse_mode: Optional[str] = None
+    tag: Any = None  # caller's bookkeeping (e.g. the score id), not sent
+
+
+@dataclass
+class BroadcastStats:
+    name: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    failures: Counter = field(default_factory=Counter)
+    latencies: list[float] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+        return ordered[k]
+
+    def summary(self) -> str:
+        failures = ", ".join(f"{k}={v}" for k, v in self.failures.most_common()) or "none"
+        return (
+            f"{self.name}: sent {self.sent}/{self.total} in {self.elapsed:.1f}s "
+            f"({self.throughput:.1f} msg/s), latency p50={self.percentile(50) * 1000:.0f}ms "
+            f"p95={self.percentile(95) * 1000:.0f}ms p99={self.percentile(99) * 1000:.0f}ms, "
+            f"retries={self.retries}, flood_waits={self.flood_waits}, failures: {failures}"
+        )
+
+
+def _seconds(value: Union[int, float, timedelta]) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TokenBucket:
+    """Shared limiter: refills at `rate` tokens/s up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def block(self, seconds: float) -> None:
+        # Flood wait from Telegram applies to the whole bot, not one chat
+        until = time.monotonic() + seconds
+        if until > self._blocked_until:
+            self._blocked_until = until
+            self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PerChatLimiter:
+    """Spaces sends to the same chat at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_at: dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_at.get(chat_id, 0.0))
+        self._next_at[chat_id] = slot + self.interval
+        if len(self._next_at) > 10_000:
+            self._next_at = {c: t for c, t in self._next_at.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        bot,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_limiter = PerChatLimiter(per_chat_rate)
+
+    async def run(
+        self,
+        messages: Union[Iterable[BroadcastMessage], AsyncIterable[BroadcastMessage]],
+        name: str = "broadcast",
+        on_sent: Optional[Callable[[BroadcastMessage], None]] = None,
+    ) -> BroadcastStats:
+        stats = BroadcastStats(name=name)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def produce() -> None:
+            try:
+                if hasattr(messages, "__aiter__"):
+                    async for message in messages:
+                        stats.total += 1
+                        await queue.put(message)
+                else:
+                    for message in messages:
+                        stats.total += 1
+                        await queue.put(message)
+            finally:
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+        async def work() -> None:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+                if await self._deliver(message, stats) and on_sent is not None:
+                    on_sent(message)
+
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        try:
+            try:
+                await produce()
+            except Exception as e:
+                # Keep whatever was already queued; the workers drain it below
+                logger.error(f"{name}: message source failed: {e}", exc_info=True)
+                stats.failures["source_error"] += 1
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            stats.finished_at = time.monotonic()
+
+        logger.info(stats.summary())
+        return stats
+
+    async def _deliver(self, message: BroadcastMessage, stats: BroadcastStats) -> bool:
+        attempt = 0
+        while True:
+            await self.chat_limiter.acquire(message.chat_id)
+            await self.global_bucket.acquire()
+            started = time.monotonic()
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    reply_markup=message.reply_markup,
+                    parse_mode=message.parse_mode,
+                )
+                stats.latencies.append(time.monotonic() - started)
+                stats.sent += 1
+                return True
+            except RetryAfter as e:
+                wait = _seconds(e.retry_after)
+                stats.flood_waits += 1
+                logger.warning(f"Flood wait {wait:.0f}s while sending to {message.chat_id}")
+                self.global_bucket.block(wait)
+                error: Exception = e
+            except (Forbidden, BadRequest) as e:
+                # Blocked bot, deleted chat, bad chat id — retrying is pointless
+                stats.failed += 1
+                stats.failures[type(e).__name__] += 1
+                return False
+            except (TimedOut, NetworkError) as e:
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt))
+                error = e
+            except Exception as e:
+                stats.failed += 1
+                stats.failures[type(e).__name__] += 1
+                logger.warning(f"Send failed for {message.chat_id}: {e}")
+                return False
+
+            attempt += 1
+            if attempt > self.max_retries:
+                stats.failed += 1
+                stats.failures[type(error).__name__] += 1
+                logger.warning(f"Giving up on {message.chat_id} after {attempt} attempts: {error}")
+                return False
+            stats.retries += 1
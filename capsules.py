@@ -0,0 +1,167 @@
+"""
+LSRC session ingest
+A finished session from the mini app (POST /api/sessions in server.py):
+the capsule, the user's final score, and one fragment (+ optional
+reflection) per Listen → Sound cycle. Validated here, then written by the
+ingest_session RPC (migrations/011_ingest_session.sql) in one transaction,
+so a session is saved completely or not at all, in one round trip.
+
+client_id is the mini app's id for the session; retrying the same upload
+returns the capsule created the first time. user_id is taken from the
+payload as is: neither this nor the RPC (callable with the anon key)
+authenticates the user.
+"""
+
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+LISTEN_SOURCES = ('environment', 'past_capsule')
+TRANSPORTS = ('telegram_webapp', 'web')
+TRANSCRIPTION_SOURCES = ('user_typed', 'audio_transcribed')
+MAX_CYCLES = 20
+MAX_SCORE_LENGTH = 500
+MAX_REFLECTION_LENGTH = 5000
+MAX_KEYWORDS = 20
+MAX_USER_ID_LENGTH = 64
+
+
+class SessionError(ValueError):
+    """Malformed session payload."""
+
+
+def _uuid(value, name: str, required: bool = True) -> Optional[str]:
+    if value is None and not required:
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        raise SessionError(f"{name} must be a UUID")
+
+
+def _text(value, name: str, max_length: int) -> str:
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise SessionError(f"{name} must be a string")
+    value = value.strip()
+    if len(value) > max_length:
+        raise SessionError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _choice(value, name: str, choices: tuple[str, ...], default: str) -> str:
+    if value is None:
+        return default
+    if value not in choices:
+        raise SessionError(f"{name} must be one of {', '.join(choices)}")
+    return value
+
+
+def _object(value, name: str) -> dict:
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise SessionError(f"{name} must be an object")
+    return value
+
+
+@dataclass
+class Reflection:
+    text: str
+    audio_id: Optional[str] = None
+    transcription_source: str = 'user_typed'
+    keywords: list[str] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, item: dict, name: str) -> Optional['Reflection']:
+        text = _text(item.get('text'), f"{name}.text", MAX_REFLECTION_LENGTH)
+        if not text:
+            # reflections.text is NOT NULL; an empty reflection is just skipped
+            return None
+        keywords = item.get('keywords') or []
+        if not isinstance(keywords, list) or len(keywords) > MAX_KEYWORDS:
+            raise SessionError(f"{name}.keywords must be a list of at most {MAX_KEYWORDS} strings")
+        return cls(
+            text=text,
+            audio_id=_uuid(item.get('audio_id'), f"{name}.audio_id", required=False),
+            transcription_source=_choice(
+                item.get('transcription_source'), f"{name}.transcription_source",
+                TRANSCRIPTION_SOURCES, 'user_typed',
+            ),
+            keywords=[_text(k, f"{name}.keywords", 100) for k in keywords],
+        )
+
+
+@dataclass
+class Cycle:
+    listen_source: str = 'environment'
+    listen_audio_id: Optional[str] = None
+    sound_audio_id: Optional[str] = None
+    reflection: Optional[Reflection] = None
+
+    @classmethod
+    def parse(cls, item, name: str) -> 'Cycle':
+        item = _object(item, name)
+        return cls(
+            listen_source=_choice(item.get('listen_source'), f"{name}.listen_source", LISTEN_SOURCES, 'environment'),
+            listen_audio_id=_uuid(item.get('listen_audio_id'), f"{name}.listen_audio_id", required=False),
+            sound_audio_id=_uuid(item.get('sound_audio_id'), f"{name}.sound_audio_id", required=False),
+            reflection=Reflection.parse(_object(item.get('reflection'), f"{name}.reflection"), f"{name}.reflection"),
+        )
+
+
+@dataclass
+class CapsuleSession:
+    client_id: str
+    user_id: str
+    initial_score_id: str
+    is_public: bool = True
+    transport: str = 'telegram_webapp'
+    final_score_text: str = ''
+    final_score_language: Optional[str] = None
+    cycles: list[Cycle] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, payload) -> 'CapsuleSession':
+        payload = _object(payload, 'session')
+        user_id = payload.get('user_id')
+        if isinstance(user_id, int) and not isinstance(user_id, bool):
+            user_id = str(user_id)
+        user_id = _text(user_id, 'user_id', MAX_USER_ID_LENGTH) or 'anonymous'
+
+        is_public = payload.get('is_public', True)
+        if not isinstance(is_public, bool):
+            raise SessionError("is_public must be a boolean")
+
+        cycles = payload.get('cycles') or []
+        if not isinstance(cycles, list) or len(cycles) > MAX_CYCLES:
+            raise SessionError(f"cycles must be a list of at most {MAX_CYCLES} items")
+
+        final_score = _object(payload.get('final_score'), 'final_score')
+        language = _text(final_score.get('language'), 'final_score.language', 10) or None
+        return cls(
+            client_id=_uuid(payload.get('client_id'), 'client_id'),
+            user_id=user_id,
+            initial_score_id=_uuid(payload.get('initial_score_id'), 'initial_score_id'),
+            is_public=is_public,
+            transport=_choice(payload.get('transport'), 'transport', TRANSPORTS, 'telegram_webapp'),
+            final_score_text=_text(final_score.get('text'), 'final_score.text', MAX_SCORE_LENGTH),
+            final_score_language=language,
+            cycles=[Cycle.parse(c, f"cycles[{i}]") for i, c in enumerate(cycles)],
+        )
+
+    def to_rpc(self) -> dict:
+        """The ingest_session argument; cycle numbers are the list order."""
+        session = {
+            'client_id': self.client_id,
+            'user_id': self.user_id,
+            'initial_score_id': self.initial_score_id,
+            'is_public': self.is_public,
+            'transport': self.transport,
+            'cycles': [asdict(c) for c in self.cycles],
+        }
+        if self.final_score_text:
+            session['final_score'] = {'text': self.final_score_text, 'language': self.final_score_language}
+        return session
+
@@ -0,0 +1,96 @@
+"""
+LSRC score event buffer
+Listen / capsule events from the mini app (POST /api/events in server.py)
+are counted in memory per (score, type, hour) and written every few
+seconds with one ingest_score_events RPC call. The RPC applies the whole
+batch as atomic increments: score_events buckets and scores.usage_count.
+A burst of a thousand listens on one score becomes a single row update.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+from repository import SupabaseRepository
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('listen', 'capsule')
+FLUSH_INTERVAL = 5.0
+MAX_PENDING_KEYS = 5000
+
+
+def hour_bucket(at: Optional[float] = None) -> str:
+    moment = datetime.fromtimestamp(at if at is not None else time.time(), timezone.utc)
+    return moment.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+class EventBuffer:
+    def __init__(
+        self,
+        repo: SupabaseRepository,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_pending_keys: int = MAX_PENDING_KEYS,
+    ):
+        self.repo = repo
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self._pending: Counter[tuple[str, str, str]] = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, score_id: str, event_type: str, count: int = 1, at: Optional[float] = None) -> None:
+        """Count an event. Must be called on the buffer's event loop."""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event_type}")
+        key = (score_id, event_type, hour_bucket(at))
+        if key not in self._pending and len(self._pending) >= self.max_pending_keys:
+            # Upstream has been failing for a while; don't grow without bound
+            self.dropped += count
+            self._wakeup.set()
+            return
+        self._pending[key] += count
+        self.recorded += count
+        if len(self._pending) >= self.max_pending_keys // 2:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            batch, self._pending = self._pending, Counter()
+            if not batch:
+                return 0
+            events = [
+                {'score_id': score_id, 'event_type': event_type, 'bucket': bucket, 'count': count}
+                for (score_id, event_type, bucket), count in batch.items()
+            ]
+            try:
+                applied = await self.repo.ingest_score_events(events)
+            except Exception as e:
+                logger.error(f"Failed to write {len(events)} score event rows: {e}")
+                # Put them back; counts recorded meanwhile are merged in
+                batch.update(self._pending)
+                self._pending = batch
+                return 0
+            self.written += applied
+            return applied
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+        finally:
+            await self.flush()
@@ -0,0 +1,256 @@
+"""
+LSRC score lineage index
+In-memory graph of score continuations (scores.parent_score_id). Score ids
+are interned to dense ints; the tree is kept as flat int arrays (parent,
+first child / next sibling, depth, subtree size), so chain, depth, subtree
+size and "most continued" queries never touch the database.
+
+Load it in bulk from (id, parent_id) pairs, then add new scores one at a
+time. A parent that is not loaded yet (private, or newer than the last
+refresh) becomes a placeholder node and is filled in when it arrives.
+"""
+
+import heapq
+from array import array
+from typing import Iterable, Optional
+
+from repository import Score
+
+NONE = -1
+
+
+class LineageError(ValueError):
+    pass
+
+
+class LineageIndex:
+    def __init__(self):
+        self._ids: list[str] = []
+        self._index: dict[str, int] = {}
+        self._parent = array('i')
+        self._first_child = array('i')
+        self._next_sibling = array('i')
+        self._depth = array('i')
+        self._size = array('i')        # loaded scores in the subtree, self included
+        self._present = bytearray()    # 0 for placeholders
+        self._top: Optional[list[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._present) - self._present.count(0)
+
+    def __contains__(self, score_id: str) -> bool:
+        i = self._index.get(score_id)
+        return i is not None and bool(self._present[i])
+
+    # ---------- building ----------
+
+    def _intern(self, score_id: str) -> int:
+        i = self._index.get(score_id)
+        if i is None:
+            i = len(self._ids)
+            self._index[score_id] = i
+            self._ids.append(score_id)
+            self._parent.append(NONE)
+            self._first_child.append(NONE)
+            self._next_sibling.append(NONE)
+            self._depth.append(0)
+            self._size.append(0)
+            self._present.append(0)
+        return i
+
+    def _link(self, child: int, parent: int) -> None:
+        self._parent[child] = parent
+        self._next_sibling[child] = self._first_child[parent]
+        self._first_child[parent] = child
+
+    def _unlink(self, child: int) -> None:
+        parent = self._parent[child]
+        if parent == NONE:
+            return
+        prev, node = NONE, self._first_child[parent]
+        while node != child:
+            prev, node = node, self._next_sibling[node]
+        if prev == NONE:
+            self._first_child[parent] = self._next_sibling[child]
+        else:
+            self._next_sibling[prev] = self._next_sibling[child]
+        self._parent[child] = NONE
+        self._next_sibling[child] = NONE
+
+    def _add_size(self, node: int, delta: int) -> None:
+        while node != NONE:
+            self._size[node] += delta
+            node = self._parent[node]
+
+    def _shift_depth(self, root: int, delta: int) -> None:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            self._depth[node] += delta
+            child = self._first_child[node]
+            while child != NONE:
+                stack.append(child)
+                child = self._next_sibling[child]
+
+    def _is_ancestor(self, ancestor: int, node: int) -> bool:
+        while node != NONE:
+            if node == ancestor:
+                return True
+            node = self._parent[node]
+        return False
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[tuple[str, Optional[str]]]) -> 'LineageIndex':
+        index = cls()
+        index.load(pairs)
+        return index
+
+    @classmethod
+    def from_scores(cls, scores: Iterable[Score]) -> 'LineageIndex':
+        return cls.from_pairs((s.id, s.parent_score_id) for s in scores)
+
+    def load(self, pairs: Iterable[tuple[str, Optional[str]]]) -> None:
+        """Bulk load: link everything, then one pass for depth and sizes."""
+        for score_id, parent_id in pairs:
+            i = self._intern(score_id)
+            self._present[i] = 1
+            if parent_id and parent_id != score_id and self._parent[i] == NONE:
+                self._link(i, self._intern(parent_id))
+
+        n = len(self._ids)
+        order: list[int] = []
+        visited = bytearray(n)
+        for start in range(n):
+            if visited[start]:
+                continue
+            # Climb to the root; a revisited node on the way means a cycle,
+            # which is cut at the node where it closes
+            root, seen = start, set()
+            while self._parent[root] != NONE and not visited[root]:
+                seen.add(root)
+                if self._parent[root] in seen:
+                    self._unlink(root)
+                    break
+                root = self._parent[root]
+            if visited[root]:
+                continue
+
+            self._depth[root] = 0
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                visited[node] = 1
+                order.append(node)
+                child = self._first_child[node]
+                while child != NONE:
+                    self._depth[child] = self._depth[node] + 1
+                    stack.append(child)
+                    child = self._next_sibling[child]
+
+        for node in order:
+            self._size[node] = self._present[node]
+        for node in reversed(order):
+            parent = self._parent[node]
+            if parent != NONE:
+                self._size[parent] += self._size[node]
+        self._top = None
+
+    def add(self, score_id: str, parent_id: Optional[str] = None) -> None:
+        i = self._intern(score_id)
+        parent = self._intern(parent_id) if parent_id else NONE
+
+        if not self._present[i]:
+            self._present[i] = 1
+            self._add_size(i, 1)
+
+        if parent != self._parent[i]:
+            if parent != NONE and self._is_ancestor(i, parent):
+                raise LineageError(f"Score {score_id} cannot continue its own descendant {parent_id}")
+            size = self._size[i]
+            if self._parent[i] != NONE:
+                self._add_size(self._parent[i], -size)
+                self._unlink(i)
+            new_depth = 0
+            if parent != NONE:
+                self._link(i, parent)
+                self._add_size(parent, size)
+                new_depth = self._depth[parent] + 1
+            if new_depth != self._depth[i]:
+                self._shift_depth(i, new_depth - self._depth[i])
+        self._top = None
+
+    # ---------- queries ----------
+
+    def _node(self, score_id: str) -> int:
+        i = self._index.get(score_id)
+        if i is None:
+            raise KeyError(score_id)
+        return i
+
+    def parent(self, score_id: str) -> Optional[str]:
+        p = self._parent[self._node(score_id)]
+        return self._ids[p] if p != NONE else None
+
+    def children(self, score_id: str) -> list[str]:
+        result = []
+        child = self._first_child[self._node(score_id)]
+        while child != NONE:
+            result.append(self._ids[child])
+            child = self._next_sibling[child]
+        return result
+
+    def children_count(self, score_id: str) -> int:
+        count, child = 0, self._first_child[self._node(score_id)]
+        while child != NONE:
+            count += 1
+            child = self._next_sibling[child]
+        return count
+
+    def depth(self, score_id: str) -> int:
+        return self._depth[self._node(score_id)]
+
+    def subtree_size(self, score_id: str) -> int:
+        return self._size[self._node(score_id)]
+
+    def continuations(self, score_id: str) -> int:
+        """How many loaded scores continue this one, directly or further down."""
+        i = self._node(score_id)
+        return self._size[i] - self._present[i]
+
+    def chain(self, score_id: str) -> list[str]:
+        """Root-first path to the score. The root may be a placeholder."""
+        path, node = [], self._node(score_id)
+        while node != NONE:
+            path.append(self._ids[node])
+            node = self._parent[node]
+        path.reverse()
+        return path
+
+    def root(self, score_id: str) -> str:
+        node = self._node(score_id)
+        while self._parent[node] != NONE:
+            node = self._parent[node]
+        return self._ids[node]
+
+    def deepest_chain(self, score_id: str) -> list[str]:
+        """Root-to-leaf chain through the score, down its longest branch."""
+        start = self._node(score_id)
+        deepest, stack = start, [start]
+        while stack:
+            node = stack.pop()
+            if self._depth[node] > self._depth[deepest]:
+                deepest = node
+            child = self._first_child[node]
+            while child != NONE:
+                stack.append(child)
+                child = self._next_sibling[child]
+        return self.chain(self._ids[deepest])
+
+    def most_continued(self, limit: int = 10) -> list[tuple[str, int]]:
+        if self._top is None or len(self._top) < limit:
+            nodes = (i for i in range(len(self._ids)) if self._present[i])
+            self._top = heapq.nlargest(limit, nodes, key=lambda i: self._size[i])
+        return [
+            (self._ids[i], self._size[i] - 1)
+            for i in self._top[:limit] if self._size[i] > 1
+        ]
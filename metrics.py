@@ -0,0 +1,428 @@
+"""
+LSRC bot instrumentation
+Counters and latency histograms for the hot paths (update handlers,
+Supabase calls, OpenAI round trips, every Bot API request). They are
+rendered in Prometheus text format on /metrics.
+
+LoopMonitor measures event-loop lag. With a block threshold it also runs a
+watchdog thread: when the loop stops beating for longer than the threshold,
+the watchdog logs the loop thread's stack at that moment, which shows what
+is blocking it. StackSampler is an on-demand sampling profiler of the loop
+thread (/debug/profile, off unless enabled). It returns collapsed stacks
+that can be fed to flamegraph.pl or speedscope.
+
+No dependencies beyond the standard library; aiohttp is imported only
+when the endpoints are mounted.
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Counter
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LOOP_MONITOR_INTERVAL = 0.5
+MAX_PROFILE_SECONDS = 60.0
+PROFILE_INTERVAL = 0.005
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, values: tuple) -> tuple:
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+        return tuple(str(v) for v in values)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Incremented, or read from a callback at render time that returns
+    {label value(s): count} for counts another object already keeps."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], dict]] = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        if self.fn is not None:
+            try:
+                items = sorted(
+                    (self._key(k if isinstance(k, tuple) else (k,)), v) for k, v in self.fn().items()
+                )
+            except Exception as e:
+                logger.debug(f"Counter {self.name} failed: {e}")
+                return []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Metric):
+    """Set explicitly, or read from a callback at render time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        if self.fn is not None:
+            try:
+                return [f"{self.name} {_number(self.fn())}"]
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} failed: {e}")
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # per label set: [bucket counts..., sum, count]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def time(self, *labels) -> 'Timer':
+        return Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {int(series[-1])}")
+        return lines
+
+
+class Timer:
+    """with HISTOGRAM.time('label'): ... — works around awaits too."""
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Leave the block out of the measured time (e.g. a generator's yield)."""
+        paused = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.started += time.perf_counter() - paused
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        # Re-registering a name replaces it (the bot module can be reloaded)
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], dict]] = None) -> Counter:
+        return self.register(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram('lsrc_handler_seconds', 'Update handler duration', ('handler',))
+HANDLER_ERRORS = REGISTRY.counter('lsrc_handler_errors_total', 'Exceptions raised by update handlers', ('handler',))
+SUPABASE_SECONDS = REGISTRY.histogram(
+    'lsrc_supabase_seconds', 'Supabase call duration (PostgREST, RPC, storage)', ('call', 'outcome')
+)
+OPENAI_SECONDS = REGISTRY.histogram('lsrc_openai_seconds', 'OpenAI API round trip duration', ('op',))
+OPENAI_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    'lsrc_openai_first_token_seconds', 'Time from run start to the first streamed text delta'
+)
+TELEGRAM_SECONDS = REGISTRY.histogram('lsrc_telegram_seconds', 'Bot API request duration', ('method',))
+TELEGRAM_RESPONSES = REGISTRY.counter('lsrc_telegram_responses_total', 'Bot API responses by status', ('method', 'code'))
+LOOP_LAG_SECONDS = REGISTRY.histogram('lsrc_event_loop_lag_seconds', 'Event loop scheduling lag', buckets=LAG_BUCKETS)
+LOOP_BLOCKS = REGISTRY.counter('lsrc_event_loop_blocks_total', 'Times the loop was blocked past the threshold')
+STARTED_AT = time.time()
+REGISTRY.gauge('lsrc_process_start_time_seconds', 'Process start time, unix seconds', fn=lambda: STARTED_AT)
+
+
+def timed_handler(fn: Callable) -> Callable:
+    """Decorator for PTB callbacks: duration and raised exceptions per handler."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+# ============================================================
+# EVENT LOOP MONITOR
+# ============================================================
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, block_threshold: Optional[float] = None):
+        self.interval = interval
+        self.block_threshold = block_threshold or None
+        self.loop_thread_id: Optional[int] = None
+        self._beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Call from the loop being monitored."""
+        if self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.block_threshold:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - self.interval))
+            self._beat = time.monotonic()
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stop.wait(self.block_threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.block_threshold or beat == reported:
+                continue
+            # One report per stall; the stack is where the loop is stuck now
+            reported = beat
+            LOOP_BLOCKS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else '(no frame)'
+            logger.warning(f"Event loop blocked for over {stalled * 1000:.0f}ms, currently at:\n{stack}")
+
+
+# ============================================================
+# SAMPLING PROFILER
+# ============================================================
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack every interval; collapsed-stack output."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+
+    def sample(self, seconds: float) -> _Counter:
+        stacks: _Counter = _Counter()
+        deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stacks[_collapse(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+        return stacks
+
+    @staticmethod
+    def collapsed(stacks: _Counter) -> str:
+        return '\n'.join(f"{stack} {n}" for stack, n in stacks.most_common()) + '\n'
+
+
+# ============================================================
+# HTTP ENDPOINTS (aiohttp)
+# ============================================================
+
+def add_routes(app, monitor: Optional[LoopMonitor] = None, token: Optional[str] = None, profiler: bool = False) -> None:
+    """Mount /metrics (and /debug/profile if enabled) on an aiohttp app.
+    The profiler is only mounted with a token."""
+    import hmac
+    from aiohttp import web
+
+    if profiler and not token:
+        logger.warning("PROFILER_ENABLED needs METRICS_TOKEN; /debug/profile is off")
+        profiler = False
+
+    def authorized(request) -> bool:
+        if not token:
+            return True
+        received = request.headers.get('Authorization', '')
+        return hmac.compare_digest(received, f"Bearer {token}")
+
+    async def handle_metrics(request):
+        if not authorized(request):
+            return web.Response(status=401)
+        return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def handle_profile(request):
+        if not authorized(request):
+            return web.Response(status=401)
+        if monitor is None or monitor.loop_thread_id is None:
+            return web.Response(status=503, text='loop monitor not running\n')
+        try:
+            seconds = float(request.query.get('seconds', '10'))
+        except ValueError:
+            return web.Response(status=400, text='seconds must be a number\n')
+        sampler = StackSampler(monitor.loop_thread_id)
+        # Samples from a worker thread while the loop keeps serving
+        stacks = await asyncio.to_thread(sampler.sample, max(0.1, seconds))
+        return web.Response(text=StackSampler.collapsed(stacks), content_type='text/plain')
+
+    app.router.add_get('/metrics', handle_metrics)
+    if profiler:
+        app.router.add_get('/debug/profile', handle_profile)
+
+
+class MetricsServer:
+    """Standalone /metrics listener, for polling mode or a separate port."""
+
+    def __init__(self, monitor: Optional[LoopMonitor] = None, token: Optional[str] = None, profiler: bool = False):
+        from aiohttp import web
+
+        self.app = web.Application()
+        add_routes(self.app, monitor, token, profiler)
+        self._runner = None
+
+    async def start(self, host: str, port: int) -> None:
+        from aiohttp import web
+
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Metrics on {host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
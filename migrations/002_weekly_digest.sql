@@ -0,0 +1,39 @@
+-- Weekly digest aggregation: per-author listens in a time window + top score
+-- Listens are capsules started from the author's score (capsules.initial_score_id)
+-- Run this in Supabase SQL Editor
+
+CREATE OR REPLACE FUNCTION weekly_digest(
+  since TIMESTAMPTZ,
+  after_author TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 500
+)
+RETURNS TABLE (
+  author_user_id TEXT,
+  total_listens BIGINT,
+  top_score_id UUID,
+  top_score_text TEXT,
+  top_score_listens BIGINT
+) AS $$
+  WITH listens AS (
+    SELECT s.author_user_id, s.id AS score_id, s.text, COUNT(*) AS listens
+    FROM capsules c
+    JOIN scores s ON s.id = c.initial_score_id
+    WHERE c.created_at >= since
+      AND s.is_public = true
+      AND s.author_user_id IS NOT NULL
+      AND (after_author IS NULL OR s.author_user_id > after_author)
+    GROUP BY s.author_user_id, s.id, s.text
+  ),
+  ranked AS (
+    SELECT
+      l.*,
+      SUM(l.listens) OVER (PARTITION BY l.author_user_id) AS total_listens,
+      ROW_NUMBER() OVER (PARTITION BY l.author_user_id ORDER BY l.listens DESC, l.score_id) AS rn
+    FROM listens l
+  )
+  SELECT author_user_id, total_listens::BIGINT, score_id, text, listens
+  FROM ranked
+  WHERE rn = 1
+  ORDER BY author_user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE;
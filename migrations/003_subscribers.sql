@@ -0,0 +1,77 @@
+-- Distinct subscriber list for scheduled jobs (daily push, weekly digest)
+-- One row per user, kept in sync from capsules; paged by user_id (keyset)
+-- Run this in Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS subscribers (
+  user_id TEXT PRIMARY KEY,
+  first_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO subscribers (user_id, first_seen_at, last_seen_at)
+SELECT user_id, MIN(created_at), MAX(created_at)
+FROM capsules
+WHERE user_id IS NOT NULL AND user_id <> ''
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION track_subscriber()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO subscribers (user_id, first_seen_at, last_seen_at)
+  VALUES (NEW.user_id, NEW.created_at, NEW.created_at)
+  ON CONFLICT (user_id) DO UPDATE
+    SET last_seen_at = GREATEST(subscribers.last_seen_at, EXCLUDED.last_seen_at);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS on_capsule_insert_subscriber ON capsules;
+CREATE TRIGGER on_capsule_insert_subscriber
+  AFTER INSERT ON capsules
+  FOR EACH ROW
+  EXECUTE FUNCTION track_subscriber();
+
+ALTER TABLE subscribers ENABLE ROW LEVEL SECURITY;
+
+-- Dropped in 017_subscribers_private.sql: USING (true) exposed the table to anon
+CREATE POLICY "Subscribers are viewable by the bot"
+  ON subscribers FOR SELECT
+  USING (true);
+
+-- Digest only goes to authors we know as subscribers
+CREATE OR REPLACE FUNCTION weekly_digest(
+  since TIMESTAMPTZ,
+  after_author TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 500
+)
+RETURNS TABLE (
+  author_user_id TEXT,
+  total_listens BIGINT,
+  top_score_id UUID,
+  top_score_text TEXT,
+  top_score_listens BIGINT
+) AS $$
+  WITH listens AS (
+    SELECT s.author_user_id, s.id AS score_id, s.text, COUNT(*) AS listens
+    FROM capsules c
+    JOIN scores s ON s.id = c.initial_score_id
+    JOIN subscribers sub ON sub.user_id = s.author_user_id
+    WHERE c.created_at >= since
+      AND s.is_public = true
+      AND (after_author IS NULL OR s.author_user_id > after_author)
+    GROUP BY s.author_user_id, s.id, s.text
+  ),
+  ranked AS (
+    SELECT
+      l.*,
+      SUM(l.listens) OVER (PARTITION BY l.author_user_id) AS total_listens,
+      ROW_NUMBER() OVER (PARTITION BY l.author_user_id ORDER BY l.listens DESC, l.score_id) AS rn
+    FROM listens l
+  )
+  SELECT author_user_id, total_listens::BIGINT, score_id, text, listens
+  FROM ranked
+  WHERE rn = 1
+  ORDER BY author_user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE;
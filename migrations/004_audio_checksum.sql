@@ -0,0 +1,4 @@
+-- Content checksum for uploaded audio, computed while streaming the upload
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
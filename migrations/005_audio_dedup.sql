@@ -0,0 +1,8 @@
+-- Content-addressed audio: Telegram file_unique_id + checksum lookups
+-- Repeated voice notes reuse the stored object; each upload still gets its own row
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS file_unique_id TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_audio_files_unique_id ON audio_files(file_unique_id);
+CREATE INDEX IF NOT EXISTS idx_audio_files_sha256 ON audio_files(content_sha256);
@@ -0,0 +1,44 @@
+-- Audio post-processing results (filled by audio_worker.py)
+-- waveform_peaks: 0-255 peak amplitude per bin, relative to full scale
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS rms_dbfs FLOAT;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS peak_dbfs FLOAT;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS waveform_peaks SMALLINT[];
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS analysis_error TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_audio_files_path ON audio_files(file_path);
+CREATE INDEX IF NOT EXISTS idx_audio_files_unprocessed
+  ON audio_files(created_at) WHERE processed_at IS NULL;
+
+-- Batch write-back: one call per batch, every row sharing a stored object
+-- (deduplicated uploads) gets the same results
+CREATE OR REPLACE FUNCTION apply_audio_analysis(results JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  updated INTEGER;
+BEGIN
+  UPDATE audio_files a
+  SET
+    duration_seconds = r.duration_seconds,
+    rms_dbfs = r.rms_dbfs,
+    peak_dbfs = r.peak_dbfs,
+    waveform_peaks = r.waveform_peaks,
+    analysis_error = r.error,
+    processed_at = NOW()
+  FROM jsonb_to_recordset(results) AS r(
+    file_path TEXT,
+    duration_seconds FLOAT,
+    rms_dbfs FLOAT,
+    peak_dbfs FLOAT,
+    waveform_peaks SMALLINT[],
+    error TEXT
+  )
+  WHERE a.file_path = r.file_path
+    AND a.processed_at IS NULL;
+
+  GET DIAGNOSTICS updated = ROW_COUNT;
+  RETURN updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
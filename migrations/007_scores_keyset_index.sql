@@ -0,0 +1,12 @@
+-- Keyset index for the score feed API (server.py /api/scores)
+-- Run this in Supabase SQL Editor
+--
+-- The feed pages newest-first on (created_at, id) among public scores.
+-- idx_scores_public has no id, so ties on created_at (bulk seeds insert
+-- many rows in one transaction) needed a sort; this index covers the
+-- full keyset and replaces it.
+
+CREATE INDEX IF NOT EXISTS idx_scores_public_keyset
+  ON scores(is_public, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_scores_public;
@@ -0,0 +1,103 @@
+-- Score events: hourly per-score counters for listens and capsules
+-- Written in batches by ingest_score_events (server.py buffers /api/events);
+-- usage_count is bumped in the same statement, atomically, instead of the
+-- mini app's read-modify-write update. The weekly digest reads a time range
+-- of buckets instead of scanning capsules.
+-- Run this in Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS score_events (
+  bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+  event_type TEXT NOT NULL CHECK (event_type IN ('listen', 'capsule')),
+  score_id UUID NOT NULL REFERENCES scores(id) ON DELETE CASCADE,
+  count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket, event_type, score_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_score_events_score ON score_events(score_id, bucket);
+
+ALTER TABLE score_events ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Score events are viewable by everyone"
+  ON score_events FOR SELECT
+  USING (true);
+
+-- events: [{"score_id": "...", "event_type": "listen", "count": 3, "bucket": "2025-01-01T10:00:00Z"}]
+-- bucket is optional (defaults to now) and is truncated to the hour.
+-- Returns the number of events applied.
+CREATE OR REPLACE FUNCTION ingest_score_events(events JSONB)
+RETURNS BIGINT AS $$
+  -- One statement, one transaction. Duplicates inside the batch are summed
+  -- first: ON CONFLICT may touch each row only once
+  WITH incoming AS (
+    SELECT
+      date_trunc('hour', LEAST(COALESCE(e.bucket, NOW()), NOW())) AS bucket,
+      e.event_type,
+      e.score_id,
+      SUM(LEAST(GREATEST(COALESCE(e.count, 1), 0), 10000))::INTEGER AS count
+    FROM jsonb_to_recordset(events) AS e(score_id UUID, event_type TEXT, count INTEGER, bucket TIMESTAMPTZ)
+    JOIN scores s ON s.id = e.score_id
+    WHERE e.event_type IN ('listen', 'capsule')
+    GROUP BY 1, 2, 3
+    HAVING SUM(LEAST(GREATEST(COALESCE(e.count, 1), 0), 10000)) > 0
+  ),
+  counted AS (
+    INSERT INTO score_events (bucket, event_type, score_id, count)
+    SELECT bucket, event_type, score_id, count FROM incoming
+    ON CONFLICT (bucket, event_type, score_id) DO UPDATE
+      SET count = score_events.count + EXCLUDED.count
+  ),
+  used AS (
+    UPDATE scores s
+    SET usage_count = s.usage_count + l.listens
+    FROM (
+      SELECT score_id, SUM(count) AS listens
+      FROM incoming
+      WHERE event_type = 'listen'
+      GROUP BY score_id
+    ) l
+    WHERE s.id = l.score_id
+  )
+  SELECT COALESCE(SUM(count), 0)::BIGINT FROM incoming;
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER;
+
+-- usage_count now comes from listen events; the per-capsule trigger from
+-- create_database.sql would count each session twice
+DROP TRIGGER IF EXISTS on_capsule_insert ON capsules;
+
+-- Weekly digest: range scan over hourly listen buckets
+CREATE OR REPLACE FUNCTION weekly_digest(
+  since TIMESTAMPTZ,
+  after_author TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 500
+)
+RETURNS TABLE (
+  author_user_id TEXT,
+  total_listens BIGINT,
+  top_score_id UUID,
+  top_score_text TEXT,
+  top_score_listens BIGINT
+) AS $$
+  WITH listens AS (
+    SELECT s.author_user_id, s.id AS score_id, s.text, SUM(e.count) AS listens
+    FROM score_events e
+    JOIN scores s ON s.id = e.score_id
+    JOIN subscribers sub ON sub.user_id = s.author_user_id
+    WHERE e.bucket >= date_trunc('hour', since)
+      AND e.event_type = 'listen'
+      AND s.is_public = true
+      AND (after_author IS NULL OR s.author_user_id > after_author)
+    GROUP BY s.author_user_id, s.id, s.text
+  ),
+  ranked AS (
+    SELECT
+      l.*,
+      SUM(l.listens) OVER (PARTITION BY l.author_user_id) AS total_listens,
+      ROW_NUMBER() OVER (PARTITION BY l.author_user_id ORDER BY l.listens DESC, l.score_id) AS rn
+    FROM listens l
+  )
+  SELECT author_user_id, total_listens::BIGINT, score_id, text, listens::BIGINT
+  FROM ranked
+  WHERE rn = 1
+  ORDER BY author_user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE;
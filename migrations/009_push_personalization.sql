@@ -0,0 +1,68 @@
+-- Personalized daily push: subscriber language, delivery history, audience RPC
+-- The bot picks a score per user (personalize.py): not their own, not one
+-- they already received, in their language when possible.
+-- Run this in Supabase SQL Editor
+
+-- Telegram language_code (e.g. 'en', 'ru', 'pt-br'), set by the bot
+ALTER TABLE subscribers ADD COLUMN IF NOT EXISTS language_code TEXT;
+
+CREATE OR REPLACE FUNCTION upsert_subscriber(p_user_id TEXT, p_language_code TEXT)
+RETURNS void AS $$
+  INSERT INTO subscribers (user_id, language_code)
+  VALUES (p_user_id, p_language_code)
+  ON CONFLICT (user_id) DO UPDATE
+    SET language_code = COALESCE(EXCLUDED.language_code, subscribers.language_code),
+        last_seen_at = NOW();
+$$ LANGUAGE sql SECURITY DEFINER;
+
+CREATE TABLE IF NOT EXISTS push_deliveries (
+  user_id TEXT NOT NULL,
+  score_id UUID NOT NULL REFERENCES scores(id) ON DELETE CASCADE,
+  delivered_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (user_id, score_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_push_deliveries_delivered ON push_deliveries(delivered_at);
+
+-- No policies: only reachable through the SECURITY DEFINER functions below,
+-- which are executable by service_role only (016_subscriber_functions_service_role.sql)
+ALTER TABLE push_deliveries ENABLE ROW LEVEL SECURITY;
+
+-- deliveries: [{"user_id": "123", "score_id": "..."}]
+CREATE OR REPLACE FUNCTION record_push_deliveries(deliveries JSONB)
+RETURNS BIGINT AS $$
+  WITH recorded AS (
+    INSERT INTO push_deliveries (user_id, score_id)
+    SELECT DISTINCT d.user_id, d.score_id
+    FROM jsonb_to_recordset(deliveries) AS d(user_id TEXT, score_id UUID)
+    JOIN scores s ON s.id = d.score_id
+    ON CONFLICT (user_id, score_id) DO UPDATE SET delivered_at = NOW()
+    RETURNING 1
+  )
+  SELECT COUNT(*) FROM recorded;
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER;
+
+-- One page of the push audience: each subscriber with their language and
+-- the scores they received since `since`, keyset-paged by user_id
+CREATE OR REPLACE FUNCTION push_audience_page(
+  since TIMESTAMPTZ,
+  after_user TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+  user_id TEXT,
+  language_code TEXT,
+  received UUID[]
+) AS $$
+  SELECT
+    sub.user_id,
+    sub.language_code,
+    ARRAY(
+      SELECT d.score_id FROM push_deliveries d
+      WHERE d.user_id = sub.user_id AND d.delivered_at >= since
+    )
+  FROM subscribers sub
+  WHERE after_user IS NULL OR sub.user_id > after_user
+  ORDER BY sub.user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
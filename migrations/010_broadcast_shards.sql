@@ -0,0 +1,124 @@
+-- Sharded, resumable broadcasts (daily push, weekly digest)
+-- Subscribers are hashed into 96 shards; the bot sends each time slot's
+-- shard range as a small job and checkpoints after every chunk, so a
+-- restart resumes after the last user instead of re-sending or skipping.
+-- Run this in Supabase SQL Editor
+
+-- hashtext() may be negative; ((h % n) + n) % n keeps it in 0..95
+ALTER TABLE subscribers ADD COLUMN IF NOT EXISTS shard SMALLINT
+  GENERATED ALWAYS AS ((((hashtext(user_id) % 96) + 96) % 96)::SMALLINT) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_subscribers_shard ON subscribers(shard, user_id);
+
+-- ---------- checkpoints ----------
+
+CREATE TABLE IF NOT EXISTS broadcast_checkpoints (
+  job TEXT NOT NULL,
+  run_key TEXT NOT NULL,
+  slot INTEGER NOT NULL,
+  last_user_id TEXT,
+  sent INTEGER NOT NULL DEFAULT 0,
+  completed_at TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (job, run_key, slot)
+);
+
+-- No policies: only reachable through the SECURITY DEFINER functions below
+ALTER TABLE broadcast_checkpoints ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION get_broadcast_checkpoint(p_job TEXT, p_run_key TEXT, p_slot INTEGER)
+RETURNS TABLE (last_user_id TEXT, sent INTEGER, completed_at TIMESTAMPTZ) AS $$
+  SELECT c.last_user_id, c.sent, c.completed_at
+  FROM broadcast_checkpoints c
+  WHERE c.job = p_job AND c.run_key = p_run_key AND c.slot = p_slot;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION save_broadcast_checkpoint(
+  p_job TEXT,
+  p_run_key TEXT,
+  p_slot INTEGER,
+  p_last_user_id TEXT,
+  p_sent INTEGER,
+  p_completed BOOLEAN DEFAULT false
+)
+RETURNS void AS $$
+  INSERT INTO broadcast_checkpoints (job, run_key, slot, last_user_id, sent, completed_at, updated_at)
+  VALUES (p_job, p_run_key, p_slot, p_last_user_id, p_sent, CASE WHEN p_completed THEN NOW() END, NOW())
+  ON CONFLICT (job, run_key, slot) DO UPDATE
+    SET last_user_id = COALESCE(EXCLUDED.last_user_id, broadcast_checkpoints.last_user_id),
+        sent = EXCLUDED.sent,
+        completed_at = COALESCE(broadcast_checkpoints.completed_at, EXCLUDED.completed_at),
+        updated_at = NOW();
+$$ LANGUAGE sql SECURITY DEFINER;
+
+-- ---------- shard-aware pages (shard_lo inclusive, shard_hi exclusive) ----------
+
+DROP FUNCTION IF EXISTS push_audience_page(TIMESTAMPTZ, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION push_audience_page(
+  since TIMESTAMPTZ,
+  after_user TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 1000,
+  shard_lo INTEGER DEFAULT 0,
+  shard_hi INTEGER DEFAULT 96
+)
+RETURNS TABLE (
+  user_id TEXT,
+  language_code TEXT,
+  received UUID[]
+) AS $$
+  SELECT
+    sub.user_id,
+    sub.language_code,
+    ARRAY(
+      SELECT d.score_id FROM push_deliveries d
+      WHERE d.user_id = sub.user_id AND d.delivered_at >= since
+    )
+  FROM subscribers sub
+  WHERE sub.shard >= shard_lo AND sub.shard < shard_hi
+    AND (after_user IS NULL OR sub.user_id > after_user)
+  ORDER BY sub.user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+DROP FUNCTION IF EXISTS weekly_digest(TIMESTAMPTZ, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION weekly_digest(
+  since TIMESTAMPTZ,
+  after_author TEXT DEFAULT NULL,
+  page_size INTEGER DEFAULT 500,
+  shard_lo INTEGER DEFAULT 0,
+  shard_hi INTEGER DEFAULT 96
+)
+RETURNS TABLE (
+  author_user_id TEXT,
+  total_listens BIGINT,
+  top_score_id UUID,
+  top_score_text TEXT,
+  top_score_listens BIGINT
+) AS $$
+  WITH listens AS (
+    SELECT s.author_user_id, s.id AS score_id, s.text, SUM(e.count) AS listens
+    FROM score_events e
+    JOIN scores s ON s.id = e.score_id
+    JOIN subscribers sub ON sub.user_id = s.author_user_id
+    WHERE e.bucket >= date_trunc('hour', since)
+      AND e.event_type = 'listen'
+      AND s.is_public = true
+      AND sub.shard >= shard_lo AND sub.shard < shard_hi
+      AND (after_author IS NULL OR s.author_user_id > after_author)
+    GROUP BY s.author_user_id, s.id, s.text
+  ),
+  ranked AS (
+    SELECT
+      l.*,
+      SUM(l.listens) OVER (PARTITION BY l.author_user_id) AS total_listens,
+      ROW_NUMBER() OVER (PARTITION BY l.author_user_id ORDER BY l.listens DESC, l.score_id) AS rn
+    FROM listens l
+  )
+  SELECT author_user_id, total_listens::BIGINT, score_id, text, listens::BIGINT
+  FROM ranked
+  WHERE rn = 1
+  ORDER BY author_user_id
+  LIMIT page_size;
+$$ LANGUAGE sql STABLE;
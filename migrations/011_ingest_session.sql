@@ -0,0 +1,122 @@
+-- Whole-session ingest: capsule, final score, fragments and reflections in
+-- one call and one transaction (server.py POST /api/sessions, capsules.py).
+-- The mini app used to write them one request at a time, 2N+1 round trips,
+-- and a dropped connection left half-saved capsules behind.
+-- client_id is generated by the mini app per session, so a retried upload
+-- returns the capsule it already created instead of a second one.
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE capsules ADD COLUMN IF NOT EXISTS client_id UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_capsules_client_id ON capsules(client_id);
+
+-- session:
+-- {
+--   "client_id": "...", "user_id": "123", "initial_score_id": "...",
+--   "is_public": true, "transport": "telegram_webapp",
+--   "final_score": {"text": "...", "language": "en"},          -- optional
+--   "cycles": [{
+--     "listen_source": "environment",
+--     "listen_audio_id": "...", "sound_audio_id": "...",      -- optional
+--     "reflection": {"text": "...", "audio_id": null,          -- optional
+--                    "transcription_source": "user_typed", "keywords": []}
+--   }]
+-- }
+-- Audio ids are linked only if the file exists and belongs to user_id.
+-- That is a consistency check, not access control: the function is callable
+-- with the anon key and user_id is whatever the payload says (Telegram
+-- initData is not verified), so a caller can claim any user_id and link
+-- that user's audio. Don't rely on it to keep audio private.
+-- Returns {"capsule_id", "final_score_id", "fragments", "created"}, or
+-- {"error": "initial_score_not_found"}.
+CREATE OR REPLACE FUNCTION ingest_session(session JSONB)
+RETURNS JSONB AS $$
+DECLARE
+  p_client_id UUID := (session->>'client_id')::UUID;
+  p_user_id TEXT := session->>'user_id';
+  p_initial_score_id UUID := (session->>'initial_score_id')::UUID;
+  p_is_public BOOLEAN := COALESCE((session->>'is_public')::BOOLEAN, true);
+  v_capsule_id UUID;
+  v_final_score_id UUID;
+  v_fragments INTEGER;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM scores WHERE id = p_initial_score_id) THEN
+    RETURN jsonb_build_object('error', 'initial_score_not_found');
+  END IF;
+
+  -- A concurrent retry waits on the unique index here, then sees the conflict
+  INSERT INTO capsules (client_id, user_id, initial_score_id, is_public, transport)
+  VALUES (
+    p_client_id, p_user_id, p_initial_score_id, p_is_public,
+    COALESCE(session->>'transport', 'telegram_webapp')
+  )
+  ON CONFLICT (client_id) DO NOTHING
+  RETURNING id INTO v_capsule_id;
+
+  IF v_capsule_id IS NULL THEN
+    SELECT c.id, c.final_score_id,
+      (SELECT COUNT(*) FROM fragments f WHERE f.capsule_id = c.id)::INTEGER
+    INTO v_capsule_id, v_final_score_id, v_fragments
+    FROM capsules c
+    WHERE c.client_id = p_client_id;
+    RETURN jsonb_build_object(
+      'capsule_id', v_capsule_id, 'final_score_id', v_final_score_id,
+      'fragments', v_fragments, 'created', false
+    );
+  END IF;
+
+  IF NULLIF(btrim(session->'final_score'->>'text'), '') IS NOT NULL THEN
+    INSERT INTO scores (text, author_user_id, source, is_public, parent_score_id, language)
+    VALUES (
+      btrim(session->'final_score'->>'text'), p_user_id, 'user_created', p_is_public,
+      p_initial_score_id, COALESCE(session->'final_score'->>'language', 'en')
+    )
+    RETURNING id INTO v_final_score_id;
+
+    UPDATE capsules SET final_score_id = v_final_score_id WHERE id = v_capsule_id;
+  END IF;
+
+  WITH cycles AS (
+    SELECT c.value AS cycle, c.ordinality::INTEGER AS cycle_number
+    FROM jsonb_array_elements(COALESCE(session->'cycles', '[]'::JSONB)) WITH ORDINALITY AS c
+  ),
+  inserted AS (
+    INSERT INTO fragments (capsule_id, cycle_number, listen_source, listen_audio_id, sound_audio_id)
+    SELECT
+      v_capsule_id,
+      cycles.cycle_number,
+      COALESCE(cycles.cycle->>'listen_source', 'environment'),
+      (SELECT a.id FROM audio_files a
+       WHERE a.id = (cycles.cycle->>'listen_audio_id')::UUID AND a.user_id = p_user_id),
+      (SELECT a.id FROM audio_files a
+       WHERE a.id = (cycles.cycle->>'sound_audio_id')::UUID AND a.user_id = p_user_id)
+    FROM cycles
+    RETURNING id, cycle_number
+  ),
+  reflected AS (
+    INSERT INTO reflections (fragment_id, audio_id, text, keywords, transcription_source)
+    SELECT
+      inserted.id,
+      (SELECT a.id FROM audio_files a
+       WHERE a.id = (r.value->>'audio_id')::UUID AND a.user_id = p_user_id),
+      btrim(r.value->>'text'),
+      ARRAY(SELECT jsonb_array_elements_text(COALESCE(r.value->'keywords', '[]'::JSONB))),
+      COALESCE(r.value->>'transcription_source', 'user_typed')
+    FROM inserted
+    JOIN cycles ON cycles.cycle_number = inserted.cycle_number
+    CROSS JOIN LATERAL (SELECT cycles.cycle->'reflection' AS value) r
+    WHERE NULLIF(btrim(r.value->>'text'), '') IS NOT NULL
+  )
+  SELECT COUNT(*)::INTEGER INTO v_fragments FROM inserted;
+
+  -- Same hourly capsule counter the mini app used to bump via /api/events
+  PERFORM ingest_score_events(jsonb_build_array(jsonb_build_object(
+    'score_id', p_initial_score_id, 'event_type', 'capsule', 'count', 1
+  )));
+
+  RETURN jsonb_build_object(
+    'capsule_id', v_capsule_id, 'final_score_id', v_final_score_id,
+    'fragments', v_fragments, 'created', true
+  );
+END;
+$$ LANGUAGE plpgsql VOLATILE SECURITY DEFINER;
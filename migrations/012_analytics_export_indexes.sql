@@ -0,0 +1,12 @@
+-- Keyset indexes for the analytics snapshot (analytics_snapshot.py)
+-- Run this in Supabase SQL Editor
+--
+-- The export reads each table in ascending (created_at, id) order after
+-- its watermark. fragments had no created_at index at all, and the others
+-- only cover created_at, so ties (one ingest_session call writes every
+-- fragment of a capsule with the same NOW()) needed a sort.
+
+CREATE INDEX IF NOT EXISTS idx_scores_created_keyset ON scores(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_capsules_created_keyset ON capsules(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_fragments_created_keyset ON fragments(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_audio_files_created_keyset ON audio_files(created_at, id);
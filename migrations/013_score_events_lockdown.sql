@@ -0,0 +1,20 @@
+-- ingest_score_events trusts the caller's count (up to 10000 per row) and
+-- bucket (any past hour): right for server.py's batches, but as an anon RPC
+-- it let anyone inflate usage_count and rewrite past digests.
+-- It is now for service_role only; server.py flushes /api/events with
+-- SUPABASE_SERVICE_ROLE_KEY. ingest_session still calls it (SECURITY
+-- DEFINER runs as the owner). The mini app's direct fallback, where there is
+-- no server.py (Vercel), is record_score_event: one event, the current hour.
+-- Run this in Supabase SQL Editor
+
+REVOKE EXECUTE ON FUNCTION ingest_score_events(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ingest_score_events(JSONB) TO service_role;
+
+CREATE OR REPLACE FUNCTION record_score_event(score_id UUID, event_type TEXT)
+RETURNS BIGINT AS $$
+  SELECT ingest_score_events(jsonb_build_array(jsonb_build_object(
+    'score_id', record_score_event.score_id,
+    'event_type', record_score_event.event_type,
+    'count', 1
+  )));
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER;
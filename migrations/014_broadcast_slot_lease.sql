@@ -0,0 +1,78 @@
+-- Broadcast slot leases
+-- Every bot process schedules the same slots, and checkpoints alone did not
+-- stop two of them from sending one slot at the same time. A process now
+-- claims the slot first: one upsert that takes the lease only if the slot
+-- is not completed and nobody else holds a live lease. Each checkpoint save
+-- renews the lease and fails once it belongs to someone else.
+-- Deploy together with the bot: save_broadcast_checkpoint takes p_owner now.
+-- Run this in Supabase SQL Editor
+
+ALTER TABLE broadcast_checkpoints ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE broadcast_checkpoints ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP WITH TIME ZONE;
+
+-- claimed = false: completed, or leased by another owner until lease_until
+CREATE OR REPLACE FUNCTION claim_broadcast_slot(
+  p_job TEXT,
+  p_run_key TEXT,
+  p_slot INTEGER,
+  p_owner TEXT,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (
+  claimed BOOLEAN,
+  last_user_id TEXT,
+  sent INTEGER,
+  completed_at TIMESTAMPTZ,
+  lease_until TIMESTAMPTZ
+) AS $$
+#variable_conflict use_column
+BEGIN
+  -- A concurrent claim of a new slot waits on the primary key here, then
+  -- sees the winner's lease in the WHERE
+  RETURN QUERY
+  INSERT INTO broadcast_checkpoints AS c (job, run_key, slot, lease_owner, lease_until, updated_at)
+  VALUES (p_job, p_run_key, p_slot, p_owner, NOW() + make_interval(secs => p_lease_seconds), NOW())
+  ON CONFLICT (job, run_key, slot) DO UPDATE
+    SET lease_owner = EXCLUDED.lease_owner,
+        lease_until = EXCLUDED.lease_until,
+        updated_at = NOW()
+    WHERE c.completed_at IS NULL
+      AND (c.lease_until IS NULL OR c.lease_until < NOW() OR c.lease_owner = p_owner)
+  RETURNING true, c.last_user_id, c.sent, c.completed_at, c.lease_until;
+
+  IF NOT FOUND THEN
+    RETURN QUERY
+    SELECT false, c.last_user_id, c.sent, c.completed_at, c.lease_until
+    FROM broadcast_checkpoints c
+    WHERE c.job = p_job AND c.run_key = p_run_key AND c.slot = p_slot;
+  END IF;
+END;
+$$ LANGUAGE plpgsql VOLATILE SECURITY DEFINER;
+
+DROP FUNCTION IF EXISTS save_broadcast_checkpoint(TEXT, TEXT, INTEGER, TEXT, INTEGER, BOOLEAN);
+
+-- Returns false if p_owner no longer holds the slot (the caller must stop)
+CREATE OR REPLACE FUNCTION save_broadcast_checkpoint(
+  p_job TEXT,
+  p_run_key TEXT,
+  p_slot INTEGER,
+  p_owner TEXT,
+  p_last_user_id TEXT,
+  p_sent INTEGER,
+  p_completed BOOLEAN DEFAULT false,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS BOOLEAN AS $$
+  WITH saved AS (
+    UPDATE broadcast_checkpoints c
+    SET last_user_id = COALESCE(p_last_user_id, c.last_user_id),
+        sent = p_sent,
+        completed_at = CASE WHEN p_completed THEN NOW() END,
+        lease_until = CASE WHEN p_completed THEN NULL ELSE NOW() + make_interval(secs => p_lease_seconds) END,
+        updated_at = NOW()
+    WHERE c.job = p_job AND c.run_key = p_run_key AND c.slot = p_slot
+      AND c.lease_owner = p_owner AND c.completed_at IS NULL
+    RETURNING 1
+  )
+  SELECT EXISTS (SELECT 1 FROM saved);
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER;
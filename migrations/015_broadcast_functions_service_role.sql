@@ -0,0 +1,17 @@
+-- Broadcast checkpoint and lease functions are for the bot only
+-- They are SECURITY DEFINER and were executable by PUBLIC, so anyone with
+-- the anon key (it ships in config.js) could take a slot's lease or mark
+-- it completed and silently suppress the daily push or weekly digest.
+-- The bot calls them with SUPABASE_SERVICE_ROLE_KEY.
+-- Run this in Supabase SQL Editor
+
+REVOKE EXECUTE ON FUNCTION get_broadcast_checkpoint(TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_broadcast_checkpoint(TEXT, TEXT, INTEGER) TO service_role;
+
+REVOKE EXECUTE ON FUNCTION claim_broadcast_slot(TEXT, TEXT, INTEGER, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_broadcast_slot(TEXT, TEXT, INTEGER, TEXT, INTEGER) TO service_role;
+
+REVOKE EXECUTE ON FUNCTION save_broadcast_checkpoint(TEXT, TEXT, INTEGER, TEXT, TEXT, INTEGER, BOOLEAN, INTEGER)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION save_broadcast_checkpoint(TEXT, TEXT, INTEGER, TEXT, TEXT, INTEGER, BOOLEAN, INTEGER)
+  TO service_role;
@@ -0,0 +1,19 @@
+-- Subscriber and push-history functions are for the bot only
+-- push_deliveries has RLS without policies, but the SECURITY DEFINER
+-- functions around it were executable by PUBLIC: with the anon key anyone
+-- could page through every subscriber's id, language and push history, or
+-- record fake deliveries that keep real scores out of personalization.
+-- The bot calls them with SUPABASE_SERVICE_ROLE_KEY.
+-- Run this in Supabase SQL Editor
+
+REVOKE EXECUTE ON FUNCTION upsert_subscriber(TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION upsert_subscriber(TEXT, TEXT) TO service_role;
+
+REVOKE EXECUTE ON FUNCTION record_push_deliveries(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION record_push_deliveries(JSONB) TO service_role;
+
+-- The shard-aware version from 010 (the 009 one was dropped there)
+REVOKE EXECUTE ON FUNCTION push_audience_page(TIMESTAMPTZ, TEXT, INTEGER, INTEGER, INTEGER)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION push_audience_page(TIMESTAMPTZ, TEXT, INTEGER, INTEGER, INTEGER)
+  TO service_role;
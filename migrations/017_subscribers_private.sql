@@ -0,0 +1,12 @@
+-- subscribers is read by the bot only
+-- The "viewable by the bot" policy was USING (true), which let the public
+-- anon key read every subscriber's Telegram user id. RLS stays on with no
+-- policies: the bot reads with SUPABASE_SERVICE_ROLE_KEY, which bypasses it,
+-- and the trigger and RPCs that write it are SECURITY DEFINER.
+-- weekly_digest runs with the caller's rights, so for anon it now finds no
+-- subscribers and returns nothing.
+-- Run this in Supabase SQL Editor
+
+DROP POLICY IF EXISTS "Subscribers are viewable by the bot" ON subscribers;
+
+ALTER TABLE subscribers ENABLE ROW LEVEL SECURITY;
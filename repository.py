@@ -0,0 +1,551 @@
+"""
+LSRC data layer
+Async repository over the Supabase client. The client itself is blocking,
+so every call runs on a small dedicated thread pool with a per-call
+timeout; the event loop never waits on PostgREST or storage. All calls
+share one client, and with it one pooled HTTP session. Storage uploads
+are streamed through a native async HTTP client instead.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+from supabase import ClientOptions, create_client
+
+from metrics import SUPABASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 10.0
+STORAGE_TIMEOUT = 60.0
+PAGE_SIZE = 1000
+SUBSCRIBER_SHARDS = 96  # subscribers.shard, migrations/010_broadcast_shards.sql
+ALL_SHARDS = (0, SUBSCRIBER_SHARDS)
+
+SCORE_COLUMNS = 'id, text, created_at, usage_count, language, author_user_id, parent_score_id, tags'
+AUDIO_COLUMNS = (
+    'id, file_name, file_path, file_url, file_size, mime_type, user_id, file_unique_id, '
+    'content_sha256, duration_seconds, rms_dbfs, peak_dbfs, waveform_peaks, processed_at'
+)
+
+
+class RepositoryError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Score:
+    id: str
+    text: str
+    created_at: Optional[str] = None
+    usage_count: int = 0
+    language: Optional[str] = None
+    author_user_id: Optional[str] = None
+    parent_score_id: Optional[str] = None
+    tags: tuple[str, ...] = ()
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Score':
+        return cls(
+            id=row['id'],
+            text=row.get('text') or '',
+            created_at=row.get('created_at'),
+            usage_count=row.get('usage_count') or 0,
+            language=row.get('language'),
+            author_user_id=row.get('author_user_id'),
+            parent_score_id=row.get('parent_score_id'),
+            tags=tuple(row.get('tags') or ()),
+        )
+
+
+@dataclass(frozen=True)
+class AudioFile:
+    id: Optional[str]
+    file_name: str
+    file_path: str
+    file_url: str
+    file_size: int
+    mime_type: str
+    user_id: str
+    file_unique_id: Optional[str] = None
+    content_sha256: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    rms_dbfs: Optional[float] = None
+    peak_dbfs: Optional[float] = None
+    waveform_peaks: Optional[list[int]] = None
+    processed_at: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'AudioFile':
+        return cls(
+            id=row.get('id'),
+            file_name=row['file_name'],
+            file_path=row['file_path'],
+            file_url=row['file_url'],
+            file_size=row.get('file_size') or 0,
+            mime_type=row.get('mime_type') or '',
+            user_id=row.get('user_id') or '',
+            file_unique_id=row.get('file_unique_id'),
+            content_sha256=row.get('content_sha256'),
+            duration_seconds=row.get('duration_seconds'),
+            rms_dbfs=row.get('rms_dbfs'),
+            peak_dbfs=row.get('peak_dbfs'),
+            waveform_peaks=row.get('waveform_peaks'),
+            processed_at=row.get('processed_at'),
+        )
+
+    def analysis(self) -> dict:
+        if not self.processed_at:
+            return {}
+        return {
+            'duration_seconds': self.duration_seconds,
+            'rms_dbfs': self.rms_dbfs,
+            'peak_dbfs': self.peak_dbfs,
+            'waveform_peaks': self.waveform_peaks,
+            'processed_at': self.processed_at,
+        }
+
+
+@dataclass(frozen=True)
+class DigestRow:
+    author_user_id: str
+    total_listens: int
+    top_score_id: str
+    top_score_text: str
+    top_score_listens: int
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'DigestRow':
+        return cls(
+            author_user_id=row['author_user_id'],
+            total_listens=row.get('total_listens') or 0,
+            top_score_id=row['top_score_id'],
+            top_score_text=row.get('top_score_text') or '',
+            top_score_listens=row.get('top_score_listens') or 0,
+        )
+
+
+@dataclass(frozen=True)
+class PushRecipient:
+    user_id: str
+    language_code: Optional[str] = None
+    received: tuple[str, ...] = ()
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'PushRecipient':
+        return cls(
+            user_id=row['user_id'],
+            language_code=row.get('language_code'),
+            received=tuple(row.get('received') or ()),
+        )
+
+
+@dataclass(frozen=True)
+class BroadcastCheckpoint:
+    last_user_id: Optional[str] = None
+    sent: int = 0
+    completed: bool = False
+    claimed: bool = False
+    lease_until: Optional[datetime] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'BroadcastCheckpoint':
+        lease_until = row.get('lease_until')
+        return cls(
+            last_user_id=row.get('last_user_id'),
+            sent=row.get('sent') or 0,
+            completed=row.get('completed_at') is not None,
+            claimed=bool(row.get('claimed')),
+            lease_until=datetime.fromisoformat(lease_until) if lease_until else None,
+        )
+
+
+@dataclass(frozen=True)
+class SessionIngest:
+    capsule_id: str
+    final_score_id: Optional[str] = None
+    fragments: int = 0
+    created: bool = True
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'SessionIngest':
+        return cls(
+            capsule_id=row['capsule_id'],
+            final_score_id=row.get('final_score_id'),
+            fragments=row.get('fragments') or 0,
+            created=bool(row.get('created')),
+        )
+
+
+class SupabaseRepository:
+    def __init__(
+        self,
+        client,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        timeout: float = DEFAULT_TIMEOUT,
+        key: Optional[str] = None,
+    ):
+        self.client = client
+        self.url = getattr(client, 'supabase_url', '')
+        self.key = key or getattr(client, 'supabase_key', '')
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='supabase')
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # Native async client for streaming storage transfers, created on
+        # first use so it binds to the running loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(STORAGE_TIMEOUT, connect=self.timeout),
+                headers={'apikey': self.key, 'Authorization': f"Bearer {self.key}"},
+            )
+        return self._http
+
+    async def _call(self, fn: Callable[[], Any], timeout: Optional[float] = None, what: str = 'query') -> Any:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, fn),
+                timeout=timeout or self.timeout,
+            )
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise RepositoryError(f"Supabase {what} timed out after {timeout or self.timeout:.0f}s")
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            SUPABASE_SECONDS.observe(time.perf_counter() - started, what, outcome)
+
+    async def _storage(self, what: str, request: Awaitable[httpx.Response]) -> httpx.Response:
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await request
+            outcome = 'error' if response.status_code >= 500 else 'ok'
+            return response
+        finally:
+            SUPABASE_SECONDS.observe(time.perf_counter() - started, what, outcome)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- scores ----------
+
+    async def public_scores_page(
+        self, after: Optional[tuple[str, str]] = None, limit: int = PAGE_SIZE
+    ) -> list[Score]:
+        # Ascending (created_at, id) keyset over idx_scores_public
+        def run():
+            query = self.client.table('scores').select(SCORE_COLUMNS).eq('is_public', True)
+            if after is not None:
+                created_at, score_id = after
+                query = query.or_(
+                    f'created_at.gt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.gt.{score_id})'
+                )
+            return query.order('created_at').order('id').limit(limit).execute()
+
+        result = await self._call(run, what='scores page')
+        return [Score.from_row(r) for r in result.data or []]
+
+    async def public_scores_feed(
+        self, before: Optional[tuple[str, str]] = None, limit: int = 20
+    ) -> list[Score]:
+        # Newest first: descending (created_at, id) keyset, same index
+        def run():
+            query = self.client.table('scores').select(SCORE_COLUMNS).eq('is_public', True)
+            if before is not None:
+                created_at, score_id = before
+                query = query.or_(
+                    f'created_at.lt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.lt.{score_id})'
+                )
+            return query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute()
+
+        result = await self._call(run, what='scores feed')
+        return [Score.from_row(r) for r in result.data or []]
+
+    async def get_public_score(self, score_id: str) -> Optional[Score]:
+        result = await self._call(
+            lambda: self.client.table('scores').select(SCORE_COLUMNS)
+            .eq('id', score_id).eq('is_public', True).limit(1).execute(),
+            what='score lookup',
+        )
+        return Score.from_row(result.data[0]) if result.data else None
+
+    async def public_score_children(self, parent_id: str, limit: int = 100) -> list[Score]:
+        result = await self._call(
+            lambda: self.client.table('scores').select(SCORE_COLUMNS)
+            .eq('parent_score_id', parent_id).eq('is_public', True)
+            .order('created_at').limit(limit).execute(),
+            what='score children',
+        )
+        return [Score.from_row(r) for r in result.data or []]
+
+    async def ingest_score_events(self, events: list[dict]) -> int:
+        result = await self._call(
+            lambda: self.client.rpc('ingest_score_events', {'events': events}).execute(),
+            what='score events ingest',
+        )
+        return result.data or 0
+
+    # ---------- analytics export ----------
+
+    async def export_page(
+        self,
+        table: str,
+        columns: str,
+        before: str,
+        after: Optional[tuple[str, str]] = None,
+        limit: int = PAGE_SIZE,
+    ) -> list[dict]:
+        # Ascending (created_at, id) keyset, created_at < before
+        # (analytics_snapshot.py, migrations/012_analytics_export_indexes.sql)
+        def run():
+            query = self.client.table(table).select(columns).lt('created_at', before)
+            if after is not None:
+                created_at, row_id = after
+                query = query.or_(
+                    f'created_at.gt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.gt.{row_id})'
+                )
+            return query.order('created_at').order('id').limit(limit).execute()
+
+        result = await self._call(run, what=f'{table} export')
+        return result.data or []
+
+    async def export_rows_set(self, table: str, columns: str, ids: list[str], column: str) -> list[dict]:
+        # Rows among ids whose column has been set since they were exported
+        result = await self._call(
+            lambda: self.client.table(table).select(columns)
+            .in_('id', ids).not_.is_(column, 'null').execute(),
+            what=f'{table} refresh',
+        )
+        return result.data or []
+
+    # ---------- sessions ----------
+
+    async def ingest_session(self, session: dict) -> Optional[SessionIngest]:
+        # session is CapsuleSession.to_rpc() (capsules.py); one transaction
+        result = await self._call(
+            lambda: self.client.rpc('ingest_session', {'session': session}).execute(),
+            what='session ingest',
+        )
+        row = result.data or {}
+        if row.get('error') == 'initial_score_not_found':
+            # Unknown initial score: nothing was written
+            return None
+        return SessionIngest.from_row(row)
+
+    # ---------- subscribers ----------
+
+    async def upsert_subscriber(self, user_id: str, language_code: Optional[str]) -> None:
+        await self._call(
+            lambda: self.client.rpc(
+                'upsert_subscriber', {'p_user_id': user_id, 'p_language_code': language_code}
+            ).execute(),
+            what='subscriber upsert',
+        )
+
+    # ---------- push personalization ----------
+
+    async def push_audience_page(
+        self,
+        since: datetime,
+        after_user: Optional[str] = None,
+        limit: int = PAGE_SIZE,
+        shards: tuple[int, int] = ALL_SHARDS,
+    ) -> list[PushRecipient]:
+        params = {
+            'since': since.isoformat(), 'after_user': after_user, 'page_size': limit,
+            'shard_lo': shards[0], 'shard_hi': shards[1],
+        }
+        result = await self._call(
+            lambda: self.client.rpc('push_audience_page', params).execute(), what='push audience'
+        )
+        return [PushRecipient.from_row(r) for r in result.data or []]
+
+    async def iter_push_audience(
+        self,
+        since: datetime,
+        page_size: int = PAGE_SIZE,
+        shards: tuple[int, int] = ALL_SHARDS,
+        after_user: Optional[str] = None,
+    ) -> AsyncIterator[PushRecipient]:
+        while True:
+            rows = await self.push_audience_page(since, after_user, page_size, shards)
+            if not rows:
+                return
+            for row in rows:
+                if row.user_id:
+                    yield row
+            after_user = rows[-1].user_id
+
+    async def record_push_deliveries(self, deliveries: list[tuple[str, str]], batch_size: int = PAGE_SIZE) -> int:
+        recorded = 0
+        for start in range(0, len(deliveries), batch_size):
+            batch = [
+                {'user_id': user_id, 'score_id': score_id}
+                for user_id, score_id in deliveries[start:start + batch_size]
+            ]
+            result = await self._call(
+                lambda: self.client.rpc('record_push_deliveries', {'deliveries': batch}).execute(),
+                what='push deliveries',
+            )
+            recorded += result.data or 0
+        return recorded
+
+    # ---------- weekly digest ----------
+
+    async def weekly_digest_page(
+        self,
+        since: datetime,
+        after_author: Optional[str] = None,
+        limit: int = 500,
+        shards: tuple[int, int] = ALL_SHARDS,
+    ) -> list[DigestRow]:
+        params = {
+            'since': since.isoformat(), 'after_author': after_author, 'page_size': limit,
+            'shard_lo': shards[0], 'shard_hi': shards[1],
+        }
+        result = await self._call(
+            lambda: self.client.rpc('weekly_digest', params).execute(), what='weekly digest'
+        )
+        return [DigestRow.from_row(r) for r in result.data or []]
+
+    # ---------- broadcast checkpoints ----------
+
+    async def claim_broadcast_slot(
+        self, job: str, run_key: str, slot: int, owner: str, lease_seconds: int
+    ) -> BroadcastCheckpoint:
+        # Atomic: at most one owner holds a live lease on a slot
+        # (migrations/014_broadcast_slot_lease.sql)
+        params = {
+            'p_job': job, 'p_run_key': run_key, 'p_slot': slot,
+            'p_owner': owner, 'p_lease_seconds': lease_seconds,
+        }
+        result = await self._call(
+            lambda: self.client.rpc('claim_broadcast_slot', params).execute(),
+            what='broadcast slot claim',
+        )
+        return BroadcastCheckpoint.from_row(result.data[0]) if result.data else BroadcastCheckpoint()
+
+    async def save_broadcast_checkpoint(
+        self,
+        job: str,
+        run_key: str,
+        slot: int,
+        owner: str,
+        last_user_id: Optional[str],
+        sent: int,
+        completed: bool = False,
+        lease_seconds: int = 300,
+    ) -> bool:
+        """Save progress and renew the lease; False if owner lost the slot."""
+        params = {
+            'p_job': job, 'p_run_key': run_key, 'p_slot': slot, 'p_owner': owner,
+            'p_last_user_id': last_user_id, 'p_sent': sent, 'p_completed': completed,
+            'p_lease_seconds': lease_seconds,
+        }
+        result = await self._call(
+            lambda: self.client.rpc('save_broadcast_checkpoint', params).execute(),
+            what='broadcast checkpoint save',
+        )
+        return bool(result.data)
+
+    # ---------- audio ----------
+
+    def public_audio_url(self, file_path: str, bucket: str = 'audio') -> str:
+        return f"{self.url}/storage/v1/object/public/{bucket}/{file_path}"
+
+    async def upload_audio_stream(
+        self,
+        file_path: str,
+        chunks: AsyncIterable[bytes],
+        content_type: str,
+        bucket: str = 'audio',
+    ) -> bool:
+        # Body is sent as it is produced (chunked transfer encoding; no
+        # Content-Length, the real size is only known at the end).
+        # Returns False if the object already exists (content-addressed paths)
+        headers = {'Content-Type': content_type, 'x-upsert': 'false'}
+        response = await self._storage('storage upload', self.http.post(
+            f"{self.url}/storage/v1/object/{bucket}/{file_path}",
+            content=chunks,
+            headers=headers,
+        ))
+        if response.status_code == 409 or (
+            response.status_code == 400 and 'Duplicate' in response.text
+        ):
+            return False
+        if response.status_code >= 400:
+            raise RepositoryError(f"Storage upload failed ({response.status_code}): {response.text[:200]}")
+        return True
+
+    async def delete_object(self, file_path: str, bucket: str = 'audio') -> None:
+        response = await self._storage(
+            'storage delete', self.http.delete(f"{self.url}/storage/v1/object/{bucket}/{file_path}")
+        )
+        if response.status_code >= 400 and response.status_code != 404:
+            raise RepositoryError(f"Storage delete failed ({response.status_code}): {response.text[:200]}")
+
+    async def _find_audio(self, column: str, value: str) -> Optional[AudioFile]:
+        result = await self._call(
+            lambda: self.client.table('audio_files').select(AUDIO_COLUMNS)
+            .eq(column, value).order('created_at').limit(1).execute(),
+            what='audio_files lookup',
+        )
+        return AudioFile.from_row(result.data[0]) if result.data else None
+
+    async def find_audio_by_unique_id(self, file_unique_id: str) -> Optional[AudioFile]:
+        return await self._find_audio('file_unique_id', file_unique_id)
+
+    async def find_audio_by_checksum(self, content_sha256: str) -> Optional[AudioFile]:
+        return await self._find_audio('content_sha256', content_sha256)
+
+    async def unprocessed_audio(self, limit: int = 100) -> list[AudioFile]:
+        result = await self._call(
+            lambda: self.client.table('audio_files').select(AUDIO_COLUMNS)
+            .is_('processed_at', 'null').order('created_at').limit(limit).execute(),
+            what='unprocessed audio',
+        )
+        return [AudioFile.from_row(r) for r in result.data or []]
+
+    async def apply_audio_analysis(self, results: list[dict]) -> int:
+        result = await self._call(
+            lambda: self.client.rpc('apply_audio_analysis', {'results': results}).execute(),
+            what='audio analysis write-back',
+        )
+        return result.data or 0
+
+    async def insert_audio_file(self, row: dict) -> AudioFile:
+        result = await self._call(
+            lambda: self.client.table('audio_files').insert(row).execute(), what='audio_files insert'
+        )
+        return AudioFile.from_row(result.data[0] if result.data else row)
+
+
+def create_repository(
+    url: str,
+    key: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> SupabaseRepository:
+    options = ClientOptions(postgrest_client_timeout=timeout)
+    client = create_client(url, key, options=options)
+    return SupabaseRepository(client, max_workers=max_workers, timeout=timeout, key=key)
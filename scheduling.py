@@ -0,0 +1,180 @@
+"""
+LSRC broadcast scheduling
+Spreads a broadcast over the day: subscribers are hashed into
+SUBSCRIBER_SHARDS shards (subscribers.shard), and each of N time slots in
+a window sends one contiguous shard range as a small job. Telegram gives
+no user timezone, so hashing is what keeps the slots evenly sized.
+
+Each slot job is resumable. Users are processed in user_id order, in
+chunks. After every chunk the last user_id is saved to
+broadcast_checkpoints, and a restarted job continues from there. A
+completed slot is never sent twice. A crash can at most repeat the one
+chunk that was in flight.
+
+Every bot process schedules every slot, so a job first claims its slot: a
+lease of LEASE_SECONDS, taken atomically in the database and renewed with
+each checkpoint and every RENEW_SECONDS while a chunk is sending (RetryAfter
+back-off has no upper bound). Whoever doesn't get it skips the slot; if the
+holder dies, the lease runs out and the slot can be claimed again. A job
+that finds its lease gone stops sending at once.
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from broadcast import Broadcaster, BroadcastMessage
+from repository import SUBSCRIBER_SHARDS, SupabaseRepository
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+LEASE_SECONDS = 300
+RENEW_SECONDS = LEASE_SECONDS / 3
+SCHEDULE_SLACK = timedelta(minutes=5)
+
+# (user_id, message) in ascending user_id order; None = nothing to send
+Chunk = list[tuple[str, Optional[BroadcastMessage]]]
+
+
+@dataclass(frozen=True)
+class Slot:
+    job: str
+    index: int
+    count: int
+    start: time          # window start, UTC
+    offset: timedelta    # from the window start
+
+    @property
+    def shards(self) -> tuple[int, int]:
+        return (
+            self.index * SUBSCRIBER_SHARDS // self.count,
+            (self.index + 1) * SUBSCRIBER_SHARDS // self.count,
+        )
+
+    @property
+    def name(self) -> str:
+        return f"{self.job} {self.index + 1}/{self.count}"
+
+    @property
+    def at(self) -> time:
+        moment = datetime.combine(datetime(2000, 1, 1), self.start) + self.offset
+        return moment.time().replace(tzinfo=timezone.utc)
+
+    @property
+    def day_shift(self) -> int:
+        # 1 if the slot falls after midnight of the window's first day
+        return (datetime.combine(datetime(2000, 1, 1), self.start) + self.offset).day - 1
+
+    def window_start(self, now: datetime) -> datetime:
+        """Start of the window this slot last ran (or should have run) in."""
+        # A little slack so a job fired a moment early still maps to its own run
+        now = now + SCHEDULE_SLACK
+        occurrence = datetime.combine(now.date(), self.at)
+        if occurrence > now:
+            occurrence -= timedelta(days=1)
+        return occurrence - self.offset
+
+    def daily_run_key(self, now: datetime) -> str:
+        return self.window_start(now).date().isoformat()
+
+    def weekly_run_key(self, now: datetime) -> str:
+        year, week, _ = self.window_start(now).isocalendar()
+        return f"{year}-W{week:02d}"
+
+
+def plan_slots(job: str, count: int, start: time, hours: float) -> list[Slot]:
+    """count slots evenly spaced from start (UTC) over a window of hours."""
+    count = max(1, min(count, SUBSCRIBER_SHARDS))
+    step = timedelta(hours=hours) / count
+    return [Slot(job, i, count, start, step * i) for i in range(count)]
+
+
+def parse_time(value: str) -> time:
+    hour, _, minute = value.partition(':')
+    return time(hour=int(hour), minute=int(minute or 0))
+
+
+def chunked(items: list, size: int = CHUNK_SIZE) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def run_checkpointed(
+    repo: SupabaseRepository,
+    broadcaster: Broadcaster,
+    slot: Slot,
+    run_key: str,
+    chunks: Callable[[Optional[str]], AsyncIterator[Chunk]],
+    on_sent: Optional[Callable[[BroadcastMessage], None]] = None,
+    after_chunk: Optional[Callable[[], Awaitable[None]]] = None,
+    on_busy: Optional[Callable[[datetime], None]] = None,
+) -> Optional[int]:
+    """Send one slot. chunks(after_user_id) yields the remaining work.
+
+    Returns how many messages the slot has sent in total, or None if it
+    was completed or is leased by another process. on_busy gets the time
+    that lease runs out.
+    """
+    owner = uuid.uuid4().hex
+    checkpoint = await repo.claim_broadcast_slot(slot.job, run_key, slot.index, owner, LEASE_SECONDS)
+    if checkpoint.completed:
+        logger.info(f"{slot.name} ({run_key}) already completed, skipping")
+        return None
+    if not checkpoint.claimed:
+        logger.info(f"{slot.name} ({run_key}) is running elsewhere until {checkpoint.lease_until}, skipping")
+        if on_busy is not None and checkpoint.lease_until is not None:
+            on_busy(checkpoint.lease_until)
+        return None
+    if checkpoint.last_user_id:
+        logger.info(f"{slot.name} ({run_key}) resuming after user {checkpoint.last_user_id}")
+
+    sent = checkpoint.sent
+    last_user_id = checkpoint.last_user_id
+
+    async def save(completed: bool = False) -> bool:
+        return await repo.save_broadcast_checkpoint(
+            slot.job, run_key, slot.index, owner, last_user_id, sent,
+            completed=completed, lease_seconds=LEASE_SECONDS,
+        )
+
+    async for chunk in chunks(last_user_id):
+        if not chunk:
+            continue
+        messages = [m for _, m in chunk if m is not None]
+        if messages:
+            run = asyncio.ensure_future(broadcaster.run(messages, name=slot.name, on_sent=on_sent))
+            lost = False
+            try:
+                # Re-save the last checkpoint to keep the lease while the
+                # chunk is sending
+                while not (await asyncio.wait({run}, timeout=RENEW_SECONDS))[0]:
+                    if not await save():
+                        lost = True
+                        break
+            finally:
+                if not run.done():
+                    run.cancel()
+                    await asyncio.wait({run})
+            if lost:
+                if after_chunk is not None:
+                    await after_chunk()
+                logger.warning(f"{slot.name} ({run_key}) lost its lease during a chunk after user {last_user_id}, stopping")
+                return sent
+            sent += run.result().sent
+        if after_chunk is not None:
+            await after_chunk()
+        last_user_id = chunk[-1][0]
+        if not await save():
+            # Our lease ran out and another process took over from the
+            # last saved checkpoint
+            logger.warning(f"{slot.name} ({run_key}) lost its lease after user {last_user_id}, stopping")
+            return sent
+
+    if not await save(completed=True):
+        logger.warning(f"{slot.name} ({run_key}) lost its lease before completing, leaving it to the new holder")
+        return sent
+    logger.info(f"{slot.name} ({run_key}) done: {sent} sent")
+    return sent
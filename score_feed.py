@@ -0,0 +1,244 @@
+"""
+LSRC score feed
+Read API served by server.py: newest-first public scores, keyset paginated
+on (created_at, id), and score lineage (parent_score_id). Responses are
+rendered once to JSON with an ETag and cached for a short TTL; concurrent
+requests for the same key share one upstream query, so a burst of mini-app
+opens after the daily push costs a single Supabase round trip.
+
+Given a ScorePool, lineage is answered from its in-memory lineage index
+(lineage.py); otherwise the chain is walked upstream one hop at a time.
+Search runs on the pool's search index (search.py) and needs a pool.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Hashable, Optional
+
+from repository import Score, SupabaseRepository
+from score_sampler import ScorePool
+from search import SearchIndex
+
+DEFAULT_TTL = 30.0
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_LINEAGE_DEPTH = 50
+MAX_QUERY_LENGTH = 200
+
+
+class FeedError(ValueError):
+    """Bad request parameters (cursor, limit, score id)."""
+
+
+@dataclass(frozen=True)
+class FeedResponse:
+    body: bytes
+    etag: str
+
+    @classmethod
+    def render(cls, payload: dict) -> 'FeedResponse':
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+        return cls(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+
+
+def score_json(score: Score) -> dict:
+    return {
+        'id': score.id,
+        'text': score.text,
+        'created_at': score.created_at,
+        'language': score.language,
+        'usage_count': score.usage_count,
+        'parent_score_id': score.parent_score_id,
+        'tags': list(score.tags),
+    }
+
+
+def validate_score_id(score_id: str) -> str:
+    # Ids end up inside PostgREST filter strings, so only accept UUIDs
+    try:
+        return str(uuid.UUID(score_id))
+    except (TypeError, ValueError):
+        raise FeedError(f"Invalid score id: {score_id!r}")
+
+
+def validate_query(query: str, tags: list[str], language: Optional[str]) -> None:
+    if not query.strip() and not tags and not language:
+        raise FeedError("q, tag or lang is required")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise FeedError(f"q is longer than {MAX_QUERY_LENGTH} characters")
+
+
+def search_response(
+    index: SearchIndex, query: str, tags: list[str], language: Optional[str], limit: int
+) -> FeedResponse:
+    validate_query(query, tags, language)
+    result = index.search(query, tags=tags, language=language, limit=limit)
+    return FeedResponse.render(result.to_dict())
+
+
+def encode_cursor(score: Score) -> str:
+    raw = f"{score.created_at}|{score.id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, score_id = raw.split('|', 1)
+        datetime.fromisoformat(created_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise FeedError("Invalid cursor")
+    return created_at, validate_score_id(score_id)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+
+
+class ResponseCache:
+    """TTL + LRU cache with single-flight loading."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, tuple[float, FeedResponse]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Optional[FeedResponse]]]
+    ) -> Optional[FeedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats.coalesced += 1
+            # shield: one client going away must not cancel the shared query
+            return await asyncio.shield(task)
+
+        self.stats.misses += 1
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = task
+        try:
+            response = await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+        # Misses (None) are not cached: a new score may appear any moment
+        if response is not None:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return response
+
+
+class ScoreFeed:
+    def __init__(
+        self,
+        repo: SupabaseRepository,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        pool: Optional[ScorePool] = None,
+    ):
+        self.repo = repo
+        self.pool = pool
+        self.cache = ResponseCache(ttl=ttl, max_entries=max_entries)
+
+    async def page(self, cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> FeedResponse:
+        limit = max(1, min(limit, MAX_LIMIT))
+        before = decode_cursor(cursor) if cursor else None
+
+        async def load() -> FeedResponse:
+            scores = await self.repo.public_scores_feed(before, limit)
+            next_cursor = encode_cursor(scores[-1]) if len(scores) == limit else None
+            return FeedResponse.render({
+                'scores': [score_json(s) for s in scores],
+                'next_cursor': next_cursor,
+            })
+
+        return await self.cache.get_or_load(('scores', before, limit), load)
+
+    async def lineage(self, score_id: str) -> Optional[FeedResponse]:
+        score_id = validate_score_id(score_id)
+
+        async def load() -> Optional[FeedResponse]:
+            if self.pool is not None:
+                await self.pool.ensure_fresh()
+                if score_id in self.pool.lineage:
+                    return self._lineage_from_index(score_id)
+
+            score = await self.repo.get_public_score(score_id)
+            if score is None:
+                return None
+
+            # Walk up one hop at a time; private or missing parents end the chain
+            ancestors: list[Score] = []
+            seen = {score.id}
+            parent_id = score.parent_score_id
+            while parent_id and parent_id not in seen and len(ancestors) < MAX_LINEAGE_DEPTH:
+                parent = await self.repo.get_public_score(parent_id)
+                if parent is None:
+                    break
+                ancestors.append(parent)
+                seen.add(parent.id)
+                parent_id = parent.parent_score_id
+            children = await self.repo.public_score_children(score.id)
+
+            return FeedResponse.render({
+                'score': score_json(score),
+                'ancestors': [score_json(s) for s in reversed(ancestors)],
+                'children': [score_json(s) for s in children],
+                'continuations': None,
+            })
+
+        return await self.cache.get_or_load(('lineage', score_id), load)
+
+    async def search(
+        self, query: str, tags: list[str], language: Optional[str] = None, limit: int = 10
+    ) -> FeedResponse:
+        # Not cached: the index answers faster than a cache lookup would save
+        if self.pool is None:
+            raise FeedError("Search is not available")
+        await self.pool.ensure_fresh()
+        return search_response(self.pool.search, query, tags, language, limit)
+
+    def _lineage_from_index(self, score_id: str) -> FeedResponse:
+        index = self.pool.lineage
+        # Same shape as the upstream walk: ancestors stop at the first
+        # parent that is not a loaded public score
+        ancestors: list[Score] = []
+        for ancestor_id in reversed(index.chain(score_id)[:-1]):
+            ancestor = self.pool.get(ancestor_id)
+            if ancestor is None:
+                break
+            ancestors.append(ancestor)
+        children = [c for c in map(self.pool.get, index.children(score_id)) if c is not None]
+        children.sort(key=lambda s: s.created_at or '')
+
+        return FeedResponse.render({
+            'score': score_json(self.pool.get(score_id)),
+            'ancestors': [score_json(s) for s in reversed(ancestors)],
+            'children': [score_json(s) for s in children],
+            'continuations': index.continuations(score_id),
+        })
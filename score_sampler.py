@@ -0,0 +1,175 @@
+"""
+LSRC score sampler
+Warm in-memory pool of public scores with O(1) weighted draws (alias method).
+The pool is loaded once, then topped up incrementally by created_at
+(the order idx_scores_public already serves); a periodic full reload picks
+up usage_count changes and scores that went private. The pool also keeps
+the lineage index (parent_score_id graph) and the search index of the
+same scores.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable, Container, Optional
+
+from lineage import LineageError, LineageIndex
+from repository import Score, SupabaseRepository
+from search import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+REFRESH_INTERVAL = 600        # seconds between incremental top-ups
+FULL_RELOAD_INTERVAL = 86400  # seconds between full reloads
+RECENCY_HALF_LIFE_DAYS = 14.0
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def default_weight(score: Score, now: datetime) -> float:
+    # Favour scores few people have heard, with a boost for recent ones
+    novelty = 1.0 / (1.0 + score.usage_count)
+    created = parse_timestamp(score.created_at)
+    age_days = max(0.0, (now - created).total_seconds() / 86400) if created else 365.0
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return novelty * (1.0 + recency)
+
+
+class AliasTable:
+    """Vose's alias method: O(n) build, O(1) draw."""
+
+    def __init__(self, weights: list[float]):
+        n = len(weights)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            self.prob = [1.0] * n
+            return
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def draw(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class ScorePool:
+    def __init__(
+        self,
+        repo: SupabaseRepository,
+        weight: Callable[[Score, datetime], float] = default_weight,
+        page_size: int = PAGE_SIZE,
+        refresh_interval: float = REFRESH_INTERVAL,
+        full_reload_interval: float = FULL_RELOAD_INTERVAL,
+        rng: Optional[random.Random] = None,
+    ):
+        self.repo = repo
+        self.weight = weight
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.rng = rng or random.Random()
+
+        self._scores: list[Score] = []
+        self._index: dict[str, int] = {}
+        self._table = AliasTable([])
+        self._watermark: Optional[tuple[str, str]] = None
+        self.lineage = LineageIndex()
+        self.search = SearchIndex()
+        self._refreshed_at = 0.0
+        self._reloaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    async def refresh(self, full: bool = False) -> int:
+        after = None if full else self._watermark
+        scores = [] if full else list(self._scores)
+        index = {} if full else dict(self._index)
+        fetched: list[Score] = []
+        added = 0
+
+        while True:
+            page = await self.repo.public_scores_page(after, self.page_size)
+            if not page:
+                break
+            fetched.extend(page)
+            for score in page:
+                if score.id in index:
+                    scores[index[score.id]] = score
+                    continue
+                index[score.id] = len(scores)
+                scores.append(score)
+                added += 1
+            after = (page[-1].created_at, page[-1].id)
+
+        now = datetime.now(timezone.utc)
+        self._table = AliasTable([max(0.0, self.weight(s, now)) for s in scores])
+        self._scores = scores
+        self._index = index
+        if full:
+            self.lineage = LineageIndex.from_scores(scores)
+            self.search = SearchIndex.from_scores(scores)
+        else:
+            for score in fetched:
+                try:
+                    self.lineage.add(score.id, score.parent_score_id)
+                except LineageError as e:
+                    logger.warning(f"Skipping lineage edge: {e}")
+                self.search.add(score)
+        if after is not None:
+            self._watermark = after
+        self._refreshed_at = time.monotonic()
+        if full:
+            self._reloaded_at = self._refreshed_at
+        logger.info(f"Score pool {'reloaded' if full else 'refreshed'}: {len(scores)} scores (+{added})")
+        return added
+
+    async def ensure_fresh(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if not self._scores or now - self._reloaded_at > self.full_reload_interval:
+                await self.refresh(full=True)
+            elif now - self._refreshed_at > self.refresh_interval:
+                await self.refresh()
+
+    def sample(self, exclude: Container[str] = (), attempts: int = 8) -> Optional[Score]:
+        if not self._scores:
+            return None
+        for _ in range(attempts):
+            score = self._scores[self._table.draw(self.rng)]
+            if score.id not in exclude:
+                return score
+        return None
+
+    def get(self, score_id: str) -> Optional[Score]:
+        i = self._index.get(score_id)
+        return self._scores[i] if i is not None else None
+
+    def scores(self) -> list[Score]:
+        return list(self._scores)
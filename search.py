@@ -0,0 +1,400 @@
+"""
+LSRC score search
+In-memory inverted index over public score text, with tag and language
+facets. Tokens are lowercased words, no stemming; each query word also
+matches vocabulary words that share enough trigrams ("steps" finds "step",
+"echos" finds "echo"), at a lower weight. Results are ranked by BM25.
+
+Built in bulk from a list of scores (ScorePool, a table snapshot) or from
+seed_scores_100.sql, then kept current with add() / remove(). Queries
+touch only the postings of their own terms, scored as NumPy arrays; facet
+counts come from flat per-doc tag / language arrays. The cost follows the
+number of matching docs, not the query: at 20k scores a selective query
+("breath #body", ~1k matches) takes a few tenths of a millisecond, while
+one matching most of the catalogue ("listen sound", ~18k matches) takes
+milliseconds, spent ranking every match and counting its facets.
+
+Query syntax: free words, plus #tag and lang:xx filters, e.g.
+    breath slow #body lang:en
+"""
+
+import heapq
+import math
+import re
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from repository import Score
+
+K1 = 1.2
+B = 0.75
+FUZZY_WEIGHT = 0.7
+FUZZY_THRESHOLD = 0.45
+FUZZY_MIN_LENGTH = 4
+MAX_EXPANSIONS = 4
+FACET_GATHER_RATIO = 8
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+NO_LANGUAGE = -1
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+SEED_SECTION_RE = re.compile(r"^-- === (.+?) \(\d+-\d+\) ===")
+SEED_ROW_RE = re.compile(r"^\('((?:[^']|'')*)',\s*'([^']*)',\s*(true|false),\s*'([^']*)'\)")
+
+
+def tokenize(text: str) -> list[str]:
+    return WORD_RE.findall(text.casefold())
+
+
+def trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lstrip('#').casefold()
+
+
+def parse_query(text: str) -> tuple[list[str], list[str], Optional[str]]:
+    """Split a query into words, #tags and a lang: filter."""
+    words, tags, language = [], [], None
+    for part in text.split():
+        if part.startswith('#') and len(part) > 1:
+            tags.append(normalize_tag(part))
+        elif part.casefold().startswith('lang:') and len(part) > 5:
+            language = part[5:].casefold()
+        else:
+            words.extend(tokenize(part))
+    return words, tags, language
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    score: Score
+    rank: float
+
+
+@dataclass
+class SearchResult:
+    hits: list[SearchHit]
+    total: int
+    tags: Counter = field(default_factory=Counter)
+    languages: Counter = field(default_factory=Counter)
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'results': [
+                {
+                    'id': hit.score.id,
+                    'text': hit.score.text,
+                    'created_at': hit.score.created_at,
+                    'language': hit.score.language,
+                    'usage_count': hit.score.usage_count,
+                    'parent_score_id': hit.score.parent_score_id,
+                    'tags': list(hit.score.tags),
+                    'rank': round(hit.rank, 4),
+                }
+                for hit in self.hits
+            ],
+            'total': self.total,
+            'facets': {
+                'tags': dict(self.tags.most_common(20)),
+                'language': dict(self.languages.most_common()),
+            },
+        }
+
+
+class SearchIndex:
+    def __init__(self):
+        self._scores: list[Optional[Score]] = []     # doc -> score, None once removed
+        self._doc_ids: dict[str, int] = {}
+        self._terms: list[tuple[str, ...]] = []      # doc -> distinct terms, for removal
+        self._lengths = array('i')
+        self._total_length = 0
+        self._live = 0
+        self._postings: dict[str, dict[int, int]] = {}   # term -> {doc: tf}
+        self._compiled: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._grams: dict[str, set[str]] = {}            # trigram -> vocabulary terms
+        self._similar: dict[str, list[tuple[str, float]]] = {}  # cleared when the vocabulary changes
+
+        # Facets: tag and language names interned to ints. Per-doc tag ids
+        # are a flat append-only array with offsets (CSR)
+        self._tag_names: list[str] = []
+        self._tag_ids: dict[str, int] = {}
+        self._doc_tags = array('i')
+        self._doc_tag_offsets = array('q', [0])
+        self._doc_tag_rows = array('q')   # doc of each _doc_tags entry
+        self._tag_docs: dict[str, set[int]] = {}
+        self._language_names: list[str] = []
+        self._language_ids: dict[str, int] = {}
+        self._doc_language = array('i')
+        self._language_docs: dict[str, set[int]] = {}
+        self._facet_arrays: dict[tuple[str, str], np.ndarray] = {}  # doc arrays of the sets above
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, score_id: str) -> bool:
+        return score_id in self._doc_ids
+
+    @classmethod
+    def from_scores(cls, scores: Iterable[Score]) -> 'SearchIndex':
+        index = cls()
+        for score in scores:
+            index.add(score)
+        return index
+
+    @classmethod
+    def from_seed_sql(cls, path: str | Path) -> 'SearchIndex':
+        return cls.from_scores(parse_seed_scores(path))
+
+    # ---------- updates ----------
+
+    @staticmethod
+    def _intern(name: str, names: list[str], ids: dict[str, int]) -> int:
+        i = ids.get(name)
+        if i is None:
+            i = ids[name] = len(names)
+            names.append(name)
+        return i
+
+    def add(self, score: Score) -> None:
+        """Index a score; re-adding an id replaces the old version."""
+        if score.id in self._doc_ids:
+            self.remove(score.id)
+
+        doc = len(self._scores)
+        terms = Counter(tokenize(score.text))
+        length = sum(terms.values())
+        self._scores.append(score)
+        self._doc_ids[score.id] = doc
+        self._terms.append(tuple(terms))
+        self._lengths.append(length)
+        self._total_length += length
+        self._live += 1
+
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._similar.clear()
+                for gram in trigrams(term):
+                    self._grams.setdefault(gram, set()).add(term)
+            postings[doc] = tf
+            self._compiled.pop(term, None)
+
+        for tag in sorted({normalize_tag(t) for t in score.tags if t}):
+            self._doc_tags.append(self._intern(tag, self._tag_names, self._tag_ids))
+            self._doc_tag_rows.append(doc)
+            self._tag_docs.setdefault(tag, set()).add(doc)
+            self._facet_arrays.pop(('tag', tag), None)
+        self._doc_tag_offsets.append(len(self._doc_tags))
+        language = (score.language or '').casefold()
+        self._doc_language.append(
+            self._intern(language, self._language_names, self._language_ids) if language else NO_LANGUAGE
+        )
+        if language:
+            self._language_docs.setdefault(language, set()).add(doc)
+            self._facet_arrays.pop(('language', language), None)
+
+    def remove(self, score_id: str) -> bool:
+        # The doc slot stays (arrays are append-only); it just stops matching
+        doc = self._doc_ids.pop(score_id, None)
+        if doc is None:
+            return False
+        score = self._scores[doc]
+        for term in self._terms[doc]:
+            postings = self._postings[term]
+            del postings[doc]
+            self._compiled.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                self._similar.clear()
+                for gram in trigrams(term):
+                    self._grams[gram].discard(term)
+                    if not self._grams[gram]:
+                        del self._grams[gram]
+        language = (score.language or '').casefold()
+        for kind, facet, values in (
+            ('tag', self._tag_docs, {normalize_tag(t) for t in score.tags if t}),
+            ('language', self._language_docs, {language} if language else set()),
+        ):
+            for value in values:
+                self._facet_arrays.pop((kind, value), None)
+                facet[value].discard(doc)
+                if not facet[value]:
+                    del facet[value]
+        self._total_length -= self._lengths[doc]
+        self._scores[doc] = None
+        self._terms[doc] = ()
+        self._live -= 1
+        return True
+
+    # ---------- queries ----------
+
+    def similar_terms(self, term: str) -> list[tuple[str, float]]:
+        """Vocabulary words sharing enough trigrams with term, best first."""
+        if len(term) < FUZZY_MIN_LENGTH:
+            return []
+        cached = self._similar.get(term)
+        if cached is not None:
+            return cached
+        grams = trigrams(term)
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        similar = []
+        for other, n in shared.items():
+            if other == term:
+                continue
+            similarity = n / (len(grams) + len(trigrams(other)) - n)
+            if similarity >= FUZZY_THRESHOLD:
+                similar.append((other, similarity))
+        similar = self._similar[term] = heapq.nlargest(MAX_EXPANSIONS, similar, key=lambda x: x[1])
+        return similar
+
+    def _postings_arrays(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            postings = self._postings[term]
+            compiled = self._compiled[term] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float64, count=len(postings)),
+            )
+        return compiled
+
+    def _facet_docs(self, kind: str, value: str) -> np.ndarray:
+        docs = self._facet_arrays.get((kind, value))
+        if docs is None:
+            found = (self._tag_docs if kind == 'tag' else self._language_docs).get(value, ())
+            docs = self._facet_arrays[(kind, value)] = np.fromiter(found, dtype=np.int64, count=len(found))
+        return docs
+
+    def _filter_mask(self, tags: list[str], language: Optional[str]) -> Optional[np.ndarray]:
+        groups = [self._facet_docs('tag', t) for t in tags]
+        if language:
+            groups.append(self._facet_docs('language', language.casefold()))
+        if not groups:
+            return None
+        mask = np.zeros(len(self._scores), dtype=np.int16)
+        for docs in groups:
+            mask[docs] += 1
+        return mask == len(groups)
+
+    def _matched_tag_ids(self, matched: np.ndarray) -> np.ndarray:
+        doc_tags = np.frombuffer(self._doc_tags, dtype=np.int32)
+        if matched.size * FACET_GATHER_RATIO < len(self._scores):
+            # Few matches: ragged gather of each matched doc's tag ids
+            offsets = np.frombuffer(self._doc_tag_offsets, dtype=np.int64)
+            starts = offsets[matched]
+            counts = offsets[matched + 1] - starts
+            total = int(counts.sum())
+            shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+            return doc_tags[shift + np.arange(total)]
+        # Broad queries: one pass over all tag entries is cheaper
+        selected = np.zeros(len(self._scores), dtype=bool)
+        selected[matched] = True
+        return doc_tags[selected[np.frombuffer(self._doc_tag_rows, dtype=np.int64)]]
+
+    def _facets(self, matched: np.ndarray, result: SearchResult) -> None:
+        if not matched.size:
+            return
+        tag_ids = self._matched_tag_ids(matched)
+        if tag_ids.size:
+            for i, n in enumerate(np.bincount(tag_ids).tolist()):
+                if n:
+                    result.tags[self._tag_names[i]] = n
+        languages = np.frombuffer(self._doc_language, dtype=np.int32)[matched]
+        languages = languages[languages != NO_LANGUAGE]
+        for i, n in enumerate(np.bincount(languages).tolist()):
+            if n:
+                result.languages[self._language_names[i]] = n
+
+    def search(
+        self,
+        query: str,
+        tags: Iterable[str] = (),
+        language: Optional[str] = None,
+        limit: int = DEFAULT_LIMIT,
+    ) -> SearchResult:
+        started = time.perf_counter()
+        limit = max(1, min(limit, MAX_LIMIT))
+        words, query_tags, query_language = parse_query(query)
+        tags = [normalize_tag(t) for t in tags] + query_tags
+        mask = self._filter_mask(tags, language or query_language)
+
+        if words:
+            n_docs = max(1, self._live)
+            avg_length = max(1.0, self._total_length / n_docs)
+            weighted: dict[str, float] = {}
+            for word in words:
+                if word in self._postings:
+                    weighted[word] = max(weighted.get(word, 0.0), 1.0)
+                for other, similarity in self.similar_terms(word):
+                    weighted[other] = max(weighted.get(other, 0.0), FUZZY_WEIGHT * similarity)
+
+            lengths = np.frombuffer(self._lengths, dtype=np.int32)
+            ranks = np.zeros(len(self._scores))
+            for term, weight in weighted.items():
+                docs, tfs = self._postings_arrays(term)
+                idf = math.log(1 + (n_docs - docs.size + 0.5) / (docs.size + 0.5))
+                norm = K1 * (1 - B + B * lengths[docs] / avg_length)
+                # docs are unique within a term, so fancy-index += is exact
+                ranks[docs] += weight * idf * tfs * (K1 + 1) / (tfs + norm)
+            if mask is not None:
+                ranks[~mask] = 0.0
+            matched = np.flatnonzero(ranks > 0)
+            scores = ranks[matched]
+            if matched.size > limit:
+                best = np.argpartition(-scores, limit - 1)[:limit]
+            else:
+                best = np.arange(matched.size)
+            best = best[np.lexsort((-matched[best], -scores[best]))]
+            top = [(int(matched[i]), float(scores[i])) for i in best]
+        elif mask is not None:
+            # Filters only: newest first (the pool indexes oldest first).
+            # Facet sets hold live docs only, so the mask needs no check
+            matched = np.flatnonzero(mask)
+            top = [(int(doc), 0.0) for doc in matched[::-1][:limit]]
+        else:
+            matched = np.zeros(0, dtype=np.int64)
+            top = []
+
+        result = SearchResult(
+            hits=[SearchHit(self._scores[doc], rank) for doc, rank in top],
+            total=int(matched.size),
+        )
+        self._facets(matched, result)
+        result.elapsed_ms = (time.perf_counter() - started) * 1000
+        return result
+
+
+def parse_seed_scores(path: str | Path) -> list[Score]:
+    """Scores from seed_scores_100.sql; section headings become tags."""
+    scores = []
+    tags: tuple[str, ...] = ()
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        section = SEED_SECTION_RE.match(line)
+        if section:
+            tags = tuple(tokenize(section.group(1)))
+            continue
+        row = SEED_ROW_RE.match(line.strip())
+        if row is None:
+            continue
+        text, source, is_public, language = row.groups()
+        if is_public != 'true':
+            continue
+        scores.append(Score(
+            id=f"seed-{len(scores) + 1}",
+            text=text.replace("''", "'"),
+            language=language,
+            tags=tags + (source,),
+        ))
+    return scores
@@ -1,23 +1,242 @@
 #!/usr/bin/env python3
 """
-Simple HTTP server for the Listen.Sound.Reflect.Create Mini App
+HTTP server for the Listen.Sound.Reflect.Create Mini App
 Run with: python3 server.py
 Then open: http://localhost:8000
+
+Threaded, HTTP/1.1 keep-alive. Only allow-listed files are served (never
+.env, zips or sources); small assets are precompressed (gzip, brotli if
+installed) and kept in memory, large ones go out with sendfile. Responses
+carry ETag / Last-Modified and honour conditional requests; versioned
+URLs (miniapp.html?v=3) are cacheable for a year.
+
+With SUPABASE_URL / SUPABASE_ANON_KEY set it also serves the score read
+API (see score_feed.py), run on a background asyncio loop:
+    GET /api/scores?limit=20&cursor=...
+    GET /api/scores/<id>/lineage
+    GET /api/search?q=breath&tag=body&lang=en&limit=10
+    POST /api/events  {"events": [{"score_id": "...", "type": "listen"}]}
+    POST /api/sessions  a finished session, see capsules.py
+Events are buffered and written in batches (see events.py), with the
+service role key; each client address gets EVENTS_PER_MINUTE. A session is
+written in one transaction by the ingest_session RPC. Without
+Supabase, /api/search still works over seed_scores_100.sql (search.py).
 """
 
+import asyncio
+import email.utils
+import gzip
+import hashlib
 import http.server
-import socketserver
+import json
+import mimetypes
 import os
+import re
+import threading
+import time
 import webbrowser
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-PORT = 8000
+PORT = int(os.getenv('PORT', '8000'))
 DIRECTORY = Path(__file__).parent
 
-class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
-    
+# URL path -> file under DIRECTORY. Nothing else is ever served.
+STATIC_FILES = {
+    '/': 'index.html',
+    '/index.html': 'index.html',
+    '/miniapp.html': 'miniapp.html',
+    '/index-with-supabase.html': 'index-with-supabase.html',
+    '/deploy-test.html': 'deploy-test.html',
+    '/config.js': 'config.js',
+}
+
+MEMORY_CACHE_LIMIT = 1024 * 1024   # larger files are streamed with sendfile
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+VERSIONED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'no-cache'
+
+API_TIMEOUT = 15.0
+# Idle keep-alive (or slowloris) connections give their thread back after this
+REQUEST_TIMEOUT = 30.0
+API_CACHE_CONTROL = 'public, max-age=30'
+LINEAGE_ROUTE = re.compile(r'^/api/scores/([0-9a-fA-F-]{36})/lineage$')
+MAX_BODY_SIZE = 64 * 1024
+MAX_SESSION_BODY_SIZE = 512 * 1024
+MAX_EVENTS_PER_REQUEST = 50
+EVENTS_PER_MINUTE = float(os.getenv('EVENTS_PER_MINUTE', '60'))
+# Behind a reverse proxy (Heroku, nginx) every request comes from the proxy;
+# it appends the real client address to X-Forwarded-For
+TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+
+
+@dataclass
+class StaticAsset:
+    file_path: Path
+    content_type: str
+    size: int
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    body: Optional[bytes] = None
+    encoded: Optional[dict] = None
+
+    def variant(self, accept_encoding: str) -> tuple[Optional[str], Optional[bytes]]:
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and self.encoded and encoding in self.encoded:
+                return encoding, self.encoded[encoding]
+        return None, self.body
+
+
+class StaticCache:
+    def __init__(self, root: Path):
+        self.root = root
+        self._assets: dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    def get(self, rel_path: str) -> Optional[StaticAsset]:
+        file_path = self.root / rel_path
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+
+        asset = self._assets.get(rel_path)
+        if asset and asset.mtime_ns == stat.st_mtime_ns and asset.size == stat.st_size:
+            return asset
+
+        with self._lock:
+            asset = self._load(file_path, stat)
+            self._assets[rel_path] = asset
+        return asset
+
+    def _load(self, file_path: Path, stat: os.stat_result) -> StaticAsset:
+        content_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+        if stat.st_size > MEMORY_CACHE_LIMIT:
+            return StaticAsset(
+                file_path, content_type, stat.st_size, stat.st_mtime_ns,
+                etag=f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', last_modified=last_modified,
+            )
+
+        body = file_path.read_bytes()
+        encoded = {}
+        if len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            encoded['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                encoded['br'] = brotli.compress(body, quality=11)
+        return StaticAsset(
+            file_path, content_type, len(body), stat.st_mtime_ns,
+            etag=f'"{hashlib.sha1(body).hexdigest()[:20]}"', last_modified=last_modified,
+            body=body, encoded=encoded,
+        )
+
+
+static_cache = StaticCache(DIRECTORY)
+
+
+class BackgroundLoop:
+    """asyncio loop on a daemon thread; handler threads submit coroutines to it."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='api-loop', daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: float = API_TIMEOUT):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+class RateLimiter:
+    """Token bucket per client: up to burst at once, refilled at rate per second."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, client: str, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if client not in self._buckets and len(self._buckets) >= self.max_clients:
+                self._prune(now)
+            self._buckets[client] = (tokens, now)
+            return allowed
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled completely is the same as no bucket
+        refill = self.burst / self.rate
+        self._buckets = {c: b for c, b in self._buckets.items() if now - b[1] < refill}
+        if len(self._buckets) >= self.max_clients:
+            self._buckets.clear()
+
+
+event_limiter = RateLimiter(
+    rate=EVENTS_PER_MINUTE / 60, burst=max(EVENTS_PER_MINUTE, MAX_EVENTS_PER_REQUEST)
+)
+api_loop: Optional[BackgroundLoop] = None
+score_feed = None
+event_buffer = None
+_seed_index = None
+_seed_index_lock = threading.Lock()
+
+
+def seed_search_index():
+    # Local development without Supabase: search the seed scores instead
+    global _seed_index
+    with _seed_index_lock:
+        if _seed_index is None:
+            from search import SearchIndex
+            _seed_index = SearchIndex.from_seed_sql(DIRECTORY / 'seed_scores_100.sql')
+    return _seed_index
+
+
+def create_score_feed():
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_ANON_KEY')
+    if not url or not key:
+        print("⚠️ SUPABASE_URL / SUPABASE_ANON_KEY not set, /api/scores disabled")
+        return None
+    try:
+        from repository import create_repository
+        from score_feed import ScoreFeed
+        from score_sampler import ScorePool
+    except ImportError as e:
+        print(f"⚠️ Score API unavailable ({e}), serving static files only")
+        return None
+    repo = create_repository(url, key)
+    return ScoreFeed(
+        repo,
+        ttl=float(os.getenv('SCORE_FEED_TTL', '30')),
+        pool=ScorePool(repo),
+    )
+
+
+class CustomHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LSRC'
+    timeout = REQUEST_TIMEOUT
+    body_read = True
+
     def end_headers(self):
         # Add CORS headers for development
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -25,25 +244,344 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         super().end_headers()
 
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith('/api/'):
+            self.serve_api(head_only=False)
+        else:
+            self.serve_static(head_only=False)
+
+    def do_HEAD(self):
+        if self.path.startswith('/api/'):
+            self.serve_api(head_only=True)
+        else:
+            self.serve_static(head_only=True)
+
+    def do_POST(self):
+        # Until read_json_body consumes it, the body is still on the socket;
+        # replies close the connection so it isn't parsed as the next request
+        self.body_read = False
+        path = urlsplit(self.path).path
+        if path == '/api/events':
+            self.ingest_events()
+        elif path == '/api/sessions':
+            self.ingest_session()
+        else:
+            self.send_json_error(404, 'Not found')
+
+    def read_json_body(self, max_size: int = MAX_BODY_SIZE):
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            raise ValueError('Content-Length required')
+        if length < 0:
+            raise ValueError('Invalid Content-Length')
+        if length > max_size:
+            raise ValueError('Request body too large')
+        body = self.rfile.read(length)
+        self.body_read = len(body) == length
+        return json.loads(body or b'null')
+
+    def ingest_events(self) -> None:
+        if event_buffer is None:
+            self.send_json_error(503, 'Event API is not configured')
+            return
+
+        from events import EVENT_TYPES
+        from score_feed import FeedError, validate_score_id
+
+        try:
+            payload = self.read_json_body()
+            items = payload.get('events') if isinstance(payload, dict) else None
+            if not isinstance(items, list) or not items:
+                raise ValueError('Expected {"events": [...]}')
+            if len(items) > MAX_EVENTS_PER_REQUEST:
+                raise ValueError(f'At most {MAX_EVENTS_PER_REQUEST} events per request')
+            events = []
+            for item in items:
+                event_type = item.get('type') if isinstance(item, dict) else None
+                if event_type not in EVENT_TYPES:
+                    raise ValueError(f'Event type must be one of {", ".join(EVENT_TYPES)}')
+                events.append((validate_score_id(item.get('score_id')), event_type))
+        except (ValueError, FeedError) as e:
+            # JSONDecodeError is a ValueError too
+            self.send_json_error(400, str(e))
+            return
+        if not event_limiter.allow(self.client_ip(), cost=len(events)):
+            self.send_json_error(429, 'Too many events')
+            return
+
+        def record():
+            for score_id, event_type in events:
+                event_buffer.record(score_id, event_type)
+
+        api_loop.loop.call_soon_threadsafe(record)
+        self.send_json(202, json.dumps({'accepted': len(events)}).encode())
+
+    def ingest_session(self) -> None:
+        if score_feed is None:
+            self.send_json_error(503, 'Session API is not configured')
+            return
+
+        from capsules import CapsuleSession
+
+        try:
+            session = CapsuleSession.parse(self.read_json_body(MAX_SESSION_BODY_SIZE))
+        except ValueError as e:
+            # SessionError and JSONDecodeError are ValueErrors too
+            self.send_json_error(400, str(e))
+            return
+
+        try:
+            result = api_loop.run(score_feed.repo.ingest_session(session.to_rpc()))
+        except Exception as e:
+            self.log_error('Session ingest error: %r', e)
+            self.send_json_error(502, 'Upstream error')
+            return
+        if result is None:
+            self.send_json_error(404, 'Initial score not found')
+            return
+
+        if result.created and result.final_score_id and session.is_public:
+            # The new score heads the feed; don't serve a stale first page
+            api_loop.loop.call_soon_threadsafe(score_feed.cache.invalidate)
+        body = json.dumps({
+            'capsule_id': result.capsule_id,
+            'final_score_id': result.final_score_id,
+            'fragments': result.fragments,
+            'created': result.created,
+        }).encode()
+        self.send_json(201 if result.created else 200, body)
+
+    def client_ip(self) -> str:
+        forwarded = self.headers.get('X-Forwarded-For')
+        if TRUST_FORWARDED_FOR and forwarded:
+            return forwarded.split(',')[-1].strip()
+        return self.client_address[0]
+
+    def send_empty(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_json(self, status: int, body: bytes, etag: Optional[str] = None, head_only: bool = False) -> None:
+        self.send_response(status)
+        if not self.body_read:
+            # Also sets close_connection
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', API_CACHE_CONTROL)
+        else:
+            self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def send_json_error(self, status: int, message: str) -> None:
+        self.send_json(status, json.dumps({'error': message}).encode())
+
+    def etag_matches(self, etag: str) -> bool:
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is None:
+            return False
+        tags = {t.strip().removeprefix('W/') for t in if_none_match.split(',')}
+        return '*' in tags or etag in tags
+
+    def search(self, params: dict) -> None:
+        # Not behind the 503 below: without Supabase it falls back to the seed scores
+        try:
+            from score_feed import FeedError, search_response
+        except ImportError:
+            self.send_json_error(503, 'Search is not available')
+            return
+
+        query = params.get('q', [''])[0]
+        tags = params.get('tag', [])
+        language = params.get('lang', [None])[0]
+        try:
+            try:
+                limit = int(params.get('limit', ['10'])[0])
+            except ValueError:
+                raise FeedError('limit must be an integer')
+            if score_feed is not None:
+                response = api_loop.run(score_feed.search(query, tags, language, limit))
+            else:
+                response = search_response(seed_search_index(), query, tags, language, limit)
+        except FeedError as e:
+            self.send_json_error(400, str(e))
+            return
+        except Exception as e:
+            self.log_error('Search error: %r', e)
+            self.send_json_error(502, 'Upstream error')
+            return
+        self.send_json(200, response.body, None, head_only=self.command == 'HEAD')
+
+    def serve_api(self, head_only: bool) -> None:
+        url = urlsplit(self.path)
+        if url.path == '/api/search':
+            self.search(parse_qs(url.query))
+            return
+
+        if score_feed is None:
+            self.send_json_error(503, 'Score API is not configured')
+            return
+
+        from score_feed import FeedError
+
+        params = parse_qs(url.query)
+        lineage = LINEAGE_ROUTE.match(url.path)
+        try:
+            if url.path == '/api/scores':
+                try:
+                    limit = int(params.get('limit', ['20'])[0])
+                except ValueError:
+                    raise FeedError('limit must be an integer')
+                response = api_loop.run(score_feed.page(params.get('cursor', [None])[0], limit))
+            elif lineage:
+                response = api_loop.run(score_feed.lineage(lineage.group(1)))
+            else:
+                self.send_json_error(404, 'Not found')
+                return
+        except FeedError as e:
+            self.send_json_error(400, str(e))
+            return
+        except Exception as e:
+            self.log_error('Score API error: %r', e)
+            self.send_json_error(502, 'Upstream error')
+            return
+
+        if response is None:
+            self.send_json_error(404, 'Score not found')
+        elif self.etag_matches(response.etag):
+            self.send_response(304)
+            self.send_header('ETag', response.etag)
+            self.send_header('Cache-Control', API_CACHE_CONTROL)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_json(200, response.body, response.etag, head_only)
+
+    def not_modified(self, asset: StaticAsset) -> bool:
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # Encoded variants carry a -gzip / -br suffix; any of them matches
+            tags = {t.strip().removeprefix('W/').strip('"') for t in if_none_match.split(',')}
+            tags = {t.removesuffix('-gzip').removesuffix('-br') for t in tags}
+            return '*' in tags or asset.etag.strip('"') in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(asset.mtime_ns / 1e9) <= since
+        return False
+
+    def serve_static(self, head_only: bool) -> None:
+        url = urlsplit(self.path)
+        rel_path = STATIC_FILES.get(url.path)
+        asset = static_cache.get(rel_path) if rel_path else None
+        if asset is None:
+            self.send_empty(404)
+            return
+
+        versioned = 'v' in parse_qs(url.query)
+        cache_control = VERSIONED_CACHE_CONTROL if versioned else DEFAULT_CACHE_CONTROL
+
+        if self.not_modified(asset):
+            self.send_response(304)
+            self.send_header('ETag', asset.etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        encoding, body = (None, None)
+        if asset.body is not None:
+            encoding, body = asset.variant(self.headers.get('Accept-Encoding', ''))
+
+        self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('Content-Length', str(len(body) if body is not None else asset.size))
+        self.send_header('ETag', asset.etag if not encoding else f'{asset.etag[:-1]}-{encoding}"')
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', cache_control)
+        if asset.encoded:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+
+        if head_only:
+            return
+        if body is not None:
+            self.wfile.write(body)
+        else:
+            with open(asset.file_path, 'rb') as f:
+                self.connection.sendfile(f)
+
+
+class LSRCServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
 def main():
+    global api_loop, score_feed, event_buffer
     os.chdir(DIRECTORY)
-    
-    with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
+
+    score_feed = create_score_feed()
+    if score_feed is not None:
+        from events import EventBuffer
+
+        api_loop = BackgroundLoop()
+        # Warm the score pool and lineage index before the first request
+        asyncio.run_coroutine_threadsafe(score_feed.pool.ensure_fresh(), api_loop.loop)
+        # ingest_score_events takes batched counts, so anon can't call it
+        # (migrations/013_score_events_lockdown.sql)
+        service_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        if service_key:
+            from repository import create_repository
+
+            event_buffer = EventBuffer(
+                create_repository(os.getenv('SUPABASE_URL'), service_key),
+                flush_interval=float(os.getenv('EVENTS_FLUSH_INTERVAL', '5')),
+            )
+            asyncio.run_coroutine_threadsafe(event_buffer.run(), api_loop.loop)
+        else:
+            print("⚠️ SUPABASE_SERVICE_ROLE_KEY not set, /api/events disabled")
+
+    with LSRCServer(("", PORT), CustomHTTPRequestHandler) as httpd:
         print(f"🚀 Server running at http://localhost:{PORT}")
         print(f"📁 Serving files from: {DIRECTORY}")
+        if score_feed is not None:
+            print(f"📡 Score API: http://localhost:{PORT}/api/scores")
         print("🎵 Open the URL in your browser to test the Mini App")
         print("🛑 Press Ctrl+C to stop the server")
-        
+
         try:
             # Try to open browser automatically
             webbrowser.open(f'http://localhost:{PORT}')
         except:
             pass
-        
+
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\n🛑 Server stopped")
 
+    if event_buffer is not None and len(event_buffer):
+        try:
+            api_loop.run(event_buffer.flush())
+        except Exception as e:
+            print(f"⚠️ Could not flush pending events: {e}")
+
 if __name__ == "__main__":
     main()
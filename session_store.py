@@ -0,0 +1,117 @@
+"""
+LSRC bot session store
+Per-user chat state (guide chat mode, assistant thread) with TTL eviction.
+Memory backend is LRU-bounded; SQLite backend survives restarts and is
+shared by every bot process on the host (WAL mode).
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Protocol
+
+DEFAULT_TTL = 7 * 86400
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+@dataclass
+class Session:
+    user_id: int
+    chat_mode: bool = False
+    thread_id: Optional[str] = None
+    updated_at: float = field(default_factory=time.time)
+
+
+class SessionStore(Protocol):
+    def get(self, user_id: int) -> Session: ...
+    def save(self, session: Session) -> None: ...
+    def delete(self, user_id: int) -> None: ...
+    def evict_expired(self) -> int: ...
+
+
+class MemorySessionStore:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: OrderedDict[int, Session] = OrderedDict()
+
+    def get(self, user_id: int) -> Session:
+        session = self._data.get(user_id)
+        if session is None or time.time() - session.updated_at > self.ttl:
+            return Session(user_id)
+        self._data.move_to_end(user_id)
+        return session
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.time()
+        self._data[session.user_id] = session
+        self._data.move_to_end(session.user_id)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, user_id: int) -> None:
+        self._data.pop(user_id, None)
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        expired = [uid for uid, s in self._data.items() if s.updated_at < cutoff]
+        for uid in expired:
+            del self._data[uid]
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'user_id INTEGER PRIMARY KEY, chat_mode INTEGER NOT NULL DEFAULT 0, '
+            'thread_id TEXT, updated_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)')
+
+    def get(self, user_id: int) -> Session:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT chat_mode, thread_id, updated_at FROM sessions WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return Session(user_id)
+        return Session(user_id, chat_mode=bool(row[0]), thread_id=row[1], updated_at=row[2])
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO sessions (user_id, chat_mode, thread_id, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                (session.user_id, int(session.chat_mode), session.thread_id, session.updated_at),
+            )
+
+    def delete(self, user_id: int) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                'DELETE FROM sessions WHERE updated_at < ?', (time.time() - self.ttl,)
+            )
+        return cursor.rowcount
+
+
+def create_session_store(
+    backend: str = 'sqlite',
+    path: str = 'sessions.sqlite3',
+    ttl: float = DEFAULT_TTL,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+) -> SessionStore:
+    if backend == 'memory':
+        return MemorySessionStore(ttl=ttl, max_entries=max_entries)
+    return SQLiteSessionStore(path, ttl=ttl)
@@ -6,9 +6,15 @@ Daily score push + weekly digest + OpenAI Assistant + Mini App integration
 
 import os
 import asyncio
+import hashlib
 import logging
+import mimetypes
 import random
-from datetime import datetime, time, timedelta
+import signal
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -16,9 +22,19 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, filters
 )
-from supabase import create_client, Client
-from openai import OpenAI
-import requests
+from telegram.request import HTTPXRequest
+from openai import AsyncOpenAI, NotFoundError
+import httpx
+import numpy as np
+
+import metrics
+from answer_cache import create_answer_cache
+from broadcast import Broadcaster, BroadcastMessage
+from personalize import NO_SCORE, assign_scores
+from repository import AudioFile, DigestRow, Score, create_repository
+from scheduling import CHUNK_SIZE, Slot, chunked, parse_time, plan_slots, run_checkpointed
+from score_sampler import ScorePool
+from session_store import Session, create_session_store
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -27,8 +43,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Overridable for local Bot API servers and the bench/ fakes; the OpenAI
+# client likewise honours OPENAI_BASE_URL
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org').rstrip('/')
 SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_ANON_KEY')
+# The bot is a trusted backend: broadcast, subscriber and checkpoint RPCs
+# are not executable with the public anon key
+SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 WEBAPP_URL = (
     os.getenv('WEBAPP_URL')
     or os.getenv('TELEGRAM_WEBAPP_URL')
@@ -36,13 +57,63 @@ WEBAPP_URL = (
 )
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID')
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '30'))
+SUPABASE_MAX_WORKERS = int(os.getenv('SUPABASE_MAX_WORKERS', '8'))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '10'))
+MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', '4'))
+ANSWER_CACHE_BACKEND = os.getenv('ANSWER_CACHE_BACKEND', 'memory')
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', 'answer_cache.sqlite3')
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', str(7 * 86400)))
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '2000'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.85'))
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'sessions.sqlite3')
+SESSION_TTL = float(os.getenv('SESSION_TTL', str(7 * 86400)))
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT') or os.getenv('WEBHOOK_PORT', '8443'))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
+PUSH_HISTORY_WINDOW = timedelta(days=int(os.getenv('PUSH_HISTORY_DAYS', '90')))
+PUSH_SLOTS = int(os.getenv('PUSH_SLOTS', '24'))
+PUSH_WINDOW_START = parse_time(os.getenv('PUSH_WINDOW_START', '09:00'))
+PUSH_WINDOW_HOURS = float(os.getenv('PUSH_WINDOW_HOURS', '12'))
+DIGEST_SLOTS = int(os.getenv('DIGEST_SLOTS', '8'))
+DIGEST_WINDOW_START = parse_time(os.getenv('DIGEST_WINDOW_START', '10:00'))
+DIGEST_WINDOW_HOURS = float(os.getenv('DIGEST_WINDOW_HOURS', '4'))
+DIGEST_WEEKDAY = int(os.getenv('DIGEST_WEEKDAY', '0'))  # Monday
+CATCH_UP_WINDOW = timedelta(hours=6)
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', '250'))
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+FIND_RESULTS = int(os.getenv('FIND_RESULTS', '5'))
+
+# Only the update types our handlers consume (messages + inline buttons)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+repo = create_repository(
+    SUPABASE_URL, SUPABASE_KEY,
+    max_workers=SUPABASE_MAX_WORKERS, timeout=SUPABASE_TIMEOUT,
+)
+score_pool = ScorePool(repo)
+answer_cache = create_answer_cache(
+    ANSWER_CACHE_BACKEND, ANSWER_CACHE_PATH,
+    ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY or None,
+)
+sessions = create_session_store(SESSION_BACKEND, SESSION_DB_PATH, ttl=SESSION_TTL)
+loop_monitor = metrics.LoopMonitor(block_threshold=LOOP_BLOCK_THRESHOLD_MS / 1000)
+metrics.REGISTRY.gauge('lsrc_score_pool_size', 'Public scores in the warm pool', fn=lambda: len(score_pool))
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-openai_client: OpenAI | None = None
+openai_client: AsyncOpenAI | None = None
 if OPENAI_API_KEY:
     try:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
         if OPENAI_ASSISTANT_ID:
             logger.info(f"OpenAI Assistant initialized: {OPENAI_ASSISTANT_ID[:20]}...")
         else:
@@ -55,105 +126,204 @@ if OPENAI_API_KEY:
 # AUDIO HANDLER
 # ============================================================
 
-class AudioHandler:
-    @staticmethod
-    async def download_audio(bot, file_id: str) -> bytes:
-        try:
-            file = await bot.get_file(file_id)
-            return await file.download_as_bytearray()
-        except Exception as e:
-            logger.error(f"Failed to download audio: {e}")
-            raise
+AUDIO_CHUNK_SIZE = 64 * 1024
+AUDIO_EXTENSIONS = {
+    'audio/ogg': '.ogg',
+    'audio/opus': '.opus',
+    'audio/mpeg': '.mp3',
+    'audio/mp4': '.m4a',
+    'audio/x-m4a': '.m4a',
+    'audio/aac': '.aac',
+    'audio/wav': '.wav',
+    'audio/x-wav': '.wav',
+    'audio/flac': '.flac',
+    'audio/webm': '.webm',
+}
+
+
+def audio_extension(media, mime_type: str) -> str:
+    # Prefer the sender's own file name, then the MIME type
+    suffix = os.path.splitext(getattr(media, 'file_name', None) or '')[1].lower()
+    if 1 < len(suffix) <= 6 and suffix[1:].isalnum():
+        return suffix
+    return AUDIO_EXTENSIONS.get(mime_type) or mimetypes.guess_extension(mime_type) or '.ogg'
 
-    @staticmethod
-    async def upload_to_supabase(audio_data: bytes, user_id: int, audio_type: str) -> dict:
-        try:
-            timestamp = datetime.now().isoformat().replace(':', '-')
-            file_name = f"{audio_type}_{user_id}_{timestamp}.ogg"
-            file_path = f"audio/{file_name}"
-
-            supabase.storage.from_("audio").upload(
-                file_path, audio_data,
-                file_options={"content-type": "audio/ogg"}
-            )
 
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/audio/{file_path}"
-
-            db_result = supabase.table('audio_files').insert({
-                'file_name': file_name,
+class AudioHandler:
+    # Audio is piped chunk by chunk from Telegram's file endpoint into
+    # storage, so memory per upload stays at one chunk whatever the file size.
+    # Repeated audio is detected by file_unique_id before any download.
+    _upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    _http: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def http(cls) -> httpx.AsyncClient:
+        if cls._http is None:
+            cls._http = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+        return cls._http
+
+    @classmethod
+    async def iter_file_chunks(cls, bot, file_id: str):
+        file = await bot.get_file(file_id)
+        async with cls.http().stream('GET', file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(AUDIO_CHUNK_SIZE):
+                yield chunk
+
+    @classmethod
+    async def stream_to_supabase(cls, bot, media, user_id: int, audio_type: str) -> AudioFile:
+        timestamp = datetime.now().isoformat().replace(':', '-')
+        # Voice notes are always OGG/Opus; audio files carry their own type
+        mime_type = getattr(media, 'mime_type', None) or 'audio/ogg'
+        extension = audio_extension(media, mime_type)
+        row = {
+            'file_name': f"{audio_type}_{user_id}_{timestamp}{extension}",
+            'mime_type': mime_type,
+            'user_id': str(user_id),
+            'file_unique_id': media.file_unique_id,
+        }
+
+        # Forwarded / re-sent audio keeps its file_unique_id: reuse the object
+        existing = await repo.find_audio_by_unique_id(media.file_unique_id)
+        if existing:
+            logger.info(f"Audio {media.file_unique_id} already stored, skipping upload")
+            return await repo.insert_audio_file(cls._pointing_at(row, existing))
+
+        async with cls._upload_slots:
+            try:
+                # Objects are content-addressed by Telegram's file_unique_id
+                file_path = f"audio/{media.file_unique_id}{extension}"
+                checksum = hashlib.sha256()
+                size = 0
+
+                async def chunks():
+                    nonlocal size
+                    async for chunk in cls.iter_file_chunks(bot, media.file_id):
+                        checksum.update(chunk)
+                        size += len(chunk)
+                        yield chunk
+
+                created = await repo.upload_audio_stream(file_path, chunks(), mime_type)
+            except Exception as e:
+                logger.error(f"Failed to stream audio to Supabase: {e}")
+                raise
+
+        if not created:
+            # A concurrent upload of the same file won the race
+            existing = await repo.find_audio_by_unique_id(media.file_unique_id)
+            if existing:
+                return await repo.insert_audio_file(cls._pointing_at(row, existing))
+            return await repo.insert_audio_file({
+                **row,
                 'file_path': file_path,
-                'file_url': public_url,
-                'file_size': len(audio_data),
-                'mime_type': 'audio/ogg',
-                'user_id': str(user_id),
-            }).execute()
-
-            return {
-                'file_name': file_name,
-                'public_url': public_url,
-                'audio_file_id': db_result.data[0]['id'] if db_result.data else None
-            }
-        except Exception as e:
-            logger.error(f"Failed to upload to Supabase: {e}")
-            raise
+                'file_url': repo.public_audio_url(file_path),
+                'file_size': media.file_size or 0,
+            })
+
+        sha256 = checksum.hexdigest()
+        same_content = await repo.find_audio_by_checksum(sha256)
+        if same_content and same_content.file_path != file_path:
+            await repo.delete_object(file_path)
+            return await repo.insert_audio_file(cls._pointing_at(row, same_content))
+
+        return await repo.insert_audio_file({
+            **row,
+            'file_path': file_path,
+            'file_url': repo.public_audio_url(file_path),
+            'file_size': size,
+            'content_sha256': sha256,
+        })
+
+    @staticmethod
+    def _pointing_at(row: dict, existing: AudioFile) -> dict:
+        return {
+            **row,
+            'file_path': existing.file_path,
+            'file_url': existing.file_url,
+            'file_size': existing.file_size,
+            'content_sha256': existing.content_sha256,
+            **existing.analysis(),
+        }
 
 
 # ============================================================
 # OPENAI ASSISTANT CHAT
 # ============================================================
 
-async def chat_with_assistant(user_text: str) -> str:
-    if not openai_client or not OPENAI_ASSISTANT_ID:
-        return "Assistant not configured."
+TELEGRAM_MESSAGE_LIMIT = 4096
+STREAM_EDIT_INTERVAL = 1.0  # seconds between progressive edits of the reply
 
-    try:
-        loop = asyncio.get_event_loop()
+_chat_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
 
-        thread = await loop.run_in_executor(
-            None, lambda: openai_client.beta.threads.create()
-        )
 
-        await loop.run_in_executor(
-            None, lambda: openai_client.beta.threads.messages.create(
-                thread_id=thread.id, role="user", content=user_text
-            )
-        )
+class AssistantError(Exception):
+    pass
 
-        run = await loop.run_in_executor(
-            None, lambda: openai_client.beta.threads.runs.create(
-                thread_id=thread.id, assistant_id=OPENAI_ASSISTANT_ID
-            )
-        )
 
-        elapsed = 0
-        while run.status in ['queued', 'in_progress'] and elapsed < 60:
-            await asyncio.sleep(2)
-            elapsed += 2
-            run = await loop.run_in_executor(
-                None, lambda: openai_client.beta.threads.runs.retrieve(
-                    thread_id=thread.id, run_id=run.id
-                )
-            )
+async def get_thread_id(session: Session, fresh: bool = False) -> str:
+    # One thread per user, kept in the session so context carries over
+    if fresh or not session.thread_id:
+        with metrics.OPENAI_SECONDS.time('threads.create'):
+            thread = await openai_client.beta.threads.create()
+        session.thread_id = thread.id
+        sessions.save(session)
+    return session.thread_id
+
+
+async def seed_thread(session: Session, user_text: str, reply: str) -> None:
+    """Start the user's thread with a cached exchange, so the next
+    question is asked with it as context."""
+    if not openai_client:
+        return
+    with metrics.OPENAI_SECONDS.time('threads.create'):
+        thread = await openai_client.beta.threads.create(messages=[
+            {"role": "user", "content": user_text},
+            {"role": "assistant", "content": reply},
+        ])
+    session.thread_id = thread.id
+    sessions.save(session)
+
+
+async def chat_with_assistant(session: Session, user_text: str):
+    if not openai_client or not OPENAI_ASSISTANT_ID:
+        yield "Assistant not configured."
+        return
 
-        if run.status == 'completed':
-            messages = await loop.run_in_executor(
-                None, lambda: openai_client.beta.threads.messages.list(
-                    thread_id=thread.id, order="asc"
-                )
+    thread_id = await get_thread_id(session)
+    try:
+        with metrics.OPENAI_SECONDS.time('messages.create'):
+            await openai_client.beta.threads.messages.create(
+                thread_id=thread_id, role="user", content=user_text
+            )
+    except NotFoundError:
+        # Thread expired or was deleted on OpenAI's side
+        thread_id = await get_thread_id(session, fresh=True)
+        with metrics.OPENAI_SECONDS.time('messages.create'):
+            await openai_client.beta.threads.messages.create(
+                thread_id=thread_id, role="user", content=user_text
             )
-            for message in reversed(messages.data):
-                if message.role == 'assistant':
-                    content = message.content[0] if message.content else None
-                    if content and hasattr(content, 'text'):
-                        return content.text.value
-            return "No response received."
-        else:
-            logger.error(f"Assistant run failed: {run.status}")
-            return f"Error: {run.status}"
 
-    except Exception as e:
-        logger.error(f"Assistant error: {e}", exc_info=True)
-        return f"Error: {str(e)}"
+    with metrics.OPENAI_SECONDS.time('runs.stream') as timer:
+        started = time.perf_counter()
+        first = True
+        async with openai_client.beta.threads.runs.stream(
+            thread_id=thread_id, assistant_id=OPENAI_ASSISTANT_ID
+        ) as stream:
+            async for delta in stream.text_deltas:
+                if first:
+                    metrics.OPENAI_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                    first = False
+                # The caller's message edits are not OpenAI time
+                with timer.paused():
+                    yield delta
+            run = await stream.get_final_run()
+
+    if run.status != 'completed':
+        raise AssistantError(f"Assistant run ended with status: {run.status}")
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    return [text[i:i + limit] for i in range(0, len(text), limit)] or [""]
 
 
 # ============================================================
@@ -169,26 +339,11 @@ PUSH_HOOKS = [
 ]
 
 
-async def get_random_score_for_push() -> Optional[dict]:
-    try:
-        result = supabase.table('scores').select('id, text, created_at').eq(
-            'is_public', True
-        ).limit(50).execute()
-        if result.data:
-            return random.choice(result.data)
-    except Exception as e:
-        logger.error(f"Failed to fetch score for push: {e}")
-    return None
-
-
-async def get_all_user_ids() -> list[str]:
+async def refresh_score_pool(context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        result = supabase.table('capsules').select('user_id').execute()
-        if result.data:
-            return list(set(r['user_id'] for r in result.data if r['user_id']))
+        await score_pool.ensure_fresh()
     except Exception as e:
-        logger.error(f"Failed to fetch user IDs: {e}")
-    return []
+        logger.error(f"Failed to refresh score pool: {e}")
 
 
 def format_days_ago(date_str: str) -> str:
@@ -207,99 +362,255 @@ def format_days_ago(date_str: str) -> str:
         return ""
 
 
-async def send_daily_push(context: ContextTypes.DEFAULT_TYPE) -> None:
-    score = await get_random_score_for_push()
-    if not score:
-        logger.warning("No score found for daily push")
-        return
+def continued_line(score_id: str, subject: str) -> str:
+    # Descendants in the lineage index, e.g. "your score was continued 7 times"
+    if score_id not in score_pool.lineage:
+        return ""
+    count = score_pool.lineage.continuations(score_id)
+    if not count:
+        return ""
+    return f"{subject} continued {count} time{'s' if count != 1 else ''}."
+
+
+def make_broadcaster(bot) -> Broadcaster:
+    return Broadcaster(bot, concurrency=BROADCAST_CONCURRENCY, global_rate=BROADCAST_RATE)
 
-    user_ids = await get_all_user_ids()
-    if not user_ids:
-        logger.info("No users to push to")
-        return
 
-    days_ago = format_days_ago(score.get('created_at', ''))
+def push_text(score: Score) -> str:
+    days_ago = format_days_ago(score.created_at or '')
     hook = random.choice(PUSH_HOOKS)
     meta = f"Created by a human {days_ago}." if days_ago else ""
+    continued = continued_line(score.id, "It has been")
+    if continued:
+        meta = f"{meta} {continued}".strip()
+    return f'"{score.text}"\n\n{meta}\n\n{hook}'
 
-    text = f'"{score["text"]}"\n\n{meta}\n\n{hook}'
+
+async def send_daily_push(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # One slot of the day's push: the subscribers in slot.shards
+    slot: Slot = context.job.data
+    now = datetime.now(timezone.utc)
+    window_start = slot.window_start(now)
+    try:
+        await score_pool.ensure_fresh()
+    except Exception as e:
+        logger.error(f"Failed to refresh score pool: {e}")
+    scores = score_pool.scores()
+    if not scores:
+        logger.warning("No score found for daily push")
+        return
 
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})]
     ])
+    delivered: list[tuple[str, str]] = []
 
-    sent = 0
-    for uid in user_ids:
-        try:
-            chat_id = int(uid)
-        except (ValueError, TypeError):
-            continue
-        try:
-            await context.bot.send_message(
-                chat_id=chat_id, text=text, reply_markup=keyboard
+    async def chunks(after_user: Optional[str]):
+        # Everyone's score is chosen up front, before the first send
+        recipients = [
+            r async for r in repo.iter_push_audience(
+                window_start - PUSH_HISTORY_WINDOW, shards=slot.shards, after_user=after_user
             )
-            sent += 1
+        ]
+        if not recipients:
+            return
+        weights = np.array([score_pool.weight(s, now) for s in scores])
+        assignment = await asyncio.to_thread(assign_scores, scores, weights, recipients)
+
+        texts: dict[int, str] = {}
+        for batch in chunked(list(zip(recipients, assignment.tolist()))):
+            chunk = []
+            for recipient, j in batch:
+                message = None
+                try:
+                    chat_id = int(recipient.user_id)
+                except (ValueError, TypeError):
+                    chat_id = None
+                if chat_id is not None and j != NO_SCORE:
+                    if j not in texts:
+                        texts[j] = push_text(scores[j])
+                    message = BroadcastMessage(
+                        chat_id=chat_id, text=texts[j], reply_markup=keyboard, tag=scores[j].id
+                    )
+                chunk.append((recipient.user_id, message))
+            yield chunk
+
+    async def record_deliveries() -> None:
+        batch = delivered[:]
+        delivered.clear()
+        try:
+            await repo.record_push_deliveries(batch)
         except Exception as e:
-            logger.warning(f"Push failed for {uid}: {e}")
+            logger.error(f"Failed to record {len(batch)} push deliveries: {e}")
 
-    logger.info(f"Daily push sent to {sent}/{len(user_ids)} users")
+    try:
+        await run_checkpointed(
+            repo, make_broadcaster(context.bot), slot, slot.daily_run_key(now), chunks,
+            on_sent=lambda m: delivered.append((str(m.chat_id), m.tag)),
+            after_chunk=record_deliveries,
+            on_busy=lambda until: retry_after_lease(context, until),
+        )
+    except Exception as e:
+        # The checkpoint keeps what was done; catch-up on restart resumes
+        logger.error(f"{slot.name} failed: {e}", exc_info=True)
 
 
 # ============================================================
 # WEEKLY DIGEST
 # ============================================================
 
+DIGEST_WINDOW = timedelta(days=7)
+
+
+def digest_message(row: DigestRow, keyboard: InlineKeyboardMarkup) -> Optional[BroadcastMessage]:
+    try:
+        chat_id = int(row.author_user_id)
+    except (ValueError, TypeError):
+        return None
+
+    total_listens = row.total_listens
+    if not total_listens:
+        return None
+
+    continued = continued_line(row.top_score_id, "It was")
+    text = (
+        f"This week, your scores were heard {total_listens} time{'s' if total_listens != 1 else ''}.\n\n"
+        f'Your most heard score:\n"{row.top_score_text}"\n\n'
+        + (f"{continued}\n\n" if continued else "")
+        + "Someone is listening. Keep creating."
+    )
+    return BroadcastMessage(chat_id=chat_id, text=text, reply_markup=keyboard)
+
+
 async def send_weekly_digest(context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_ids = await get_all_user_ids()
-    if not user_ids:
-        return
+    slot: Slot = context.job.data
+    now = datetime.now(timezone.utc)
+    # Anchored to the window, so a resumed run counts the same week
+    since = slot.window_start(now) - DIGEST_WINDOW
+    try:
+        await score_pool.ensure_fresh()
+    except Exception as e:
+        logger.error(f"Failed to refresh score pool: {e}")
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})]
+    ])
 
-    sent = 0
-    for uid in user_ids:
-        try:
-            result = supabase.table('scores').select(
-                'id, text, usage_count'
-            ).eq('author_user_id', uid).eq('is_public', True).execute()
-
-            scores = result.data or []
-            heard = [s for s in scores if (s.get('usage_count') or 0) > 0]
-            if not heard:
-                continue
-
-            total_listens = sum(s.get('usage_count', 0) for s in heard)
-            top = max(heard, key=lambda s: s.get('usage_count', 0))
-
-            text = (
-                f"This week, your scores were heard {total_listens} time{'s' if total_listens != 1 else ''}.\n\n"
-                f'Your most heard score:\n"{top["text"]}"\n\n'
-                f"Someone is listening. Keep creating."
-            )
+    async def chunks(after_author: Optional[str]):
+        while True:
+            rows = await repo.weekly_digest_page(since, after_author, CHUNK_SIZE, slot.shards)
+            if not rows:
+                return
+            yield [(row.author_user_id, digest_message(row, keyboard)) for row in rows]
+            after_author = rows[-1].author_user_id
 
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})]
-            ])
+    try:
+        await run_checkpointed(
+            repo, make_broadcaster(context.bot), slot, slot.weekly_run_key(now), chunks,
+            on_busy=lambda until: retry_after_lease(context, until),
+        )
+    except Exception as e:
+        logger.error(f"{slot.name} failed: {e}", exc_info=True)
 
-            try:
-                chat_id = int(uid)
-            except (ValueError, TypeError):
-                continue
 
-            await context.bot.send_message(
-                chat_id=chat_id, text=text, reply_markup=keyboard
-            )
-            sent += 1
-        except Exception as e:
-            logger.warning(f"Digest failed for {uid}: {e}")
+# ============================================================
+# SCHEDULING
+# ============================================================
+
+def retry_after_lease(context: ContextTypes.DEFAULT_TYPE, until: datetime) -> None:
+    # Another process holds the slot. If it dies, its lease runs out and
+    # nobody else would pick the slot up, so look again then; a finished
+    # slot makes the retry a no-op
+    job = context.job
+    context.job_queue.run_once(
+        job.callback, when=until + timedelta(seconds=5), data=job.data, name=f"{job.data.name} retry"
+    )
 
-    logger.info(f"Weekly digest sent to {sent} users")
+
+def ptb_weekday(weekday: int) -> int:
+    # Python: Monday=0; PTB run_daily days: Sunday=0
+    return (weekday + 1) % 7
+
+
+def schedule_broadcasts(job_queue) -> None:
+    push_slots = plan_slots('daily_push', PUSH_SLOTS, PUSH_WINDOW_START, PUSH_WINDOW_HOURS)
+    for slot in push_slots:
+        job_queue.run_daily(send_daily_push, time=slot.at, data=slot, name=slot.name)
+    logger.info(
+        f"Scheduled daily push in {len(push_slots)} slots from "
+        f"{PUSH_WINDOW_START:%H:%M} UTC over {PUSH_WINDOW_HOURS:g}h"
+    )
+
+    digest_slots = plan_slots('weekly_digest', DIGEST_SLOTS, DIGEST_WINDOW_START, DIGEST_WINDOW_HOURS)
+    for slot in digest_slots:
+        job_queue.run_daily(
+            send_weekly_digest, time=slot.at,
+            days=(ptb_weekday(DIGEST_WEEKDAY + slot.day_shift),), data=slot, name=slot.name,
+        )
+    logger.info(
+        f"Scheduled weekly digest in {len(digest_slots)} slots, weekday {DIGEST_WEEKDAY} "
+        f"from {DIGEST_WINDOW_START:%H:%M} UTC over {DIGEST_WINDOW_HOURS:g}h"
+    )
+
+    # Slots whose time passed recently (e.g. we restarted mid-broadcast) run
+    # now; their checkpoints make finished ones a no-op
+    now = datetime.now(timezone.utc)
+    due = [
+        (callback, slot)
+        for callback, slots in ((send_daily_push, push_slots), (send_weekly_digest, digest_slots))
+        for slot in slots
+        if timedelta(0) <= now - (slot.window_start(now) + slot.offset) < CATCH_UP_WINDOW
+        and (callback is send_daily_push or slot.window_start(now).weekday() == DIGEST_WEEKDAY)
+    ]
+    for i, (callback, slot) in enumerate(due):
+        job_queue.run_once(callback, when=10 + 30 * i, data=slot, name=f"{slot.name} catch-up")
+    if due:
+        logger.info(f"Catching up on {len(due)} recent broadcast slots")
 
 
 # ============================================================
 # COMMAND HANDLERS
 # ============================================================
 
+# Last language_code written per user, LRU-bounded: a forgotten user just
+# costs one more upsert
+SUBSCRIBER_CACHE_SIZE = 50_000
+_subscriber_languages: OrderedDict[int, Optional[str]] = OrderedDict()
+
+
+async def remember_subscriber(user) -> None:
+    # language_code drives push personalization; write only when it changes
+    if user is None:
+        return
+    if user.id in _subscriber_languages and _subscriber_languages[user.id] == user.language_code:
+        _subscriber_languages.move_to_end(user.id)
+        return
+    try:
+        await repo.upsert_subscriber(str(user.id), user.language_code)
+    except Exception as e:
+        logger.warning(f"Failed to upsert subscriber {user.id}: {e}")
+        return
+    _subscriber_languages[user.id] = user.language_code
+    _subscriber_languages.move_to_end(user.id)
+    while len(_subscriber_languages) > SUBSCRIBER_CACHE_SIZE:
+        _subscriber_languages.popitem(last=False)
+
+
+def set_chat_mode(user_id: int, enabled: bool) -> None:
+    session = sessions.get(user_id)
+    session.chat_mode = enabled
+    sessions.save(session)
+
+
+async def evict_sessions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    evicted = sessions.evict_expired()
+    if evicted:
+        logger.info(f"Evicted {evicted} expired sessions")
+
+
+@metrics.timed_handler
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
+    await remember_subscriber(user)
 
     keyboard = [
         [InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})],
@@ -322,11 +633,13 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
 
 
+@metrics.timed_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = (
         "*LSRC*\n\n"
         "/start — begin\n"
         "/chat — talk to the guide\n"
+        "/find — search scores, e.g. /find breath #body\n"
         "/help — this message\n\n"
         "Open the app, press Listen, and follow the flow."
     )
@@ -339,8 +652,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+@metrics.timed_handler
 async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
+    await remember_subscriber(update.effective_user)
 
     if not OPENAI_ASSISTANT_ID or not openai_client:
         await update.message.reply_text(
@@ -348,17 +663,37 @@ async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         return
 
-    if 'user_sessions' not in context.bot_data:
-        context.bot_data['user_sessions'] = {}
-    if user_id not in context.bot_data['user_sessions']:
-        context.bot_data['user_sessions'][user_id] = {}
-    context.bot_data['user_sessions'][user_id]['chat_mode'] = True
+    set_chat_mode(user_id, True)
 
     await update.message.reply_text(
         "Ask me anything about Deep Listening, Pauline Oliveros, or this practice."
     )
 
 
+@metrics.timed_handler
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = ' '.join(context.args or [])
+    if not query:
+        await update.message.reply_text("Usage: /find words #tag lang:en")
+        return
+    try:
+        await score_pool.ensure_fresh()
+    except Exception as e:
+        logger.error(f"Failed to refresh score pool: {e}")
+
+    result = score_pool.search.search(query, limit=FIND_RESULTS)
+    if not result.hits:
+        await update.message.reply_text("No scores found.")
+        return
+
+    lines = [f"{result.total} scores found" if result.total > len(result.hits) else "Scores found:"]
+    for i, hit in enumerate(result.hits, 1):
+        lines.append(f"\n{i}. «{hit.score.text}»")
+    keyboard = [[InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})]]
+    # No parse_mode: score text is user-written
+    await update.message.reply_text('\n'.join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+
 async def about_callback(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
@@ -382,6 +717,7 @@ async def about_callback(update: Update, context) -> None:
     )
 
 
+@metrics.timed_handler
 async def handle_voice_message(update: Update, context) -> None:
     user = update.effective_user
     voice = update.message.voice or update.message.audio
@@ -393,14 +729,12 @@ async def handle_voice_message(update: Update, context) -> None:
     try:
         processing_msg = await update.message.reply_text("Processing your audio...")
 
-        file_id = voice.file_id
-        audio_data = await AudioHandler.download_audio(context.bot, file_id)
-        result = await AudioHandler.upload_to_supabase(audio_data, user.id, 'voice_message')
+        result = await AudioHandler.stream_to_supabase(context.bot, voice, user.id, 'voice_message')
 
         success_text = (
             f"Audio saved.\n\n"
-            f"File: `{result['file_name']}`\n"
-            f"Size: {len(audio_data)} bytes"
+            f"File: `{result.file_name}`\n"
+            f"Size: {result.file_size} bytes"
         )
 
         keyboard = [[InlineKeyboardButton("Open app", web_app={"url": WEBAPP_URL})]]
@@ -413,17 +747,50 @@ async def handle_voice_message(update: Update, context) -> None:
         await update.message.reply_text("Sorry, there was an error processing your audio.")
 
 
+@metrics.timed_handler
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
 
-    if context.bot_data.get('user_sessions', {}).get(user_id, {}).get('chat_mode', False):
+    session = sessions.get(user_id)
+    if session.chat_mode:
         user_text = update.message.text
         thinking_msg = await update.message.reply_text("thinking...")
 
+        # A thread accepts one run at a time, so a user's questions queue up
+        lock = _chat_locks.setdefault(user_id, asyncio.Lock())
         try:
-            assistant_response = await chat_with_assistant(user_text)
-            await thinking_msg.delete()
-            await update.message.reply_text(assistant_response)
+            shown = ""
+            async with lock:
+                # Re-read under the lock: with the SQLite store each get()
+                # is a copy, and a message just before this one may have
+                # created the thread
+                session = sessions.get(user_id)
+                # Cached answers are context-free: only the first question of
+                # a conversation (no thread yet) may use or fill the cache
+                cacheable = not session.thread_id
+                reply = answer_cache.get(user_text) if cacheable else None
+                if reply is not None:
+                    await seed_thread(session, user_text, reply)
+                else:
+                    reply = ""
+                    last_edit = 0.0
+                    loop = asyncio.get_running_loop()
+                    async for delta in chat_with_assistant(session, user_text):
+                        reply += delta
+                        if loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+                            preview = reply[:TELEGRAM_MESSAGE_LIMIT].strip()
+                            if preview and preview != shown:
+                                await thinking_msg.edit_text(preview)
+                                shown = preview
+                            last_edit = loop.time()
+                    if cacheable:
+                        answer_cache.put(user_text, reply.strip())
+
+            parts = split_message(reply.strip() or "No response received.")
+            if parts[0] != shown:
+                await thinking_msg.edit_text(parts[0])
+            for part in parts[1:]:
+                await update.message.reply_text(part)
 
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton("Ask another question", callback_data="continue_chat")],
@@ -446,6 +813,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 
+@metrics.timed_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -459,28 +827,19 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await query.answer("Guide not configured", show_alert=True)
             return
 
-        if 'user_sessions' not in context.bot_data:
-            context.bot_data['user_sessions'] = {}
-        if user_id not in context.bot_data['user_sessions']:
-            context.bot_data['user_sessions'][user_id] = {}
-        context.bot_data['user_sessions'][user_id]['chat_mode'] = True
+        set_chat_mode(user_id, True)
 
         await query.edit_message_text(
             "Ask me anything about Deep Listening, Pauline Oliveros, or this practice."
         )
 
     elif query.data == "continue_chat":
-        if 'user_sessions' not in context.bot_data:
-            context.bot_data['user_sessions'] = {}
-        if user_id not in context.bot_data['user_sessions']:
-            context.bot_data['user_sessions'][user_id] = {}
-        context.bot_data['user_sessions'][user_id]['chat_mode'] = True
+        set_chat_mode(user_id, True)
 
         await query.edit_message_text("Ask your next question:")
 
     elif query.data == "main_menu":
-        if 'user_sessions' in context.bot_data and user_id in context.bot_data['user_sessions']:
-            context.bot_data['user_sessions'][user_id]['chat_mode'] = False
+        set_chat_mode(user_id, False)
 
         keyboard = [
             [InlineKeyboardButton("Listen", web_app={"url": WEBAPP_URL})],
@@ -497,42 +856,142 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 # ============================================================
-# MAIN
+# INSTRUMENTATION
 # ============================================================
 
-def main():
-    if not BOT_TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN not set!")
-        return
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        logger.error("Supabase credentials not set!")
-        return
+class InstrumentedRequest(HTTPXRequest):
+    # Every Bot API call the bot makes (sendMessage, editMessageText, getFile...)
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = 'file' if '/file/bot' in url else url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        code = 'error'
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            return code, payload
+        finally:
+            metrics.TELEGRAM_SECONDS.observe(time.perf_counter() - started, api_method)
+            metrics.TELEGRAM_RESPONSES.inc(api_method, code)
+
 
-    application = Application.builder().token(BOT_TOKEN).build()
+_metrics_server: Optional[metrics.MetricsServer] = None
+
+
+async def start_instrumentation(application: Application) -> None:
+    global _metrics_server
+    loop_monitor.start()
+    metrics.REGISTRY.gauge(
+        'lsrc_update_queue_size', 'Updates waiting for a worker', fn=application.update_queue.qsize
+    )
+    metrics.REGISTRY.counter(
+        'lsrc_answer_cache_total', 'Guide answer cache hits, fuzzy hits, misses, expiries and evictions',
+        ('outcome',), fn=answer_cache.stats.counts,
+    )
+    if METRICS_PORT:
+        _metrics_server = metrics.MetricsServer(loop_monitor, METRICS_TOKEN, profiler=PROFILER_ENABLED)
+        await _metrics_server.start(METRICS_HOST, METRICS_PORT)
+
+
+async def stop_instrumentation(application: Application) -> None:
+    if _metrics_server is not None:
+        await _metrics_server.stop()
+    await loop_monitor.stop()
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+async def run_webhook(application: Application) -> None:
+    from webhook import WebhookServer
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    await start_instrumentation(application)
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=min(100, UPDATE_WORKERS * 2),
+        )
+    else:
+        logger.warning("WEBHOOK_URL not set — not registering with Telegram (local mode)")
+    await application.start()
+
+    server = WebhookServer(application, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    if not METRICS_PORT:
+        # No separate port: /metrics sits next to the webhook, which is
+        # public, so only behind a token
+        if METRICS_TOKEN:
+            metrics.add_routes(server.app, loop_monitor, METRICS_TOKEN, profiler=PROFILER_ENABLED)
+        else:
+            logger.warning("METRICS_TOKEN not set — /metrics is not served on the webhook port")
+    await server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        await stop_instrumentation(application)
+        await application.shutdown()
+
+
+def build_application() -> Application:
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .concurrent_updates(UPDATE_WORKERS)
+        .post_init(start_instrumentation)
+        .post_shutdown(stop_instrumentation)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("chat", chat_command))
+    application.add_handler(CommandHandler("find", find_command))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_voice_message))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    return application
+
+
+def main():
+    if not BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not set!")
+        return
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        logger.error("Supabase credentials not set (SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)!")
+        return
+    if BOT_MODE == 'webhook' and WEBHOOK_URL and not WEBHOOK_SECRET:
+        # Without it anyone who finds the URL can post forged updates
+        logger.error("WEBHOOK_SECRET must be set when WEBHOOK_URL is set!")
+        return
+
+    application = build_application()
 
     job_queue = application.job_queue
     if job_queue:
-        job_queue.run_daily(send_daily_push, time=time(hour=12, minute=0))
-        logger.info("Scheduled daily push at 12:00 UTC")
+        job_queue.run_repeating(refresh_score_pool, interval=score_pool.refresh_interval, first=0)
+        job_queue.run_repeating(evict_sessions, interval=3600, first=3600)
 
-        job_queue.run_daily(
-            send_weekly_digest,
-            time=time(hour=10, minute=0),
-            days=(0,),
-        )
-        logger.info("Scheduled weekly digest for Mondays at 10:00 UTC")
+        schedule_broadcasts(job_queue)
     else:
         logger.warning("JobQueue not available — scheduled jobs disabled")
 
-    logger.info("LSRC bot starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        logger.info(f"LSRC bot starting in webhook mode ({UPDATE_WORKERS} update workers)...")
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("LSRC bot starting...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,76 @@
+import pytest
+
+from lineage import LineageError, LineageIndex
+
+
+def test_chain_depth_and_sizes():
+    index = LineageIndex.from_pairs([
+        ('a', None), ('b', 'a'), ('c', 'b'), ('d', 'a'),
+    ])
+    assert index.chain('c') == ['a', 'b', 'c']
+    assert [index.depth(s) for s in 'abcd'] == [0, 1, 2, 1]
+    assert index.subtree_size('a') == 4
+    assert index.continuations('a') == 3
+    assert sorted(index.children('a')) == ['b', 'd']
+    assert index.deepest_chain('a') == ['a', 'b', 'c']
+    assert index.most_continued(1) == [('a', 3)]
+
+
+def test_children_before_parents():
+    index = LineageIndex.from_pairs([('c', 'b'), ('b', 'a'), ('a', None)])
+    assert index.chain('c') == ['a', 'b', 'c']
+    assert index.depth('c') == 2
+
+
+def test_missing_parent_is_a_placeholder():
+    index = LineageIndex.from_pairs([('b', 'private'), ('c', 'b')])
+    assert len(index) == 2
+    assert 'private' not in index
+    assert index.root('c') == 'private'
+    assert index.depth('c') == 2
+    assert index.subtree_size('private') == 2
+
+    index.add('private')
+    assert len(index) == 3
+    assert index.subtree_size('private') == 3
+
+
+def test_cycle_is_cut_on_load():
+    index = LineageIndex.from_pairs([('a', 'b'), ('b', 'c'), ('c', 'a'), ('d', 'a')])
+    # One edge of the cycle is dropped; everything hangs off a single root
+    roots = {index.root(s) for s in 'abcd'}
+    assert len(roots) == 1
+    root = roots.pop()
+    assert index.parent(root) is None
+    assert index.depth(root) == 0
+    assert index.subtree_size(root) == 4
+    for s in 'abcd':
+        chain = index.chain(s)
+        assert chain[0] == root and chain[-1] == s
+        assert len(chain) == len(set(chain)) == index.depth(s) + 1
+
+
+def test_self_parent_is_ignored():
+    index = LineageIndex.from_pairs([('a', 'a')])
+    assert index.parent('a') is None
+    assert index.depth('a') == 0
+
+
+def test_add_rejects_cycle():
+    index = LineageIndex.from_pairs([('a', None), ('b', 'a'), ('c', 'b')])
+    with pytest.raises(LineageError):
+        index.add('a', 'c')
+    assert index.chain('c') == ['a', 'b', 'c']
+
+
+def test_add_moves_subtree():
+    index = LineageIndex.from_pairs([('a', None), ('b', None), ('c', 'b'), ('d', 'c')])
+    index.add('b', 'a')
+    assert index.depth('d') == 3
+    assert index.subtree_size('a') == 4
+    assert index.most_continued(2) == [('a', 3), ('b', 2)]
+
+
+def test_unknown_score():
+    with pytest.raises(KeyError):
+        LineageIndex().depth('missing')
@@ -0,0 +1,86 @@
+import numpy as np
+
+from personalize import NO_SCORE, assign_scores, primary_language
+from repository import PushRecipient, Score
+
+
+def make_scores(*specs):
+    # (id, author, language)
+    return [Score(id=i, text=i, author_user_id=a, language=lang) for i, a, lang in specs]
+
+
+def assign(scores, recipients, weights=None, seed=0):
+    if weights is None:
+        weights = np.ones(len(scores))
+    return assign_scores(scores, weights, recipients, rng=np.random.default_rng(seed))
+
+
+def test_primary_language():
+    assert primary_language('pt-br') == 'pt'
+    assert primary_language('EN') == 'en'
+    assert primary_language('zh_Hans') == 'zh'
+    assert primary_language(None) == ''
+
+
+def test_never_assigns_own_score():
+    scores = make_scores(('s1', 'alice', 'en'), ('s2', 'bob', 'en'))
+    recipients = [PushRecipient('alice'), PushRecipient('bob')]
+    for seed in range(20):
+        result = assign(scores, recipients, seed=seed)
+        assert [scores[j].id for j in result] == ['s2', 's1']
+
+
+def test_never_assigns_received_score():
+    scores = make_scores(('s1', None, 'en'), ('s2', None, 'en'), ('s3', None, 'en'))
+    recipients = [PushRecipient('u1', received=('s1', 's3'))]
+    for seed in range(20):
+        assert scores[assign(scores, recipients, seed=seed)[0]].id == 's2'
+
+
+def test_excluded_draws_fall_back_to_exact_scan():
+    # Nearly all weight on the one excluded score: every weighted draw misses
+    scores = make_scores(('s1', None, None), ('s2', None, None))
+    recipients = [PushRecipient('u1', received=('s1',))]
+    result = assign_scores(
+        scores, np.array([1.0, 1e-12]), recipients, rng=np.random.default_rng(0), candidates=2,
+    )
+    assert scores[result[0]].id == 's2'
+
+
+def test_no_eligible_candidate():
+    scores = make_scores(('s1', 'u1', 'en'), ('s2', None, 'en'))
+    recipients = [PushRecipient('u1', received=('s2',)), PushRecipient('u2')]
+    result = assign(scores, recipients)
+    assert result[0] == NO_SCORE
+    assert result[1] != NO_SCORE
+
+
+def test_unknown_received_ids_are_ignored():
+    scores = make_scores(('s1', None, 'en'))
+    recipients = [PushRecipient('u1', received=('deleted',))]
+    assert assign(scores, recipients)[0] == 0
+
+
+def test_prefers_own_language_then_falls_back():
+    scores = make_scores(('en1', None, 'en'), ('ru1', None, 'ru'), ('ru2', None, 'ru'))
+    recipients = [
+        PushRecipient('ru_user', language_code='ru'),
+        PushRecipient('de_user', language_code='de'),
+        PushRecipient('ru_done', language_code='ru-RU', received=('ru1', 'ru2')),
+    ]
+    for seed in range(20):
+        result = assign(scores, recipients, seed=seed)
+        assert scores[result[0]].id in ('ru1', 'ru2')
+        assert result[1] != NO_SCORE
+        assert scores[result[2]].id == 'en1'
+
+
+def test_empty_inputs():
+    assert assign([], [PushRecipient('u1')]).tolist() == [NO_SCORE]
+    assert assign(make_scores(('s1', None, None)), []).size == 0
+
+
+def test_zero_weights_still_assign():
+    scores = make_scores(('s1', None, None), ('s2', None, None))
+    result = assign_scores(scores, np.zeros(2), [PushRecipient('u1')], rng=np.random.default_rng(0))
+    assert result[0] in (0, 1)
@@ -0,0 +1,214 @@
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import scheduling
+from broadcast import BroadcastMessage
+from repository import SUBSCRIBER_SHARDS, BroadcastCheckpoint
+from scheduling import Slot, plan_slots, run_checkpointed
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+# ---------- slots ----------
+
+def test_plan_slots_cover_all_shards():
+    slots = plan_slots('daily_push', 5, time(9), 12)
+    assert slots[0].shards[0] == 0
+    assert slots[-1].shards[1] == SUBSCRIBER_SHARDS
+    assert all(a.shards[1] == b.shards[0] for a, b in zip(slots, slots[1:]))
+    assert [s.at for s in slots][:2] == [time(9, tzinfo=timezone.utc), time(11, 24, tzinfo=timezone.utc)]
+
+
+def test_window_crossing_midnight():
+    slots = plan_slots('daily_push', 4, time(22), 4)
+    assert [s.day_shift for s in slots] == [0, 0, 1, 1]
+    assert slots[2].at == time(0, tzinfo=timezone.utc)
+
+    # Every slot of the window maps to the day the window started
+    now = utc(2024, 1, 2, 1, 30)
+    assert {s.window_start(now) for s in slots} == {utc(2024, 1, 1, 22)}
+    assert {s.daily_run_key(now) for s in slots} == {'2024-01-01'}
+
+
+def test_window_start_slack():
+    slot = plan_slots('daily_push', 4, time(22), 4)[2]    # 00:00
+    # Fired a little early: still this window, not yesterday's
+    assert slot.window_start(utc(2024, 1, 1, 23, 57)) == utc(2024, 1, 1, 22)
+    # Well before its time: the previous window
+    assert slot.window_start(utc(2024, 1, 1, 23, 0)) == utc(2023, 12, 31, 22)
+
+
+def test_weekly_run_key_year_boundary():
+    slot = plan_slots('weekly_digest', 1, time(10), 1)[0]
+    assert slot.weekly_run_key(utc(2020, 12, 31, 12)) == '2020-W53'
+    assert slot.weekly_run_key(utc(2021, 1, 3, 12)) == '2020-W53'
+    assert slot.weekly_run_key(utc(2021, 1, 4, 12)) == '2021-W01'
+
+
+def test_weekly_run_key_follows_window_start():
+    # Window opens Sunday 2021-01-03 22:00; the slot after midnight is
+    # already Monday of 2021-W01 but belongs to the 2020-W53 run
+    slot = plan_slots('weekly_digest', 2, time(22), 4)[1]
+    assert slot.day_shift == 1
+    assert slot.weekly_run_key(utc(2021, 1, 4, 0, 30)) == '2020-W53'
+
+
+def test_parse_time():
+    assert scheduling.parse_time('09:30') == time(9, 30)
+    assert scheduling.parse_time('7') == time(7)
+
+
+# ---------- checkpointed runs ----------
+
+class FakeRepo:
+    """broadcast_checkpoints with the lease rules of claim/save_broadcast_checkpoint."""
+
+    def __init__(self, fail_saves_after=None):
+        self.rows = {}
+        self.saves = []
+        self.fail_saves_after = fail_saves_after
+
+    async def claim_broadcast_slot(self, job, run_key, slot, owner, lease_seconds):
+        row = self.rows.setdefault((job, run_key, slot), {
+            'last_user_id': None, 'sent': 0, 'completed_at': None, 'owner': None, 'lease_until': None,
+        })
+        now = datetime.now(timezone.utc)
+        free = row['lease_until'] is None or row['lease_until'] < now
+        claimed = not row['completed_at'] and (free or row['owner'] == owner)
+        if claimed:
+            row['owner'] = owner
+            row['lease_until'] = now + timedelta(seconds=lease_seconds)
+        return BroadcastCheckpoint(
+            row['last_user_id'], row['sent'], row['completed_at'] is not None, claimed, row['lease_until'],
+        )
+
+    async def save_broadcast_checkpoint(self, job, run_key, slot, owner, last_user_id, sent,
+                                        completed=False, lease_seconds=300):
+        self.saves.append((last_user_id, sent, completed))
+        if self.fail_saves_after is not None and len(self.saves) > self.fail_saves_after:
+            self.rows[(job, run_key, slot)]['owner'] = 'someone else'
+        row = self.rows[(job, run_key, slot)]
+        if row['completed_at'] or row['owner'] != owner:
+            return False
+        row['last_user_id'] = last_user_id or row['last_user_id']
+        row['sent'] = sent
+        if completed:
+            row['completed_at'] = datetime.now(timezone.utc)
+            row['lease_until'] = None
+        else:
+            row['lease_until'] = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+        return True
+
+
+class FakeBroadcaster:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.cancelled = False
+
+    async def run(self, messages, name='broadcast', on_sent=None):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        for m in messages:
+            self.sent.append(m.chat_id)
+            if on_sent is not None:
+                on_sent(m)
+        return SimpleNamespace(sent=len(messages))
+
+
+USERS = ['u1', 'u2', 'u3', 'u4', 'u5']
+SLOT = Slot('daily_push', 0, 1, time(9), timedelta())
+
+
+def chunks_of(size):
+    async def chunks(after):
+        remaining = [u for u in USERS if after is None or u > after]
+        for i in range(0, len(remaining), size):
+            # u3 gets nothing today
+            yield [(u, None if u == 'u3' else BroadcastMessage(chat_id=u, text=u))
+                   for u in remaining[i:i + size]]
+    return chunks
+
+
+def run(repo, broadcaster, **kwargs):
+    return asyncio.run(run_checkpointed(repo, broadcaster, SLOT, 'k', chunks_of(2), **kwargs))
+
+
+def test_sends_everything_once_and_completes():
+    repo, broadcaster = FakeRepo(), FakeBroadcaster()
+    assert run(repo, broadcaster) == 4
+    assert broadcaster.sent == ['u1', 'u2', 'u4', 'u5']
+    assert repo.saves[-1] == ('u5', 4, True)
+
+    # A completed slot is not sent again
+    assert run(repo, FakeBroadcaster()) is None
+
+
+def test_resumes_after_checkpoint():
+    repo = FakeRepo()
+    repo.rows[('daily_push', 'k', 0)] = {
+        'last_user_id': 'u2', 'sent': 2, 'completed_at': None, 'owner': None, 'lease_until': None,
+    }
+    broadcaster = FakeBroadcaster()
+    assert run(repo, broadcaster) == 4
+    assert broadcaster.sent == ['u4', 'u5']
+
+
+def test_leased_slot_is_skipped():
+    repo = FakeRepo()
+    until = datetime.now(timezone.utc) + timedelta(minutes=1)
+    repo.rows[('daily_push', 'k', 0)] = {
+        'last_user_id': None, 'sent': 0, 'completed_at': None, 'owner': 'other', 'lease_until': until,
+    }
+    busy, broadcaster = [], FakeBroadcaster()
+    assert run(repo, broadcaster, on_busy=busy.append) is None
+    assert busy == [until]
+    assert broadcaster.sent == []
+
+
+def test_stops_when_lease_lost_between_chunks():
+    repo, broadcaster = FakeRepo(fail_saves_after=1), FakeBroadcaster()
+    assert run(repo, broadcaster) == 3
+    assert broadcaster.sent == ['u1', 'u2', 'u4']
+    assert all(not completed for _, _, completed in repo.saves)
+
+
+def test_final_save_checks_lease():
+    repo = FakeRepo(fail_saves_after=3)
+    assert run(repo, FakeBroadcaster()) == 4
+    assert repo.saves[-1] == ('u5', 4, True)
+    assert repo.rows[('daily_push', 'k', 0)]['completed_at'] is None
+
+
+def test_lease_renewed_during_slow_chunk(monkeypatch):
+    monkeypatch.setattr(scheduling, 'RENEW_SECONDS', 0.01)
+    repo, broadcaster = FakeRepo(), FakeBroadcaster(delay=0.05)
+    assert run(repo, broadcaster) == 4
+    # Renewals re-save the previous checkpoint, never a half-sent chunk
+    checkpoints = [('u2', 2, False), ('u4', 3, False), ('u5', 4, False), ('u5', 4, True)]
+    renewals = [s for s in repo.saves if s not in checkpoints]
+    assert renewals
+    assert set(renewals) <= {(None, 0, False), ('u2', 2, False), ('u4', 3, False)}
+
+
+def test_chunk_cancelled_when_renewal_fails(monkeypatch):
+    monkeypatch.setattr(scheduling, 'RENEW_SECONDS', 0.01)
+    recorded = []
+
+    async def after_chunk():
+        recorded.append(True)
+
+    repo, broadcaster = FakeRepo(fail_saves_after=0), FakeBroadcaster(delay=1.0)
+    assert run(repo, broadcaster, after_chunk=after_chunk) == 0
+    assert broadcaster.cancelled
+    assert broadcaster.sent == []
+    # Whatever was delivered before the cancel still gets recorded
+    assert recorded == [True]
@@ -0,0 +1,68 @@
+"""
+LSRC bot webhook front end
+aiohttp server that receives Telegram updates, checks the secret token and
+hands them to the python-telegram-bot Application, which processes them
+with its own pool of concurrent update workers.
+
+Local test: run the bot with BOT_MODE=webhook (no WEBHOOK_URL) and POST a
+recorded update:
+    curl -X POST localhost:8443/telegram \
+         -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>' \
+         -H 'Content-Type: application/json' -d @update.json
+"""
+
+import hmac
+import json
+import logging
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    def __init__(self, application, path: str = '/telegram', secret_token: Optional[str] = None):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.app = web.Application(client_max_size=1024 * 1024)
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get('/healthz', self.handle_health)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, '')
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=403)
+
+        try:
+            data = await request.json(loads=json.loads)
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Rejected malformed update: {e}")
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+
+        # Acknowledge right away; update workers pick it up from the queue
+        await self.application.update_queue.put(update)
+        return web.Response(status=200)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'ok': True, 'queued': self.application.update_queue.qsize()})
+
+    async def start(self, host: str, port: int) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None